@@ -1,22 +1,42 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException
-from typing import Optional, List
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Query, Response
+from typing import Optional, Dict, List, AsyncIterator, Tuple
 from datetime import datetime
-from sqlmodel import Session, select, desc
-from app.models import get_session, ContentItem, ContentStatus
+from sqlmodel import Session, select, desc, update
+from sqlalchemy import tuple_
+from pydantic import BaseModel
+from app.models import get_session, BulkAction, BulkJob, ContentItem, ContentStatus
 import aiofiles
 import os
 import uuid
-import hashlib
+import base64
+import json
+import time
 
-from app.services.storage import get_storage
+from app.database import db_writer, db_reader
+from app.services.storage import get_storage, is_blob_path, StoredBlob
+from app.services.job_queue import job_queue
+from app.services.leases import leases
+from app.services.blobs import acquire_blob, is_referenced, register_blob, release_blob
+from app.services.bulk_jobs import bulk_jobs, job_view, select_item_ids, submit_job
+from app.services.ingest import ArchiveLimitError, create_content_items, store_members
+from app.services.llm_cache import llm_cache
+from app.services.metadata_filters import metadata_conditions, parse_metadata_filters
+from app.services.metrics import observe_upload
+from app.services.search import search_items, semantic_search, remove_item as remove_from_search_index
+from app.services.embeddings import embedding_service
+from app.services.vector_index import vector_index
 
 router = APIRouter()
 
 # Initialize storage
 storage = get_storage()
 
-def calculate_checksum(content: bytes) -> str:
-    return hashlib.sha256(content).hexdigest()
+# Size of the reads used to stream uploads to storage
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+async def iter_upload(file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while chunk := await file.read(chunk_size):
+        yield chunk
 
 def get_next_version(session: Session, filename: str) -> int:
     statement = select(ContentItem).where(ContentItem.original_filename == filename).order_by(desc(ContentItem.version))
@@ -25,11 +45,151 @@ def get_next_version(session: Session, filename: str) -> int:
         return latest_item.version + 1
     return 1
 
+def supersede_versions(session: Session, filename: str):
+    """Clears `is_latest` on existing versions of a file before a new version is added."""
+    session.exec(
+        update(ContentItem)
+        .where(ContentItem.original_filename == filename)
+        .where(ContentItem.is_latest == True)
+        .values(is_latest=False)
+    )
+
+def promote_latest_version(session: Session, filename: str):
+    """Marks the highest remaining version of a file as latest, e.g. after the latest was deleted."""
+    newest = select(ContentItem.id).where(ContentItem.original_filename == filename).order_by(desc(ContentItem.version)).limit(1)
+    session.exec(update(ContentItem).where(ContentItem.id == newest.scalar_subquery()).values(is_latest=True))
+
+def create_content_item(
+    session: Session,
+    stored: StoredBlob,
+    filename: str,
+    metadata: str,
+    content_type: Optional[str],
+) -> ContentItem:
+    """
+    Registers a stored blob as a new version of `filename`, as one write
+    transaction (run it through `db_writer`). If identical content is
+    already stored, the item points at that blob instead of `stored`.
+    """
+    storage_path = acquire_blob(session, stored.checksum)
+    if storage_path is None:
+        storage_path = register_blob(session, stored.checksum, stored.storage_path, stored.size)
+    
+    version = get_next_version(session, filename)
+    supersede_versions(session, filename)
+    
+    content_item = ContentItem(
+        original_filename=filename,
+        storage_path=storage_path,
+        status=ContentStatus.UNPROCESSED,
+        metadata_json=metadata,
+        version=version,
+        content_type=content_type,
+        checksum=stored.checksum
+    )
+    session.add(content_item)
+    session.commit()
+    session.refresh(content_item)
+    return content_item
+
+def encode_cursor(created_at: datetime, item_id: uuid.UUID) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{item_id.hex}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    try:
+        created_at, item_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), uuid.UUID(item_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("/upload/params")
 async def get_upload_params(filename: str):
     params = await storage.get_upload_params(filename)
     return params
 
+class MultipartPart(BaseModel):
+    PartNumber: int
+    ETag: str
+
+class MultipartSignRequest(BaseModel):
+    storage_path: str
+    upload_id: str
+    part_numbers: List[int]
+
+class MultipartCompleteRequest(BaseModel):
+    storage_path: str
+    upload_id: str
+    parts: List[MultipartPart]
+
+class MultipartAbortRequest(BaseModel):
+    storage_path: str
+    upload_id: str
+
+class BulkJobRequest(BaseModel):
+    action: BulkAction
+    # Items to act on: these ids, narrowed by any filters given
+    ids: Optional[List[uuid.UUID]] = None
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+    status: Optional[ContentStatus] = None
+    before: Optional[datetime] = None
+    after: Optional[datetime] = None
+    # LLM metadata filters, as for GET /items
+    sentiment: Optional[str] = None
+    tags: Optional[List[str]] = None
+    metadata: Optional[Dict[str, str]] = None
+
+MULTIPART_UNSUPPORTED = "Multipart uploads are only available with S3 storage"
+
+@router.post("/upload/multipart/initiate")
+async def initiate_multipart_upload(filename: str = Form(...), content_type: Optional[str] = Form(None)):
+    try:
+        return await storage.initiate_multipart_upload(filename, content_type)
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail=MULTIPART_UNSUPPORTED)
+
+@router.post("/upload/multipart/sign")
+async def sign_multipart_parts(request: MultipartSignRequest):
+    if len(request.part_numbers) > 1000:
+        raise HTTPException(status_code=400, detail="Sign at most 1000 parts per request")
+    try:
+        urls = await storage.sign_upload_parts(request.storage_path, request.upload_id, request.part_numbers)
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail=MULTIPART_UNSUPPORTED)
+    return {"urls": urls}
+
+@router.get("/upload/multipart/parts")
+async def list_multipart_parts(storage_path: str, upload_id: str):
+    """Parts already received, so an interrupted upload can resume where it left off."""
+    try:
+        return {"parts": await storage.list_uploaded_parts(storage_path, upload_id)}
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail=MULTIPART_UNSUPPORTED)
+
+@router.post("/upload/multipart/complete")
+async def complete_multipart_upload(request: MultipartCompleteRequest):
+    parts = [part.model_dump() for part in request.parts]
+    try:
+        etag = await storage.complete_multipart_upload(request.storage_path, request.upload_id, parts)
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail=MULTIPART_UNSUPPORTED)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"storage_path": request.storage_path, "etag": etag}
+
+@router.post("/upload/multipart/abort")
+async def abort_multipart_upload(request: MultipartAbortRequest):
+    try:
+        await storage.abort_multipart_upload(request.storage_path, request.upload_id)
+    except NotImplementedError:
+        raise HTTPException(status_code=400, detail=MULTIPART_UNSUPPORTED)
+    return {"ok": True}
+
+async def discard_upload(session: Session, storage_path: str):
+    """Deletes a client's upload that won't be used, unless something in the database points at the path."""
+    if not await db_reader.run(is_referenced, session, storage_path):
+        await storage.adelete(storage_path)
+
 @router.post("/upload/finalize")
 async def finalize_upload(
     original_filename: str = Form(...),
@@ -39,22 +199,29 @@ async def finalize_upload(
     checksum: Optional[str] = Form(None),
     session: Session = Depends(get_session)
 ):
-    # Determine next version
-    version = get_next_version(session, original_filename)
+    start = time.perf_counter()
+    # The path comes from the client: only accept one this backend could have issued
+    if not is_blob_path(storage_path):
+        raise HTTPException(status_code=400, detail="Invalid storage path")
+    # Hash the uploaded object ourselves rather than trusting the client's checksum
+    try:
+        stored = await storage.compute_checksum(storage_path)
+    except Exception:
+        raise HTTPException(status_code=404, detail="Uploaded file not found in storage")
+    if checksum and checksum != stored.checksum:
+        await discard_upload(session, storage_path)
+        raise HTTPException(status_code=400, detail="Checksum mismatch: upload was corrupted")
     
-    # Create DB record after direct S3 upload or local fallback
-    content_item = ContentItem(
-        original_filename=original_filename,
-        storage_path=storage_path,
-        status=ContentStatus.UNPROCESSED,
-        metadata_json=metadata,
-        version=version,
-        content_type=content_type,
-        checksum=checksum
+    content_item = await db_writer.run(
+        create_content_item, session, stored, original_filename, metadata, content_type
     )
-    session.add(content_item)
-    session.commit()
-    session.refresh(content_item)
+    if content_item.storage_path != storage_path:
+        # The client already uploaded the bytes, but we had them: keep the existing blob instead
+        await discard_upload(session, storage_path)
+    
+    # Hand the item straight to the worker
+    job_queue.enqueue(content_item.id)
+    observe_upload("finalize", stored.size, start)
     
     return content_item
 
@@ -64,69 +231,192 @@ async def upload_content(
     metadata: str = Form("{}"),
     session: Session = Depends(get_session)
 ):
-    content = await file.read()
-    checksum = calculate_checksum(content)
+    start = time.perf_counter()
+    # Stream the upload to storage in chunks, hashing as we go, so large files never sit in memory
+    stored = await storage.save_stream(iter_upload(file), file.filename)
     
-    # Optional: Check if file with same checksum already exists
-    statement = select(ContentItem).where(ContentItem.checksum == checksum)
-    existing_item = session.exec(statement).first()
-    if existing_item:
-        # If identical file exists, we could either return it or create a new version pointing to same path
-        # For now, let's create a new version but reuse the same storage_path (optional/TBD)
-        # To keep it simple and follow the plan's "Immutable Blobs" rule, we'll save it again for now
-        pass
-        
-    storage_path = await storage.save(content, file.filename)
-    version = get_next_version(session, file.filename)
-        
-    # Create DB record (legacy/fallback support)
-    content_item = ContentItem(
-        original_filename=file.filename,
-        storage_path=storage_path,
-        status=ContentStatus.UNPROCESSED,
-        metadata_json=metadata,
-        version=version,
-        content_type=file.content_type,
-        checksum=checksum
+    content_item = await db_writer.run(
+        create_content_item, session, stored, file.filename, metadata, file.content_type
     )
-    session.add(content_item)
-    session.commit()
-    session.refresh(content_item)
+    if content_item.storage_path != stored.storage_path:
+        # Identical content is stored once: drop the copy we just wrote
+        await storage.adelete(stored.storage_path)
+    
+    # Hand the item straight to the worker
+    job_queue.enqueue(content_item.id)
+    observe_upload("upload", stored.size, start)
     
     return content_item
 
+@router.post("/ingest/archive")
+async def ingest_archive(
+    file: UploadFile = File(...),
+    metadata: str = Form("{}"),
+    session: Session = Depends(get_session)
+):
+    """
+    Imports every file in a zip or tar(.gz/.bz2/.xz) archive as its own item,
+    named by its path inside the archive. Members are read one at a time and
+    stored in parallel, then all items are created in one transaction and
+    queued for tagging. `metadata` applies to every item.
+    """
+    start = time.perf_counter()
+    try:
+        extra = json.loads(metadata)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+    if not isinstance(extra, dict):
+        raise HTTPException(status_code=400, detail="metadata must be a JSON object")
+
+    try:
+        members, skipped = await store_members(storage, file.file)
+    except ArchiveLimitError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    items, duplicates = await db_writer.run(
+        create_content_items, session, members, {"source_archive": file.filename, **extra}
+    )
+    # Members whose content was already stored point at the existing blob
+    await storage.adelete_many(duplicates)
+
+    for item in items:
+        job_queue.enqueue(item.id)
+    # The archive as received, not its unpacked contents
+    observe_upload("archive", file.size or 0, start)
+
+    return {"created": len(items), "skipped": skipped}
+
 @router.get("/items")
 def read_items(
+    response: Response,
     filename: Optional[str] = None,
     content_type: Optional[str] = None,
+    status: Optional[ContentStatus] = None,
     after: Optional[datetime] = None,
+    sentiment: Optional[str] = None,
+    tags: Optional[str] = None,
+    metadata: Optional[List[str]] = Query(None),
     show_all_versions: bool = False,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None,
     session: Session = Depends(get_session)
 ):
-    statement = select(ContentItem)
+    """
+    Lists items newest first, one page at a time. When more items remain,
+    the `X-Next-Cursor` response header holds the `cursor` for the next page.
+    `fields` is an optional comma-separated list of columns to return.
+    `status=failed` lists the items tagging gave up on, with their `last_error`.
+    `sentiment`, `tags` (comma-separated, all must match) and repeatable
+    `metadata=key:value` filter on the LLM metadata, in SQL.
+    """
+    try:
+        metadata_filter = metadata_conditions(parse_metadata_filters(metadata), sentiment, tags.split(",") if tags else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in ContentItem.model_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        # id and created_at are always included: they make up the cursor
+        columns = ["id", "created_at"] + [field for field in requested if field not in ("id", "created_at")]
+        statement = select(*(getattr(ContentItem, column) for column in columns))
+    else:
+        statement = select(ContentItem)
     
     if filename:
         statement = statement.where(ContentItem.original_filename == filename)
     if content_type:
         statement = statement.where(ContentItem.content_type == content_type)
+    if status:
+        statement = statement.where(ContentItem.status == status)
+    else:
+        # Items marked by a bulk delete are on their way out
+        statement = statement.where(ContentItem.status != ContentStatus.DELETING)
     if after:
         statement = statement.where(ContentItem.created_at >= after)
-        
+    for condition in metadata_filter:
+        statement = statement.where(condition)
     if not show_all_versions:
-        # Show only the latest version of each filename using a correlated subquery
-        from sqlalchemy.orm import aliased
-        from sqlmodel import func
-        
-        c2 = aliased(ContentItem)
-        subquery = (
-            select(1)
-            .where(c2.original_filename == ContentItem.original_filename)
-            .where(c2.version > ContentItem.version)
+        # Only the latest version of each filename; served by ix_contentitem_latest_listing
+        statement = statement.where(ContentItem.is_latest == True)
+    if cursor:
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        statement = statement.where(
+            tuple_(ContentItem.created_at, ContentItem.id) < tuple_(cursor_created_at, cursor_id)
         )
-        statement = statement.where(~subquery.exists())
     
-    items = session.exec(statement).all()
-    return items
+    # Fetch one extra row to learn whether another page exists
+    statement = statement.order_by(desc(ContentItem.created_at), desc(ContentItem.id)).limit(limit + 1)
+    rows = session.exec(statement).all()
+    
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    
+    if fields:
+        return [dict(zip(columns, row)) for row in rows]
+    return rows
+
+def remove_content_item(session: Session, item: ContentItem) -> Optional[str]:
+    """
+    Deletes an item as one write transaction (run it through `db_writer`).
+    Returns the blob path to remove from storage if this was its last reference.
+    """
+    # Drop the blob reference and the row together; the physical blob goes only with its last reference
+    orphaned_path = release_blob(session, item)
+    remove_from_search_index(session, item.id)
+    session.delete(item)
+    if item.is_latest:
+        session.flush()
+        promote_latest_version(session, item.original_filename)
+    session.commit()
+    return orphaned_path
+
+@router.get("/search")
+async def search(
+    q: Optional[str] = None,
+    tags: Optional[str] = None,
+    semantic: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    show_all_versions: bool = False,
+    session: Session = Depends(get_session)
+):
+    """
+    Ranked full-text search over filenames and LLM metadata. The last word of
+    `q` also matches as a prefix; `tags` (comma-separated) restricts results to
+    items carrying all of them. With `semantic`, results are ranked by
+    embedding similarity to that text instead, and `q` only filters them.
+    Returns the matching items and tag facets.
+    """
+    tag_list = [tag for tag in tags.split(",")] if tags else []
+    if semantic:
+        if not embedding_service.enabled:
+            raise HTTPException(status_code=400, detail="Semantic search is disabled (EMBEDDING_MODEL is empty)")
+        vector = await embedding_service.embed_query(semantic)
+        return await db_reader.run(semantic_search, session, vector, q, tag_list, limit, offset, show_all_versions)
+    return await db_reader.run(search_items, session, q, tag_list, limit, offset, show_all_versions)
+
+@router.get("/similar/{item_id}")
+def similar_items(
+    item_id: uuid.UUID,
+    limit: int = Query(10, ge=1, le=100),
+    show_all_versions: bool = False,
+    session: Session = Depends(get_session)
+):
+    """Items whose embeddings are nearest to this item's, most similar first."""
+    if not session.get(ContentItem, item_id):
+        raise HTTPException(status_code=404, detail="Item not found")
+    vector = vector_index.get(item_id)
+    if vector is None:
+        raise HTTPException(status_code=409, detail="Item has not been indexed yet")
+    return semantic_search(session, vector, limit=limit, show_all_versions=show_all_versions, exclude=item_id)
 
 @router.delete("/items/{item_id}")
 def delete_item(item_id: uuid.UUID, session: Session = Depends(get_session)):
@@ -134,11 +424,67 @@ def delete_item(item_id: uuid.UUID, session: Session = Depends(get_session)):
     if not item:
         raise HTTPException(status_code=404, detail="Item not found")
     
-    # Delete from storage
-    storage.delete(item.storage_path)
+    orphaned_path = db_writer.run_blocking(remove_content_item, session, item)
+    vector_index.remove(item_id)
     
-    # Delete from DB
-    session.delete(item)
-    session.commit()
+    if orphaned_path:
+        storage.delete(orphaned_path)
     
     return {"ok": True}
+
+@router.post("/items/{item_id}/requeue")
+def requeue_item(item_id: uuid.UUID, session: Session = Depends(get_session)):
+    """Retries a FAILED item (or one waiting out its backoff) now, with a fresh attempt budget."""
+    if not session.get(ContentItem, item_id):
+        raise HTTPException(status_code=404, detail="Item not found")
+    if not db_writer.run_blocking(leases.requeue, session, item_id):
+        raise HTTPException(status_code=409, detail="Item is not waiting to be tagged")
+    job_queue.enqueue(item_id)
+    session.expire_all()
+    return session.get(ContentItem, item_id)
+
+@router.post("/jobs", status_code=202)
+async def create_bulk_job(request: BulkJobRequest, session: Session = Depends(get_session)):
+    """
+    Starts a bulk delete, requeue or retag over the selected items, or a
+    storage `sweep`, as a background job run by the workers; poll it with
+    `GET /jobs/{id}`. Filters match every version of a file. Items to delete
+    are marked (hidden from listings and search) before this returns.
+    """
+    if request.action == BulkAction.SWEEP:
+        item_ids = []
+    else:
+        selection = request.model_dump(exclude={"action"}, exclude_none=True)
+        # An empty filter would otherwise be skipped, and select the whole library
+        empty = sorted(
+            key for key, value in selection.items()
+            if not value or (key == "tags" and not any(tag.strip() for tag in value))
+        )
+        if empty:
+            raise HTTPException(status_code=400, detail=f"Empty filters: {', '.join(empty)}")
+        if not selection:
+            raise HTTPException(status_code=400, detail="Select items with ids or at least one filter")
+        try:
+            item_ids = await db_reader.run(select_item_ids, session, **selection)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    job = await db_writer.run(submit_job, session, request.action, item_ids)
+    bulk_jobs.wake()
+    return job_view(job)
+
+@router.get("/jobs")
+def read_bulk_jobs(limit: int = Query(50, ge=1, le=500), session: Session = Depends(get_session)):
+    """Most recent jobs first."""
+    jobs = session.exec(select(BulkJob).order_by(desc(BulkJob.created_at)).limit(limit)).all()
+    return [job_view(job) for job in jobs]
+
+@router.get("/jobs/{job_id}")
+def read_bulk_job(job_id: uuid.UUID, session: Session = Depends(get_session)):
+    job = session.get(BulkJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(job)
+
+@router.get("/cache/stats")
+def read_cache_stats(session: Session = Depends(get_session)):
+    return llm_cache.stats(session)
@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable
+from sqlalchemy import event
+from sqlmodel import create_engine
+
+# Robust path handling
+BASE_DIR = Path(__file__).resolve().parent.parent # points to backend/
+DATA_DIR = BASE_DIR.parent / "data" # points to zibaldone/data
+DATA_DIR.mkdir(exist_ok=True) # Ensure data dir exists
+
+sqlite_file_name = DATA_DIR / "database.db"
+sqlite_url = f"sqlite:///{sqlite_file_name}"
+
+# Connection tuning, overridable from the environment
+SQLITE_PRAGMAS = {
+    # WAL lets readers proceed while a write is in progress
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    # Durable at checkpoints, and far fewer fsyncs than FULL under WAL
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negative values are KiB rather than pages
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", str(64 * 1024))),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+
+def apply_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def create_sqlite_engine(url: str = sqlite_url):
+    """Creates a pooled engine whose connections all get the tuning pragmas."""
+    engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False},
+        pool_size=int(os.getenv("DB_POOL_SIZE", "8")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "8")),
+    )
+    event.listen(engine, "connect", apply_pragmas)
+    return engine
+
+engine = create_sqlite_engine()
+
+class DatabaseExecutor:
+    """
+    Runs blocking session work on dedicated threads so SQLite round-trips
+    never stall the event loop (and with it SSE and every other request).
+    """
+    def __init__(self, max_workers: int, name: str):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def run_blocking(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """For synchronous callers (e.g. sync routes running in the threadpool)."""
+        return self._executor.submit(fn, *args, **kwargs).result()
+
+# Every write transaction goes through one dedicated thread. SQLite only
+# allows a single writer anyway; serializing writes here means they never
+# contend for the lock ("database is locked"), while WAL keeps readers on
+# other connections from ever waiting on them. Submit the whole unit of work
+# (reads it depends on, writes, commit) as one function, so the write lock is
+# never taken outside the writer thread.
+db_writer = DatabaseExecutor(1, "db-writer")
+
+# Reads from async code, sized to the connection pool
+db_reader = DatabaseExecutor(int(os.getenv("DB_POOL_SIZE", "8")), "db-reader")
@@ -5,6 +5,7 @@ from contextlib import asynccontextmanager
 from app.models import create_db_and_tables
 from app.workers import process_unprocessed_items
 import asyncio
+import os
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -35,10 +36,22 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             print(f"Warning: Failed to configure S3 CORS: {e}")
 
-    # Start the background worker
-    asyncio.create_task(process_unprocessed_items())
+    # Start the background worker, unless workers run as separate processes
+    # (`python -m app.workers`)
+    if os.getenv("RUN_WORKER", "true").lower() in ("1", "true", "yes"):
+        asyncio.create_task(process_unprocessed_items())
+    else:
+        from app.services.job_queue import job_queue
+        job_queue.accepting = False
+    # Work claimed by other processes (standalone workers, or the other
+    # `uvicorn --workers` processes) reaches our SSE clients through the event log
+    from app.services.event_broadcaster import broadcaster
+    asyncio.create_task(broadcaster.relay())
     yield
 
+    from app.services.executors import executors
+    executors.shutdown()
+
 app = FastAPI(title="Zibaldone", lifespan=lifespan)
 
 # CORS - Allow all for local development convenience
@@ -48,6 +61,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 app.include_router(api_router, prefix="/api")
@@ -56,20 +70,37 @@ app.include_router(api_router, prefix="/api")
 def read_root():
     return {"message": "Welcome to Zibaldone"}
 
+from fastapi import Header
 from fastapi.responses import StreamingResponse
+from typing import Optional
 from app.services.event_broadcaster import broadcaster
-import json
 
 @app.get("/api/events")
-async def sse_endpoint():
+async def sse_endpoint(last_event_id: Optional[str] = Header(None)):
+    """
+    Server-sent events. Every event has an id; browsers send the last one
+    back as `Last-Event-ID` when they reconnect and get what they missed.
+    """
     async def event_generator():
-        queue = await broadcaster.subscribe()
+        subscriber = await broadcaster.subscribe(last_event_id)
         try:
+            # Reconnect after 3 s if the connection drops
+            yield "retry: 3000\n\n"
             while True:
-                data = await queue.get()
-                yield f"data: {data}\n\n"
-        except asyncio.CancelledError:
-            broadcaster.unsubscribe(queue)
+                yield await broadcaster.next_frame(subscriber)
+        finally:
+            broadcaster.unsubscribe(subscriber)
             
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
+from fastapi import Depends, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from sqlmodel import Session
+from app.models import get_session
+from app.services.metrics import refresh_item_metrics
+
+@app.get("/metrics")
+def metrics_endpoint(session: Session = Depends(get_session)):
+    """Prometheus metrics for this process, plus item counts shared by all of them."""
+    refresh_item_metrics(session)
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
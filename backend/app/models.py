@@ -1,41 +1,180 @@
-from typing import Optional
-from sqlmodel import Field, SQLModel, create_engine, Session
+from typing import Optional, Set
+from sqlalchemy import Column, Computed, Index, String, inspect, text
+from sqlalchemy.schema import CreateColumn
+from sqlmodel import Field, SQLModel, Session
 from datetime import datetime
 import uuid
 from enum import Enum
 
 class ContentStatus(str, Enum):
     UNPROCESSED = "unprocessed"
+    PROCESSING = "processing" # Claimed by a worker; see lease_owner / lease_expires_at
     TAGGED = "tagged"
     INDEXED = "indexed"
+    FAILED = "failed" # Gave up on tagging; see attempts / last_error. Requeue via the API
+    DELETING = "deleting" # Selected by a bulk delete job; hidden from listings until the job removes it
+
+def metadata_field(key: str) -> str:
+    """
+    SQL reading one top-level key of `metadata_json`, lower-cased. NULL when
+    the key is missing or the metadata isn't valid JSON (json_extract would
+    raise and fail the whole statement).
+    """
+    return f"CASE WHEN json_valid(metadata_json) THEN lower(json_extract(metadata_json, '$.{key}')) END"
 
 class ContentItem(SQLModel, table=True):
+    __table_args__ = (
+        # Serves the default listing (latest versions, newest first) straight from the index
+        Index("ix_contentitem_latest_listing", "is_latest", "created_at", "id"),
+        # Serves workers looking for unclaimed items and expired leases
+        Index("ix_contentitem_claim", "status", "lease_expires_at"),
+        # Serves listings filtered by sentiment, newest first
+        Index("ix_contentitem_sentiment_listing", "sentiment", "is_latest", "created_at", "id"),
+    )
+
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     status: ContentStatus = Field(default=ContentStatus.UNPROCESSED)
     original_filename: str = Field(index=True)
     version: int = Field(default=1, index=True)
     content_type: Optional[str] = Field(default=None, index=True)
     checksum: Optional[str] = Field(default=None, index=True) # SHA-256 for duplication detection
-    storage_path: str
+    storage_path: str = Field(index=True) # Indexed for reference checks before a blob is deleted
     created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     metadata_json: Optional[str] = Field(default="{}") # Storing simple JSON as string for SQLite simplicity initially
+    is_latest: bool = Field(default=True) # Maintained on upload/delete so listings avoid a per-row version subquery
+    lease_owner: Optional[str] = Field(default=None) # Worker currently tagging the item
+    lease_expires_at: Optional[datetime] = Field(default=None) # Other workers may reclaim the item after this
+    attempts: int = Field(default=0) # Failed tagging attempts so far
+    last_error: Optional[str] = Field(default=None) # Why the last attempt failed
+    # common_schema.json fields, maintained by SQLite from metadata_json (never written directly).
+    # Tags live in ItemTag; the summary is searched through the FTS index
+    sentiment: Optional[str] = Field(
+        default=None,
+        sa_column=Column(String, Computed(metadata_field("sentiment"), persisted=False)),
+    )
+
+class ItemTag(SQLModel, table=True):
+    # Normalized tags from the LLM metadata, for tag filters and facets
+    item_id: uuid.UUID = Field(primary_key=True)
+    tag: str = Field(primary_key=True, index=True)
+
+class Blob(SQLModel, table=True):
+    # One row per physical blob; items with identical content share it
+    checksum: str = Field(primary_key=True) # SHA-256 of the content
+    storage_path: str = Field(index=True)
+    size: int = 0
+    ref_count: int = Field(default=1) # Number of ContentItems pointing at this blob
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class LLMCacheEntry(SQLModel, table=True):
+    # LLM output for identical bytes, prompt and model is reused instead of re-generated
+    checksum: str = Field(primary_key=True)
+    prompt_hash: str = Field(primary_key=True)
+    model: str = Field(primary_key=True)
+    metadata_json: str
+    size: int = 0 # Length of metadata_json, used for size-based eviction
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class BulkAction(str, Enum):
+    DELETE = "delete"
+    REQUEUE = "requeue"
+    RETAG = "retag"
+    SWEEP = "sweep" # Deletes stored blobs nothing refers to; see app/services/storage_gc.py
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running" # Claimed by a worker; see lease_owner / lease_expires_at
+    DONE = "done"
+    FAILED = "failed"
 
-from pathlib import Path
+class BulkJob(SQLModel, table=True):
+    # Bulk operations, run in the background by the workers and polled via /api/jobs/{id}
+    id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
+    action: BulkAction
+    status: JobStatus = Field(default=JobStatus.PENDING, index=True)
+    item_ids_json: str = Field(default="[]") # Items selected when the job was submitted
+    total: int = 0
+    processed: int = 0 # Items handled so far, in item_ids_json order; a resumed job continues from here
+    skipped: int = 0 # Items that were gone or not in a state the action applies to
+    result_json: Optional[str] = Field(default=None) # Summary of a sweep
+    error: Optional[str] = Field(default=None)
+    lease_owner: Optional[str] = Field(default=None)
+    lease_expires_at: Optional[datetime] = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    finished_at: Optional[datetime] = Field(default=None)
+
+class EventLogEntry(SQLModel, table=True):
+    # Events from every process, relayed to the SSE clients of the others
+    id: Optional[int] = Field(default=None, primary_key=True)
+    data: str
+    origin: Optional[str] = Field(default=None) # Epoch of the broadcasting process
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
-# Robust path handling
-BASE_DIR = Path(__file__).resolve().parent.parent # points to backend/
-DATA_DIR = BASE_DIR.parent / "data" # points to zibaldone/data
-DATA_DIR.mkdir(exist_ok=True) # Ensure data dir exists
+from app.database import engine
 
-sqlite_file_name = DATA_DIR / "database.db"
-sqlite_url = f"sqlite:///{sqlite_file_name}"
+def add_missing_columns(engine) -> Set[str]:
+    """
+    `create_all` never alters existing tables, so columns and indexes added
+    to a model after a database was created are added here. Returns
+    "table.column" names that were added so callers can backfill them.
+    """
+    inspector = inspect(engine)
+    added = set()
+    with engine.begin() as conn:
+        for table in SQLModel.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if column.computed is not None:
+                    # SQLite can add VIRTUAL generated columns; they need no backfill
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {CreateColumn(column).compile(engine)}"))
+                    added.add(f"{table.name}.{column.name}")
+                    continue
+                column_type = column.type.compile(engine.dialect)
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if isinstance(default, Enum):
+                    default = default.name
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if isinstance(default, bool):
+                    default = int(default)
+                if default is not None:
+                    ddl += f" DEFAULT {default!r}"
+                conn.execute(text(ddl))
+                added.add(f"{table.name}.{column.name}")
 
-connect_args = {"check_same_thread": False}
-engine = create_engine(sqlite_url, connect_args=connect_args)
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return added
 
-def create_db_and_tables():
+def create_db_and_tables(engine=engine):
     SQLModel.metadata.create_all(engine)
+    added = add_missing_columns(engine)
+
+    from app.services.search import create_search_index
+    create_search_index(engine)
+
+    # Refresh query planner statistics where SQLite thinks they are stale
+    with engine.begin() as conn:
+        conn.execute(text("PRAGMA optimize"))
+
+    if "contentitem.is_latest" in added:
+        with engine.begin() as conn:
+            conn.execute(text(
+                "UPDATE contentitem SET is_latest = NOT EXISTS ("
+                "SELECT 1 FROM contentitem AS newer "
+                "WHERE newer.original_filename = contentitem.original_filename "
+                "AND newer.version > contentitem.version)"
+            ))
 
 def get_session():
+    """
+    Request-scoped session. Sync routes use it directly (FastAPI runs them in
+    its threadpool); async routes must hand it to `db_reader`/`db_writer`
+    instead of querying on the event loop.
+    """
     with Session(engine) as session:
         yield session
@@ -0,0 +1,110 @@
+import json
+from collections import Counter
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlmodel import Session, select, func
+from app.models import ContentItem
+
+def acquire_blob(session: Session, checksum: str) -> Optional[str]:
+    """
+    Adds a reference to an existing blob with this checksum.
+    Returns its storage path, or None if no such blob is stored yet.
+    """
+    row = session.exec(
+        text("UPDATE blob SET ref_count = ref_count + 1 WHERE checksum = :checksum RETURNING storage_path"),
+        params={"checksum": checksum},
+    ).first()
+    return row[0] if row else None
+
+def register_blob(session: Session, checksum: str, storage_path: str, size: int, references: int = 1) -> str:
+    """
+    Records a freshly written blob with `references` references. If a
+    concurrent upload registered the same content first, that blob wins and
+    gets the references; the returned storage path is the one to use either way.
+    """
+    row = session.exec(
+        text(
+            "INSERT INTO blob (checksum, storage_path, size, ref_count, created_at) "
+            "VALUES (:checksum, :storage_path, :size, :references, CURRENT_TIMESTAMP) "
+            "ON CONFLICT (checksum) DO UPDATE SET ref_count = ref_count + :references "
+            "RETURNING storage_path"
+        ),
+        params={"checksum": checksum, "storage_path": storage_path, "size": size, "references": references},
+    ).first()
+    return row[0]
+
+def is_referenced(session: Session, storage_path: str) -> bool:
+    """Whether a blob or an item (including items stored before blobs were tracked) points at this path."""
+    return session.exec(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM blob WHERE storage_path = :path) "
+            "OR EXISTS (SELECT 1 FROM contentitem WHERE storage_path = :path)"
+        ),
+        params={"path": storage_path},
+    ).scalar() == 1
+
+def release_blob(session: Session, item: ContentItem) -> Optional[str]:
+    """
+    Drops the item's reference to its blob. Returns the storage path to
+    physically delete once the last reference is gone, otherwise None.
+    Call before deleting the item row, and delete the file only after commit.
+    """
+    if item.checksum:
+        row = session.exec(
+            text(
+                "UPDATE blob SET ref_count = ref_count - 1 "
+                "WHERE checksum = :checksum AND storage_path = :storage_path "
+                "RETURNING ref_count"
+            ),
+            params={"checksum": item.checksum, "storage_path": item.storage_path},
+        ).first()
+        if row:
+            if row[0] > 0:
+                return None
+            session.exec(text("DELETE FROM blob WHERE checksum = :checksum"), params={"checksum": item.checksum})
+            return item.storage_path
+
+    # Items stored before blobs were tracked: only delete if nothing else points at the path
+    other_references = session.exec(
+        select(func.count()).select_from(ContentItem)
+        .where(ContentItem.storage_path == item.storage_path)
+        .where(ContentItem.id != item.id)
+    ).one()
+    return item.storage_path if other_references == 0 else None
+
+def release_blobs(session: Session, references: List[Tuple[Optional[str], str]]) -> List[str]:
+    """
+    `release_blob` for a batch of items, given the (checksum, storage_path)
+    of each, in a few statements. Call after deleting the item rows, in the
+    same transaction. Returns the storage paths left without any reference,
+    to physically delete after commit.
+    """
+    counts = Counter(references)
+    released = session.exec(
+        text(
+            "UPDATE blob SET ref_count = ref_count - r.n FROM ("
+            "SELECT json_extract(value, '$[0]') AS checksum, json_extract(value, '$[1]') AS storage_path, "
+            "json_extract(value, '$[2]') AS n FROM json_each(:references)"
+            ") AS r WHERE blob.checksum = r.checksum AND blob.storage_path = r.storage_path "
+            "RETURNING blob.checksum, blob.storage_path, blob.ref_count"
+        ),
+        params={"references": json.dumps([[checksum, path, n] for (checksum, path), n in counts.items() if checksum])},
+    ).all()
+    emptied = [(checksum, path) for checksum, path, ref_count in released if ref_count <= 0]
+    if emptied:
+        session.exec(
+            text("DELETE FROM blob WHERE checksum IN (SELECT value FROM json_each(:checksums))"),
+            params={"checksums": json.dumps([checksum for checksum, _ in emptied])},
+        )
+
+    # Items stored before blobs were tracked: only delete paths nothing else points at
+    matched = {(checksum, path) for checksum, path, _ in released}
+    untracked = sorted({path for checksum, path in counts if (checksum, path) not in matched})
+    still_referenced = set(session.exec(
+        text(
+            "SELECT storage_path FROM contentitem WHERE storage_path IN (SELECT value FROM json_each(:paths)) "
+            "UNION SELECT storage_path FROM blob WHERE storage_path IN (SELECT value FROM json_each(:paths))"
+        ),
+        params={"paths": json.dumps(untracked)},
+    ).scalars()) if untracked else set()
+    return [path for _, path in emptied] + [path for path in untracked if path not in still_referenced]
@@ -0,0 +1,353 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import and_, delete, func, or_, select, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session
+
+from app.database import db_writer, db_reader
+from app.models import engine, BulkAction, BulkJob, ContentItem, ContentStatus, JobStatus
+from app.services.blobs import release_blobs
+from app.services.event_broadcaster import broadcaster
+from app.services.job_queue import job_queue
+from app.services.leases import leases
+from app.services.llm_cache import llm_cache
+from app.services.metadata_filters import metadata_conditions
+from app.services.search import remove_items as remove_from_search_index
+from app.services.storage import StorageInterface
+from app.services.storage_gc import GC_INTERVAL_SECONDS, sweep_storage
+from app.services.vector_index import vector_index
+
+logger = logging.getLogger(__name__)
+
+# Items handled per write transaction; a job's progress is saved after each chunk
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+
+def chunks(values: List[Any], size: int = BULK_CHUNK_SIZE) -> Iterable[List[Any]]:
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def select_item_ids(
+    session: Session,
+    ids: Optional[List[uuid.UUID]] = None,
+    filename: Optional[str] = None,
+    content_type: Optional[str] = None,
+    status: Optional[ContentStatus] = None,
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None,
+    sentiment: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    metadata: Optional[Dict[str, str]] = None,
+) -> List[uuid.UUID]:
+    """
+    Ids of the items matching every given filter, oldest first. Filters
+    match every version of a file. Items already being deleted are only
+    selected by asking for `status=deleting` explicitly. Raises ValueError
+    for invalid metadata keys.
+    """
+    conditions = []
+    if filename is not None:
+        conditions.append(ContentItem.original_filename == filename)
+    if content_type is not None:
+        conditions.append(ContentItem.content_type == content_type)
+    conditions.append(ContentItem.status == status if status else ContentItem.status != ContentStatus.DELETING)
+    if before:
+        conditions.append(ContentItem.created_at < before)
+    if after:
+        conditions.append(ContentItem.created_at >= after)
+    conditions += metadata_conditions(metadata, sentiment, tags)
+
+    statement = select(ContentItem.id).where(*conditions).order_by(ContentItem.created_at)
+    if ids is None:
+        return list(session.execute(statement).scalars())
+    selected = []
+    for chunk in chunks(list(dict.fromkeys(ids))):
+        selected += session.execute(statement.where(ContentItem.id.in_(chunk))).scalars()
+    return selected
+
+def submit_job(session: Session, action: BulkAction, item_ids: List[uuid.UUID]) -> BulkJob:
+    """
+    Records a job over `item_ids` as one write transaction (run it through
+    `db_writer`). Items to delete are marked DELETING in the same
+    transaction, so they leave listings and search, and stop being tagged,
+    before anything is removed.
+    """
+    if action == BulkAction.DELETE:
+        for chunk in chunks(item_ids):
+            session.execute(
+                update(ContentItem)
+                .where(ContentItem.id.in_(chunk))
+                .values(status=ContentStatus.DELETING, lease_owner=None, lease_expires_at=None)
+                .execution_options(synchronize_session=False)
+            )
+    job = BulkJob(action=action, item_ids_json=json.dumps([item_id.hex for item_id in item_ids]), total=len(item_ids))
+    session.add(job)
+    session.commit()
+    session.refresh(job)
+    return job
+
+def promote_latest_versions(session: Session, filenames: Iterable[str]):
+    """Marks the highest remaining version of each file as latest, after its latest version was deleted."""
+    other = aliased(ContentItem)
+    newest = (
+        select(func.max(other.version))
+        .where(other.original_filename == ContentItem.original_filename)
+        .where(other.status != ContentStatus.DELETING)
+        .scalar_subquery()
+    )
+    for chunk in chunks(sorted(set(filenames))):
+        session.execute(
+            update(ContentItem)
+            .where(ContentItem.original_filename.in_(chunk))
+            .where(ContentItem.status != ContentStatus.DELETING)
+            .where(ContentItem.version == newest)
+            .values(is_latest=True)
+            .execution_options(synchronize_session=False)
+        )
+
+def remove_vectors(item_ids: List[uuid.UUID]):
+    for item_id in item_ids:
+        vector_index.remove(item_id)
+
+def job_view(job: BulkJob) -> Dict[str, Any]:
+    """What the API returns for a job: everything but the (possibly long) list of item ids."""
+    view = job.model_dump(exclude={"item_ids_json", "result_json"})
+    view["result"] = json.loads(job.result_json) if job.result_json else None
+    return view
+
+class BulkJobRunner:
+    """
+    Runs bulk jobs in the worker processes. Jobs are claimed with a lease,
+    like items, so exactly one process runs each job, and one whose process
+    died is taken over once the lease expires. Items are handled in chunks
+    of BULK_CHUNK_SIZE and progress is saved after every chunk, so a
+    taken-over job continues where it stopped.
+    """
+    def __init__(self, owner: Optional[str] = None):
+        self.owner = owner or leases.owner
+        self.lease_seconds = leases.lease_seconds
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        """Called by the API when it submits a job, so a local runner starts on it right away."""
+        self._wakeup.set()
+
+    def _claimable(self, now: datetime):
+        return select(BulkJob.id).where(or_(
+            BulkJob.status == JobStatus.PENDING,
+            and_(BulkJob.status == JobStatus.RUNNING, BulkJob.lease_expires_at < now),
+        ))
+
+    def has_claimable(self, session: Session) -> bool:
+        """Read-only check for a job `claim` would take, so an idle runner doesn't take the write lock."""
+        return session.execute(select(self._claimable(datetime.utcnow()).exists())).scalar()
+
+    def claim(self, session: Session) -> Optional[uuid.UUID]:
+        """Claims the oldest pending job, or a running one whose lease expired."""
+        now = datetime.utcnow()
+        oldest = self._claimable(now).order_by(BulkJob.created_at).limit(1)
+        job_id = session.execute(
+            update(BulkJob)
+            .where(BulkJob.id.in_(oldest))
+            .values(status=JobStatus.RUNNING, lease_owner=self.owner, lease_expires_at=now + timedelta(seconds=self.lease_seconds))
+            .returning(BulkJob.id)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        session.commit()
+        return job_id
+
+    def sweep_due(self, session: Session) -> bool:
+        """Whether no sweep was submitted in the last GC_INTERVAL_SECONDS. Read-only."""
+        if GC_INTERVAL_SECONDS <= 0:
+            return False
+        last = session.execute(
+            select(func.max(BulkJob.created_at)).where(BulkJob.action == BulkAction.SWEEP)
+        ).scalar_one_or_none()
+        return last is None or last <= datetime.utcnow() - timedelta(seconds=GC_INTERVAL_SECONDS)
+
+    def schedule_sweep(self, session: Session) -> bool:
+        """Submits a storage sweep if one is due (see `sweep_due`)."""
+        if not self.sweep_due(session):
+            return False
+        submit_job(session, BulkAction.SWEEP, [])
+        return True
+
+    def _advance(self, session: Session, job_id: uuid.UUID, handled: int, skipped: int) -> bool:
+        """Records progress and renews the lease, in the caller's transaction. False if the job was taken over."""
+        result = session.execute(
+            update(BulkJob)
+            .where(BulkJob.id == job_id)
+            .where(BulkJob.lease_owner == self.owner)
+            .values(
+                processed=BulkJob.processed + handled,
+                skipped=BulkJob.skipped + skipped,
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        return bool(result.rowcount)
+
+    def renew(self, session: Session, job_id: uuid.UUID) -> bool:
+        """Extends the lease on a job, as one write transaction. False if the job was taken over."""
+        renewed = self._advance(session, job_id, 0, 0)
+        session.commit()
+        return renewed
+
+    def _finish(self, session: Session, job_id: uuid.UUID, status: JobStatus,
+                result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        session.execute(
+            update(BulkJob)
+            .where(BulkJob.id == job_id)
+            .where(BulkJob.lease_owner == self.owner)
+            .values(
+                status=status,
+                result_json=json.dumps(result) if result is not None else None,
+                error=error[:2000] if error else None,
+                lease_owner=None,
+                lease_expires_at=None,
+                finished_at=datetime.utcnow(),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+    def delete_chunk(self, session: Session, job_id: uuid.UUID, item_ids: List[uuid.UUID]) -> Optional[Tuple[List[uuid.UUID], List[str]]]:
+        """
+        Removes the chunk's marked items with their search entries and blob
+        references, as one write transaction. Returns the deleted ids and the
+        blob paths that lost their last reference (to delete after commit),
+        or None if the job was taken over.
+        """
+        deleted = session.execute(
+            delete(ContentItem)
+            .where(ContentItem.id.in_(item_ids))
+            .where(ContentItem.status == ContentStatus.DELETING)
+            .returning(ContentItem.id, ContentItem.checksum, ContentItem.storage_path,
+                       ContentItem.original_filename, ContentItem.is_latest)
+            .execution_options(synchronize_session=False)
+        ).all()
+        orphaned = release_blobs(session, [(row.checksum, row.storage_path) for row in deleted])
+        remove_from_search_index(session, [row.id for row in deleted])
+        promote_latest_versions(session, [row.original_filename for row in deleted if row.is_latest])
+        if not self._advance(session, job_id, len(item_ids), len(item_ids) - len(deleted)):
+            session.rollback()
+            return None
+        session.commit()
+        return [row.id for row in deleted], orphaned
+
+    def requeue_chunk(self, session: Session, job_id: uuid.UUID, item_ids: List[uuid.UUID], retag: bool) -> Optional[List[uuid.UUID]]:
+        """
+        Requeues the chunk's failed and waiting items or, with `retag`, sends
+        every item back to be tagged again, dropping cached LLM results for
+        their content so the model is actually asked again. Returns the
+        affected ids, or None if the job was taken over.
+        """
+        if retag:
+            checksums = session.execute(
+                select(ContentItem.checksum).where(ContentItem.id.in_(item_ids)).where(ContentItem.checksum.is_not(None))
+            ).scalars().all()
+            llm_cache.invalidate(session, list(set(checksums)))
+            affected = leases.reset(session, item_ids)
+        else:
+            affected = leases.requeue_many(session, item_ids)
+        if not self._advance(session, job_id, len(item_ids), len(item_ids) - len(affected)):
+            session.rollback()
+            return None
+        session.commit()
+        return affected
+
+    async def run(self, job_id: uuid.UUID, storage: StorageInterface):
+        """Runs a claimed job to completion, from the progress it has saved."""
+        with Session(engine) as session:
+            job = await db_reader.run(session.get, BulkJob, job_id)
+            item_ids = [uuid.UUID(item_id) for item_id in json.loads(job.item_ids_json)]
+            logger.info(f"Running {job.action.value} job {job.id} ({job.processed}/{job.total} done)")
+            status, result = JobStatus.DONE, None
+            try:
+                if job.action == BulkAction.SWEEP:
+                    # A long sweep renews its lease before each delete batch, so no second sweep starts alongside it
+                    result = await sweep_storage(storage, session, renew=lambda: db_writer.run(self.renew, session, job.id))
+                    if result is None:
+                        logger.warning(f"Lost the lease on job {job.id}; another worker took it over")
+                        return
+                    logger.info(f"Storage sweep: {result}")
+                for chunk in chunks(item_ids[job.processed:]):
+                    if job.action == BulkAction.DELETE:
+                        outcome = await db_writer.run(self.delete_chunk, session, job.id, chunk)
+                        if outcome is None:
+                            break
+                        affected, orphaned = outcome
+                        await asyncio.to_thread(remove_vectors, affected)
+                        # Blobs that fail to delete now are collected by the next sweep
+                        failed = await storage.adelete_many(orphaned)
+                        if failed:
+                            logger.warning(f"Could not delete {len(failed)} blob(s); the next storage sweep will retry")
+                    else:
+                        affected = await db_writer.run(self.requeue_chunk, session, job.id, chunk, job.action == BulkAction.RETAG)
+                        if affected is None:
+                            break
+                        for item_id in affected:
+                            job_queue.enqueue(item_id)
+                    if affected:
+                        await broadcaster.broadcast(json.dumps({"type": "update", "item_ids": [str(item_id) for item_id in affected]}))
+                else:
+                    await db_writer.run(self._finish, session, job.id, status, result)
+                    await self._announce(session, job.id)
+                    return
+                logger.warning(f"Lost the lease on job {job.id}; another worker took it over")
+            except Exception as e:
+                logger.error(f"Error running job {job.id}: {e}", exc_info=True)
+                await db_writer.run(self._finish, session, job.id, JobStatus.FAILED, error=f"{type(e).__name__}: {e}")
+                await self._announce(session, job.id)
+
+    async def _announce(self, session: Session, job_id: uuid.UUID):
+        job = await db_reader.run(session.get, BulkJob, job_id, populate_existing=True)
+        await broadcaster.broadcast(json.dumps({"type": "job", "job_id": str(job.id), "action": job.action.value, "status": job.status.value}))
+
+    async def run_pending(self, storage: StorageInterface) -> int:
+        """Schedules a sweep if one is due, then runs jobs until none is waiting. Returns the number run."""
+        def sweep_due():
+            with Session(engine) as session:
+                return self.sweep_due(session)
+
+        def schedule():
+            with Session(engine) as session:
+                self.schedule_sweep(session)
+
+        def has_claimable():
+            with Session(engine) as session:
+                return self.has_claimable(session)
+
+        def claim():
+            with Session(engine) as session:
+                return self.claim(session)
+
+        # Writes only follow a read-only check, so polling while idle never takes the write lock
+        if await db_reader.run(sweep_due):
+            await db_writer.run(schedule)
+        count = 0
+        while await db_reader.run(has_claimable) and (job_id := await db_writer.run(claim)):
+            await self.run(job_id, storage)
+            count += 1
+        return count
+
+    async def run_forever(self, storage: StorageInterface):
+        """Worker loop: runs jobs as they are submitted, checking the database every WORKER_POLL_INTERVAL seconds."""
+        poll_interval = float(os.getenv("WORKER_POLL_INTERVAL", "5"))
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.run_pending(storage)
+            except Exception as e:
+                logger.error(f"Error running bulk jobs: {e}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+# Global instance
+bulk_jobs = BulkJobRunner()
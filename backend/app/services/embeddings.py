@@ -0,0 +1,51 @@
+import os
+from typing import Any, Dict, List, Optional
+from litellm import aembedding
+
+from app.models import ContentItem
+from app.services.rate_limiter import rate_limiters
+from app.services.search import flatten_text
+
+# Embedding inputs are clipped to roughly this many characters
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", "8000"))
+
+class EmbeddingService:
+    """
+    Turns item metadata and search queries into vectors through LiteLLM's
+    embedding API, e.g. EMBEDDING_MODEL="ollama/nomic-embed-text" against a
+    local endpoint (LITELLM_URL or EMBEDDING_API_BASE). An empty
+    EMBEDDING_MODEL disables the indexing stage; items then stay TAGGED.
+    """
+    def __init__(self, model: Optional[str] = None):
+        self.model = model if model is not None else os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        self.enabled = bool(self.model)
+        self.api_base = os.getenv("EMBEDDING_API_BASE") or os.getenv("LITELLM_URL")
+        self.batch_size = max(1, int(os.getenv("EMBEDDING_BATCH_SIZE", "32")))
+        self.rate_limiter = rate_limiters.get(self.model)
+
+    @staticmethod
+    def document_text(item: ContentItem, metadata: Dict[str, Any]) -> str:
+        """The text embedded for an item: filename, summary, tags, then the remaining metadata."""
+        parts = [item.original_filename]
+        if isinstance(metadata.get("summary"), str):
+            parts.append(metadata["summary"])
+        parts.append(", ".join(str(tag) for tag in metadata.get("tags") or []))
+        parts.extend(part for key, value in metadata.items() if key not in ("summary", "tags", "error") for part in flatten_text(value))
+        return "\n".join(part for part in parts if part)[:EMBEDDING_MAX_CHARS]
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """Embeds `texts` in batches of EMBEDDING_BATCH_SIZE, preserving order."""
+        vectors: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            await self.rate_limiter.acquire(sum(len(text) for text in batch) // 4)
+            response = await aembedding(model=self.model, input=batch, api_base=self.api_base)
+            data = sorted(response.data, key=lambda entry: entry["index"])
+            vectors.extend(entry["embedding"] for entry in data)
+        return vectors
+
+    async def embed_query(self, query: str) -> List[float]:
+        return (await self.embed([query[:EMBEDDING_MAX_CHARS]]))[0]
+
+# Global instance
+embedding_service = EmbeddingService()
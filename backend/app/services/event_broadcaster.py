@@ -1,22 +1,229 @@
 import asyncio
-from typing import List
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, List, Optional, Tuple
+from sqlmodel import Session, delete, func, select
+
+from app.database import db_reader, db_writer
+from app.models import EventLogEntry, engine
+from app.services.metrics import SSE_SUBSCRIBERS
+
+logger = logging.getLogger(__name__)
+
+# How often API processes look for events written by other processes
+EVENT_RELAY_INTERVAL = float(os.getenv("EVENT_RELAY_INTERVAL", "0.5"))
+# Relayed events older than this are pruned
+EVENT_LOG_RETENTION = float(os.getenv("EVENT_LOG_RETENTION_SECONDS", "3600"))
+# Events a client may fall behind before it is sent a resync instead
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+# Recent events kept for clients reconnecting with Last-Event-ID
+SSE_REPLAY_BUFFER = int(os.getenv("SSE_REPLAY_BUFFER", "1000"))
+# Update events within one tick go out as a single message
+SSE_COALESCE_INTERVAL = float(os.getenv("SSE_COALESCE_INTERVAL", "0.25"))
+# Idle connections get a comment line this often
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+def append_events(messages: List[str], origin: Optional[str] = None):
+    with Session(engine) as session:
+        session.add_all([EventLogEntry(data=data, origin=origin) for data in messages])
+        session.commit()
+
+def latest_event_id() -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.max(EventLogEntry.id))).one() or 0
+
+def events_after(event_id: int, origin: Optional[str] = None, limit: int = 500) -> List[Tuple[int, str, Optional[str]]]:
+    with Session(engine) as session:
+        statement = select(EventLogEntry.id, EventLogEntry.data, EventLogEntry.origin).where(EventLogEntry.id > event_id).order_by(EventLogEntry.id).limit(limit)
+        return list(session.exec(statement).all())
+
+def has_expired_events() -> bool:
+    with Session(engine) as session:
+        oldest = session.exec(select(func.min(EventLogEntry.created_at))).one()
+        return oldest is not None and oldest < datetime.utcnow() - timedelta(seconds=EVENT_LOG_RETENTION)
+
+def prune_events():
+    with Session(engine) as session:
+        cutoff = datetime.utcnow() - timedelta(seconds=EVENT_LOG_RETENTION)
+        session.exec(delete(EventLogEntry).where(EventLogEntry.created_at < cutoff))
+        session.commit()
+
+def coalesce(messages: List[str]) -> List[str]:
+    """
+    Merges the `update` events of one tick into a single event, at the
+    position of the first one, carrying every `item_ids`. Other events pass
+    through in order, and a lone update is sent unchanged.
+    """
+    result: List[str] = []
+    updates: List[str] = []
+    item_ids: List[str] = []
+    position = None
+    for message in messages:
+        try:
+            event = json.loads(message)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict) or event.get("type") != "update":
+            result.append(message)
+            continue
+        if position is None:
+            position = len(result)
+        updates.append(message)
+        item_ids.extend(item_id for item_id in event.get("item_ids") or [event.get("item_id")] if item_id is not None)
+    if updates:
+        merged = updates[0] if len(updates) == 1 else json.dumps({"type": "update", "item_ids": list(dict.fromkeys(item_ids))})
+        result.insert(position, merged)
+    return result
+
+class Subscriber:
+    """
+    One SSE connection. Its queue is bounded: a client that stops reading
+    (a stalled tab) is marked `overflowed` instead of buffering without
+    limit, and gets a single resync event once it reads again.
+    """
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def offer(self, frame: str):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            # Queued frames are superseded by the resync; free them now
+            while not self.queue.empty():
+                self.queue.get_nowait()
 
 class EventBroadcaster:
-    def __init__(self):
-        self.subscribers: List[asyncio.Queue] = []
+    """
+    Fans events out to SSE subscribers. Events published within one
+    SSE_COALESCE_INTERVAL tick are coalesced (see `coalesce`), numbered, and
+    encoded once as an SSE frame that every subscriber shares. The last
+    SSE_REPLAY_BUFFER frames are kept so a client reconnecting with
+    `Last-Event-ID` gets what it missed; event ids carry a per-process epoch
+    so ids from before a restart (or from another API process) are detected
+    and answered with a resync instead.
+    """
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE, replay_size: int = SSE_REPLAY_BUFFER,
+                 coalesce_interval: float = SSE_COALESCE_INTERVAL):
+        self.subscribers: List[Subscriber] = []
+        self.queue_size = queue_size
+        self.coalesce_interval = coalesce_interval
+        self.epoch = uuid.uuid4().hex[:8]
+        self.last_number = 0
+        self.history: Deque[Tuple[int, str]] = deque(maxlen=replay_size)
+        self.pending: List[str] = []
+        self.unsaved: List[str] = []
+        self._flusher: Optional[asyncio.Task] = None
+        # Any process may claim work (in-process workers under `uvicorn
+        # --workers N`, standalone workers), so events go to the event log,
+        # which every API process tails with `relay`
+        self.persist = True
+
+    @property
+    def last_event_id(self) -> str:
+        return f"{self.epoch}-{self.last_number}"
+
+    def resync_frame(self) -> str:
+        """Tells a client it may have missed events, so it should reload everything."""
+        return f"id: {self.last_event_id}\ndata: {json.dumps({'type': 'update', 'resync': True})}\n\n"
 
-    async def subscribe(self) -> asyncio.Queue:
-        queue = asyncio.Queue()
-        self.subscribers.append(queue)
-        return queue
+    async def subscribe(self, last_event_id: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(self.queue_size)
+        if last_event_id:
+            epoch, _, number = last_event_id.partition("-")
+            oldest = self.history[0][0] if self.history else self.last_number + 1
+            if epoch == self.epoch and number.isdigit() and oldest - 1 <= int(number) <= self.last_number:
+                for n, frame in self.history:
+                    if n > int(number):
+                        subscriber.offer(frame)
+            else:
+                subscriber.offer(self.resync_frame())
+        self.subscribers.append(subscriber)
+        return subscriber
 
-    def unsubscribe(self, queue: asyncio.Queue):
-        if queue in self.subscribers:
-            self.subscribers.remove(queue)
+    def unsubscribe(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
 
     async def broadcast(self, message: str):
-        for queue in self.subscribers:
-            await queue.put(message)
+        """Publishes an event here, and (with the next tick) writes it to the event log for the other processes."""
+        if self.persist:
+            self.unsaved.append(message)
+        self.publish(message)
+
+    def publish(self, message: str):
+        """Queues an event for this process's subscribers; it goes out with the next tick."""
+        self.pending.append(message)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.get_running_loop().create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.coalesce_interval)
+        self.flush()
+
+    def flush(self):
+        messages, self.pending = self.pending, []
+        for data in coalesce(messages):
+            self.last_number += 1
+            frame = f"id: {self.epoch}-{self.last_number}\ndata: {data}\n\n"
+            self.history.append((self.last_number, frame))
+            for subscriber in self.subscribers:
+                subscriber.offer(frame)
+        if self.unsaved:
+            unsaved, self.unsaved = self.unsaved, []
+            asyncio.get_running_loop().create_task(self._save(coalesce(unsaved)))
+
+    async def _save(self, messages: List[str]):
+        # One write per tick, whatever the number of events
+        try:
+            await db_writer.run(append_events, messages, self.epoch)
+        except Exception as e:
+            # Other processes miss these; this process's clients already have them
+            logger.error(f"Error persisting events: {e}", exc_info=True)
+
+    async def next_frame(self, subscriber: Subscriber, timeout: float = SSE_HEARTBEAT_SECONDS) -> str:
+        """
+        The subscriber's next SSE frame, a resync after an overflow, or a
+        heartbeat comment after `timeout` seconds without events (keeps
+        proxies from closing idle connections).
+        """
+        if subscriber.overflowed:
+            subscriber.overflowed = False
+            return self.resync_frame()
+        try:
+            return await asyncio.wait_for(subscriber.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return ": ping\n\n"
+
+    async def relay(self, interval: float = EVENT_RELAY_INTERVAL):
+        """
+        Forwards events written by other processes to this process's
+        subscribers; its own were published when they were broadcast. A
+        failed poll (e.g. the database is locked) is logged and retried on
+        the next tick.
+        """
+        last_id = None
+        while True:
+            try:
+                if last_id is None:
+                    last_id = await db_reader.run(latest_event_id)
+                else:
+                    for event_id, data, origin in await db_reader.run(events_after, last_id):
+                        last_id = event_id
+                        if origin != self.epoch:
+                            self.publish(data)
+            except Exception as e:
+                logger.error(f"Error relaying events: {e}", exc_info=True)
+            await asyncio.sleep(interval)
 
 # Global instance
 broadcaster = EventBroadcaster()
+
+SSE_SUBSCRIBERS.set_function(lambda: len(broadcaster.subscribers))
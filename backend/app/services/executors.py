@@ -0,0 +1,95 @@
+import asyncio
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# hashlib releases the GIL on buffers larger than 2 KB, so threads hash in parallel
+CPU_THREADS = int(os.getenv("CPU_THREADS", str(min(4, os.cpu_count() or 1))))
+# Everything else that is CPU-bound (image encoding, document parsing, large
+# JSON) holds the GIL and needs a process; 0 runs it on the thread pool instead
+CPU_PROCESSES = int(os.getenv("CPU_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Smaller payloads cost less inline than the hand-off to another thread or process
+OFFLOAD_MIN_BYTES = int(os.getenv("OFFLOAD_MIN_BYTES", str(64 * 1024)))
+
+def _hash_update(digest, data: bytes):
+    digest.update(data)
+
+class Executors:
+    """
+    Shared pools for CPU-bound work, so the event loop that serves HTTP and
+    SSE never hashes, encodes or parses large payloads itself. Pools start
+    on first use. The process pool is spawned rather than forked: the
+    server process holds threads and open database handles.
+    """
+    def __init__(self, threads: int = CPU_THREADS, processes: int = CPU_PROCESSES):
+        self.thread_count = max(1, threads)
+        self.process_count = max(0, processes)
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def threads(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(self.thread_count, thread_name_prefix="cpu")
+        return self._threads
+
+    @property
+    def processes(self) -> Optional[ProcessPoolExecutor]:
+        if self._processes is None and self.process_count > 0:
+            self._processes = ProcessPoolExecutor(self.process_count, mp_context=multiprocessing.get_context("spawn"))
+        return self._processes
+
+    async def run_thread(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """For work that releases the GIL (hashlib, zlib, file I/O)."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.threads, functools.partial(fn, *args, **kwargs))
+
+    async def run_process(self, fn: Callable[..., Any], *args) -> Any:
+        """For pure-Python CPU work. `fn` and its arguments must be picklable."""
+        pool = self.processes
+        if pool is None:
+            return await self.run_thread(fn, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(pool, fn, *args)
+
+    async def hash_update(self, digest, data: bytes):
+        """`digest.update(data)`, on the thread pool for large chunks."""
+        if len(data) < OFFLOAD_MIN_BYTES:
+            digest.update(data)
+        else:
+            await self.run_thread(_hash_update, digest, data)
+
+    async def sha256(self, data: bytes) -> str:
+        digest = hashlib.sha256()
+        await self.hash_update(digest, data)
+        return digest.hexdigest()
+
+    async def json_loads(self, text: str) -> Any:
+        if len(text) < OFFLOAD_MIN_BYTES:
+            return json.loads(text)
+        return await self.run_process(json.loads, text)
+
+    async def json_dumps(self, value: Any, size_hint: int = 0) -> str:
+        """
+        `size_hint` is the caller's estimate of the output length (e.g. the
+        length of the JSON the value was parsed from); below OFFLOAD_MIN_BYTES
+        the value is encoded inline.
+        """
+        if size_hint < OFFLOAD_MIN_BYTES:
+            return json.dumps(value)
+        return await self.run_process(json.dumps, value)
+
+    def shutdown(self):
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+# Global instance
+executors = Executors()
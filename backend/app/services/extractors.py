@@ -0,0 +1,416 @@
+import base64
+import io
+import json
+import mimetypes
+import os
+import re
+import tarfile
+import warnings
+import zipfile
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+from xml.etree import ElementTree
+
+from app.services.executors import executors
+
+# Longest side images are scaled down to before being sent to a vision model
+IMAGE_MAX_SIDE = int(os.getenv("LLM_IMAGE_MAX_SIDE", "2048"))
+# Formats Pillow can't decode at reduced scale are only decoded up to this many pixels
+IMAGE_MAX_DECODE_PIXELS = int(os.getenv("LLM_IMAGE_MAX_DECODE_PIXELS", str(64_000_000)))
+IMAGE_JPEG_QUALITY = int(os.getenv("LLM_IMAGE_JPEG_QUALITY", "85"))
+# Images Pillow can't read (or without Pillow) are sent as-is up to this size
+IMAGE_MAX_RAW_BYTES = int(os.getenv("LLM_IMAGE_MAX_RAW_BYTES", str(20 * 1024 * 1024)))
+
+# Spacing of excerpts taken for the `sections` strategy
+SECTION_SAMPLES = 32
+
+# Extracted text is capped here; truncation to the model's context comes later
+EXTRACTED_TEXT_MAX_CHARS = int(os.getenv("EXTRACTED_TEXT_MAX_CHARS", str(1_000_000)))
+# Scanned documents without a text layer send at most this many page images
+EXTRACTED_MAX_PAGE_IMAGES = int(os.getenv("EXTRACTED_MAX_PAGE_IMAGES", "4"))
+# Suffix of the extraction cache kept next to each blob
+EXTRACTION_CACHE_SUFFIX = ".extracted.json"
+
+class PreparedImage(NamedTuple):
+    data_url: str
+    width: int
+    height: int
+
+class Extraction(NamedTuple):
+    text: str
+    images: List[str] # JPEG data URLs of pages, when there is no text layer
+
+class ExtractorUnavailable(Exception):
+    """The extractor's optional dependency is not installed."""
+
+class Extractor(NamedTuple):
+    name: str
+    version: int # Bump to invalidate cached extractions
+    prompt_type: str
+    function: Callable[[str, int], Extraction]
+
+class ExtractorRegistry:
+    """
+    Maps MIME types, and file extensions as a fallback, to the extractor that
+    turns a binary format into text (or page images) for the LLM.
+    """
+    def __init__(self):
+        self.by_name: Dict[str, Extractor] = {}
+        self.by_mime_type: Dict[str, Extractor] = {}
+        self.by_extension: Dict[str, Extractor] = {}
+
+    def register(self, name: str, mime_types: Iterable[str] = (), extensions: Iterable[str] = (),
+                 prompt_type: str = "document", version: int = 1):
+        def decorator(function: Callable[[str, int], Extraction]):
+            extractor = Extractor(name, version, prompt_type, function)
+            self.by_name[name] = extractor
+            for mime_type in mime_types:
+                self.by_mime_type[mime_type] = extractor
+            for extension in extensions:
+                self.by_extension[extension] = extractor
+            return function
+        return decorator
+
+    def resolve(self, file_path: str, content_type: Optional[str] = None) -> Optional[Extractor]:
+        """
+        The extractor for a file. The declared content type wins; generic
+        types like application/octet-stream fall through to the extension.
+        """
+        if content_type:
+            extractor = self.by_mime_type.get(content_type.split(";")[0].strip().lower())
+            if extractor:
+                return extractor
+        return self.by_extension.get(Path(file_path).suffix.lower())
+
+extractor_registry = ExtractorRegistry()
+
+def read_text_excerpt(file_path: str, max_bytes: int, strategy: str = "head") -> str:
+    """
+    Reads at most `max_bytes` of a text file without loading the rest: the
+    start for `head`, the start and end for `head_tail`, and evenly spaced
+    excerpts for `sections`, matching the truncation strategy applied next.
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as f:
+        if size <= max_bytes:
+            chunks = [f.read()]
+        elif strategy == "head_tail":
+            head = f.read(max_bytes // 2)
+            f.seek(size - max_bytes // 2)
+            chunks = [head, f.read()]
+        elif strategy == "sections":
+            chunk_size = max_bytes // SECTION_SAMPLES
+            chunks = []
+            for i in range(SECTION_SAMPLES):
+                f.seek(size * i // SECTION_SAMPLES)
+                chunks.append(f.read(chunk_size))
+        else:
+            chunks = [f.read(max_bytes)]
+    # Chunk edges may split multi-byte characters; those bytes are dropped
+    return "\n\n".join(chunk.decode("utf-8", errors="ignore") for chunk in chunks)
+
+def prepare_image(file_path: str, max_side: Optional[int] = None) -> PreparedImage:
+    """
+    Downscales an image to at most `max_side` pixels on its longest side and
+    re-encodes it as JPEG for a vision request. JPEGs are decoded directly at
+    a reduced scale, so even very large photos never exist at full size in
+    memory; other formats are refused above IMAGE_MAX_DECODE_PIXELS.
+    Files Pillow can't identify are passed through if they are small enough.
+    """
+    try:
+        from PIL import Image, UnidentifiedImageError
+    except ImportError:
+        return _raw_image(file_path)
+
+    max_side = max_side or IMAGE_MAX_SIDE
+    try:
+        # Pixel limits are enforced below, after JPEGs are set to decode at reduced scale
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+            image = Image.open(file_path)
+    except UnidentifiedImageError:
+        return _raw_image(file_path)
+    with image:
+        return _downscale(image, max_side)
+
+def _downscale(image, max_side: int) -> PreparedImage:
+    from PIL import ImageOps
+
+    # Only the header has been read; pixel data is decoded on first access
+    if image.format == "JPEG":
+        image.draft("RGB", (max_side, max_side))
+    elif image.width * image.height > IMAGE_MAX_DECODE_PIXELS:
+        raise ValueError(f"{image.width}x{image.height} {image.format} image is too large to decode")
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=IMAGE_JPEG_QUALITY)
+    encoded = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return PreparedImage(f"data:image/jpeg;base64,{encoded}", image.width, image.height)
+
+def _raw_image(file_path: str) -> PreparedImage:
+    if os.path.getsize(file_path) > IMAGE_MAX_RAW_BYTES:
+        raise ValueError(f"{file_path} is not a readable image and too large to send as-is")
+    mime_type = mimetypes.guess_type(file_path)[0] or "image/jpeg"
+    with open(file_path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("ascii")
+    return PreparedImage(f"data:{mime_type};base64,{encoded}", 0, 0)
+
+# --- Document extractors ---
+# Each takes a local path and a character limit and runs in a worker process.
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _xml_text(stream, max_chars: int, text_tags: Iterable[str], block_tags: Iterable[str]) -> str:
+    """
+    Streams text out of an XML part, one paragraph per line, without building
+    the whole tree. Text is collected from `text_tags` (e.g. w:t); a line ends
+    after each of `block_tags` (e.g. w:p).
+    """
+    text_tags, block_tags = set(text_tags), set(block_tags)
+    parts: List[str] = []
+    length = 0
+    for _, element in ElementTree.iterparse(stream, events=("end",)):
+        name = _local_name(element.tag)
+        if name in text_tags and element.text:
+            parts.append(element.text)
+            length += len(element.text)
+        elif name in block_tags:
+            parts.append("\n")
+            length += 1
+            element.clear()
+        if length >= max_chars:
+            break
+    return re.sub(r"\n{3,}", "\n\n", "".join(parts))[:max_chars]
+
+def _numbered_members(archive: zipfile.ZipFile, pattern: str) -> List[str]:
+    """Members like ppt/slides/slide12.xml, in numeric rather than lexical order."""
+    matcher = re.compile(pattern)
+    members = [(int(match.group(1)), name) for name in archive.namelist() if (match := matcher.fullmatch(name))]
+    return [name for _, name in sorted(members)]
+
+@extractor_registry.register(
+    "pdf",
+    mime_types=["application/pdf", "application/x-pdf"],
+    extensions=[".pdf"],
+)
+def extract_pdf(file_path: str, max_chars: int) -> Extraction:
+    """
+    Text layer of each page via pypdf. Scanned PDFs have none; their first
+    pages' embedded images are sent instead so a vision model can read them.
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractorUnavailable("pypdf is not installed")
+
+    reader = PdfReader(file_path)
+    pages: List[str] = []
+    length = 0
+    for page in reader.pages:
+        page_text = page.extract_text() or ""
+        pages.append(page_text)
+        length += len(page_text)
+        if length >= max_chars:
+            break
+    text = "\n\n".join(page.strip() for page in pages if page.strip())[:max_chars]
+    if text.strip():
+        return Extraction(text, [])
+
+    images: List[str] = []
+    try:
+        from PIL import Image
+    except ImportError:
+        return Extraction("", [])
+    for page in reader.pages[:EXTRACTED_MAX_PAGE_IMAGES]:
+        try:
+            page_images = list(page.images)
+            if not page_images:
+                continue
+            with Image.open(io.BytesIO(page_images[0].data)) as image:
+                images.append(_downscale(image, IMAGE_MAX_SIDE).data_url)
+        except Exception as e:
+            print(f"Could not extract page image from {file_path}: {e}")
+    return Extraction("", images)
+
+@extractor_registry.register(
+    "docx",
+    mime_types=["application/vnd.openxmlformats-officedocument.wordprocessingml.document"],
+    extensions=[".docx", ".docm"],
+)
+def extract_docx(file_path: str, max_chars: int) -> Extraction:
+    with zipfile.ZipFile(file_path) as archive, archive.open("word/document.xml") as stream:
+        return Extraction(_xml_text(stream, max_chars, ["t"], ["p", "tr"]), [])
+
+@extractor_registry.register(
+    "pptx",
+    mime_types=["application/vnd.openxmlformats-officedocument.presentationml.presentation"],
+    extensions=[".pptx"],
+)
+def extract_pptx(file_path: str, max_chars: int) -> Extraction:
+    slides: List[str] = []
+    length = 0
+    with zipfile.ZipFile(file_path) as archive:
+        for number, member in enumerate(_numbered_members(archive, r"ppt/slides/slide(\d+)\.xml"), 1):
+            with archive.open(member) as stream:
+                slide = _xml_text(stream, max_chars - length, ["t"], ["p"]).strip()
+            slides.append(f"--- Slide {number} ---\n{slide}")
+            length += len(slides[-1])
+            if length >= max_chars:
+                break
+    return Extraction("\n\n".join(slides)[:max_chars], [])
+
+@extractor_registry.register(
+    "xlsx",
+    mime_types=["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"],
+    extensions=[".xlsx", ".xlsm"],
+)
+def extract_xlsx(file_path: str, max_chars: int) -> Extraction:
+    """Sheet names and the workbook's shared strings (labels, headers, text cells)."""
+    with zipfile.ZipFile(file_path) as archive:
+        names = archive.namelist()
+        with archive.open("xl/workbook.xml") as stream:
+            sheets = [element.get("name") for _, element in ElementTree.iterparse(stream)
+                      if _local_name(element.tag) == "sheet"]
+        text = "Sheets: " + ", ".join(name for name in sheets if name)
+        if "xl/sharedStrings.xml" in names:
+            with archive.open("xl/sharedStrings.xml") as stream:
+                text += "\n\n" + _xml_text(stream, max_chars, ["t"], ["si"])
+    return Extraction(text[:max_chars], [])
+
+@extractor_registry.register(
+    "opendocument",
+    mime_types=[
+        "application/vnd.oasis.opendocument.text",
+        "application/vnd.oasis.opendocument.presentation",
+        "application/vnd.oasis.opendocument.spreadsheet",
+    ],
+    extensions=[".odt", ".odp", ".ods"],
+)
+def extract_opendocument(file_path: str, max_chars: int) -> Extraction:
+    with zipfile.ZipFile(file_path) as archive, archive.open("content.xml") as stream:
+        parts: List[str] = []
+        length = 0
+        for _, element in ElementTree.iterparse(stream, events=("end",)):
+            if _local_name(element.tag) in ("p", "h"):
+                line = "".join(element.itertext())
+                parts.append(line)
+                length += len(line) + 1
+                element.clear()
+                if length >= max_chars:
+                    break
+    return Extraction("\n".join(parts)[:max_chars], [])
+
+# Archive members whose start is included after the listing
+ARCHIVE_README = re.compile(r"(^|/)readme(\.(md|txt|rst))?$", re.IGNORECASE)
+ARCHIVE_MAX_MEMBERS = 1000
+
+@extractor_registry.register(
+    "archive",
+    mime_types=[
+        "application/zip",
+        "application/x-zip-compressed",
+        "application/x-tar",
+        "application/gzip",
+        "application/x-gzip",
+        "application/x-bzip2",
+        "application/x-xz",
+    ],
+    extensions=[".zip", ".tar", ".tgz", ".gz", ".bz2", ".xz"],
+    prompt_type="archive",
+)
+def extract_archive(file_path: str, max_chars: int) -> Extraction:
+    """
+    A listing of the archive's members (only the index is read, nothing is
+    unpacked to disk) followed by the start of a README if there is one.
+    """
+    members: List[str] = []
+    readme = ""
+    if zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path) as archive:
+            infos = archive.infolist()
+            for info in infos[:ARCHIVE_MAX_MEMBERS]:
+                members.append(f"{info.filename} ({info.file_size} bytes)")
+            readme_info = next((info for info in infos if ARCHIVE_README.search(info.filename)), None)
+            if readme_info:
+                with archive.open(readme_info) as stream:
+                    readme = stream.read(16 * 1024).decode("utf-8", errors="ignore")
+        total = len(infos)
+    else:
+        # Compressed tars have no index; the listing is read through the stream
+        total = 0
+        try:
+            archive = tarfile.open(file_path, "r:*")
+        except tarfile.ReadError:
+            # A single compressed file such as notes.txt.gz
+            return Extraction(f"Compressed file: {Path(file_path).name}", [])
+        with archive:
+            for info in archive:
+                total += 1
+                if total <= ARCHIVE_MAX_MEMBERS:
+                    members.append(f"{info.name} ({info.size} bytes)")
+                if not readme and info.isfile() and ARCHIVE_README.search(info.name):
+                    stream = archive.extractfile(info)
+                    if stream:
+                        readme = stream.read(16 * 1024).decode("utf-8", errors="ignore")
+
+    text = f"Archive with {total} entries:\n" + "\n".join(members)
+    if total > len(members):
+        text += f"\n... and {total - len(members)} more"
+    if readme:
+        text += f"\n\nREADME:\n{readme}"
+    return Extraction(text[:max_chars], [])
+
+# --- Running extractors ---
+
+def extraction_cache_path(file_path: str) -> str:
+    return file_path + EXTRACTION_CACHE_SUFFIX
+
+def run_extractor(name: str, file_path: str, max_chars: int) -> Extraction:
+    """
+    Runs a registered extractor, reusing the result cached next to the blob
+    when it was produced by the same extractor version. Blobs are never
+    overwritten, so a cached extraction never goes stale otherwise.
+    """
+    extractor = extractor_registry.by_name[name]
+    cache_path = extraction_cache_path(file_path)
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached.get("extractor") == name and cached.get("version") == extractor.version \
+                and cached.get("max_chars", 0) >= max_chars:
+            return Extraction(cached["text"][:max_chars], cached["images"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    extraction = extractor.function(file_path, max_chars)
+    try:
+        # Written under a temporary name so a concurrent reader never sees half a file
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"extractor": name, "version": extractor.version, "max_chars": max_chars,
+                       "text": extraction.text, "images": extraction.images}, f)
+        os.replace(temp_path, cache_path)
+    except OSError as e:
+        print(f"Could not cache extraction for {file_path}: {e}")
+    return extraction
+
+async def extract(file_path: str, content_type: Optional[str] = None, max_chars: Optional[int] = None) -> Optional[Extraction]:
+    """
+    Extracts text or page images from a document without blocking the event
+    loop. Returns None when no extractor handles the file or its dependency
+    is missing; parse errors propagate.
+    """
+    extractor = extractor_registry.resolve(file_path, content_type)
+    if extractor is None:
+        return None
+    max_chars = max_chars or EXTRACTED_TEXT_MAX_CHARS
+    try:
+        return await executors.run_process(run_extractor, extractor.name, file_path, max_chars)
+    except ExtractorUnavailable as e:
+        print(f"Skipping {extractor.name} extraction for {file_path}: {e}")
+        return None
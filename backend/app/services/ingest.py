@@ -0,0 +1,277 @@
+import asyncio
+import json
+import mimetypes
+import os
+import posixpath
+import tarfile
+import uuid
+import zipfile
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import IO, Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import func, insert, select, update
+from sqlmodel import Session
+
+from app.models import ContentItem, ContentStatus
+from app.services.blobs import register_blob
+from app.services.executors import executors
+from app.services.storage import StorageInterface, StoredBlob
+
+# Members stored at the same time
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "16"))
+# Members up to this size are read in one go and stored in parallel; larger
+# ones are streamed to storage one at a time
+INGEST_INLINE_BYTES = int(os.getenv("INGEST_INLINE_BYTES", str(1024 * 1024)))
+# Archives beyond any of these are rejected (413), so a zip bomb can't fill the disk or the database
+INGEST_MAX_MEMBERS = int(os.getenv("INGEST_MAX_MEMBERS", "250000"))
+INGEST_MAX_MEMBER_BYTES = int(os.getenv("INGEST_MAX_MEMBER_BYTES", str(4 * 1024 ** 3)))
+INGEST_MAX_TOTAL_BYTES = int(os.getenv("INGEST_MAX_TOTAL_BYTES", str(16 * 1024 ** 3)))
+# Filenames per IN (...) list when looking up existing versions
+LOOKUP_CHUNK = 500
+STREAM_CHUNK = 1024 * 1024
+
+class ArchiveMember(NamedTuple):
+    name: str
+    size: int
+    stream: Optional[IO[bytes]] # None when the member can't be opened (encrypted, unsupported compression)
+
+class StoredMember(NamedTuple):
+    name: str
+    blob: StoredBlob
+
+class ArchiveLimitError(ValueError):
+    """The archive has too many members, or unpacks to too many bytes."""
+
+def is_ignored(name: str) -> bool:
+    """Directory entries and the metadata macOS and Windows add to archives."""
+    base = posixpath.basename(name)
+    return (
+        name.endswith("/")
+        or name.startswith("__MACOSX/")
+        or base.startswith("._")
+        or base in (".DS_Store", "Thumbs.db", "desktop.ini")
+    )
+
+def iter_members(fileobj: IO[bytes]) -> Iterator[ArchiveMember]:
+    """
+    Regular files in a zip or (compressed) tar, one at a time. Each member's
+    stream must be read before the next one is requested: tars are read as a
+    stream, without seeking. Zips need their central directory, which is at
+    the end, so `fileobj` must be seekable for them.
+    """
+    if zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or is_ignored(info.filename):
+                    continue
+                try:
+                    stream = archive.open(info)
+                except (RuntimeError, NotImplementedError):
+                    yield ArchiveMember(info.filename, info.file_size, None)
+                    continue
+                with stream:
+                    yield ArchiveMember(info.filename, info.file_size, stream)
+        return
+
+    fileobj.seek(0)
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r|*")
+    except tarfile.ReadError as e:
+        raise ValueError("Not a zip or tar archive") from e
+    with archive:
+        for info in archive:
+            if not info.isfile() or is_ignored(info.name):
+                continue
+            yield ArchiveMember(info.name, info.size, archive.extractfile(info))
+
+def normalize_name(name: str) -> str:
+    """Archive paths become item filenames: forward slashes, no leading `./` or `/`."""
+    return posixpath.normpath(name.replace("\\", "/")).lstrip("/")
+
+# Raised by a member that can't be read (corrupt data, bad CRC); the archive itself is still usable
+MEMBER_ERRORS = (zipfile.BadZipFile, zlib.error, RuntimeError, NotImplementedError)
+
+def read_next(members: Iterator[ArchiveMember]) -> Optional[Tuple[ArchiveMember, Optional[bytes]]]:
+    """
+    Advances the archive and reads the member if it is small; `data` is None
+    for large members, which are streamed by the caller. Unreadable members
+    come back with no stream. Runs on a thread: it decompresses.
+    """
+    member = next(members, None)
+    if member is None or member.stream is None or member.size > INGEST_INLINE_BYTES:
+        return member and (member, None)
+    try:
+        return member, member.stream.read()
+    except MEMBER_ERRORS:
+        return member._replace(stream=None), None
+
+def check_limits(count: int, member: ArchiveMember, total_bytes: int):
+    """
+    Checks the members read so far against the INGEST_MAX_* limits. Sizes
+    are the uncompressed ones the archive declares: zipfile and tarfile
+    never return more bytes than that.
+    """
+    if count > INGEST_MAX_MEMBERS:
+        raise ArchiveLimitError(f"Archive has more than {INGEST_MAX_MEMBERS} files")
+    if member.size > INGEST_MAX_MEMBER_BYTES:
+        raise ArchiveLimitError(f"{member.name} unpacks to more than {INGEST_MAX_MEMBER_BYTES} bytes")
+    if total_bytes > INGEST_MAX_TOTAL_BYTES:
+        raise ArchiveLimitError(f"Archive unpacks to more than {INGEST_MAX_TOTAL_BYTES} bytes")
+
+async def store_small(storage: StorageInterface, name: str, data: bytes, written: Dict[str, asyncio.Future]) -> StoredBlob:
+    """Stores a small member. Identical members in one archive are written once."""
+    checksum = await executors.sha256(data)
+    if checksum not in written:
+        written[checksum] = asyncio.ensure_future(storage.save(data, name))
+    storage_path = await written[checksum]
+    return StoredBlob(storage_path, checksum, len(data))
+
+async def store_large(storage: StorageInterface, member: ArchiveMember) -> StoredBlob:
+    async def chunks():
+        while chunk := await executors.run_thread(member.stream.read, STREAM_CHUNK):
+            yield chunk
+    return await storage.save_stream(chunks(), member.name)
+
+async def store_members(storage: StorageInterface, fileobj: IO[bytes],
+                        concurrency: int = INGEST_CONCURRENCY) -> Tuple[List[StoredMember], List[str]]:
+    """
+    Reads the archive member by member and stores each one, up to
+    `concurrency` at once. Returns the stored members in archive order and
+    the names of members that could not be read (e.g. encrypted zip entries).
+    Raises ValueError if the file isn't a zip or tar archive, and
+    ArchiveLimitError once it exceeds a limit; blobs already stored for a
+    rejected archive are deleted.
+    """
+    members = iter_members(fileobj)
+    stored: List[Optional[StoredMember]] = []
+    skipped: List[str] = []
+    total_bytes = 0
+    written: Dict[str, asyncio.Future] = {}
+    slots = asyncio.Semaphore(concurrency)
+    tasks = set()
+
+    async def store(index: int, name: str, data: bytes):
+        try:
+            stored[index] = StoredMember(name, await store_small(storage, name, data, written))
+        finally:
+            slots.release()
+
+    try:
+        while True:
+            await slots.acquire()
+            try:
+                entry = await executors.run_thread(read_next, members)
+            except (tarfile.TarError, EOFError) as e:
+                slots.release()
+                raise ValueError(f"Unreadable archive: {e}") from e
+            if entry is None:
+                slots.release()
+                break
+            member, data = entry
+            name = normalize_name(member.name)
+            total_bytes += member.size
+            check_limits(len(stored) + len(skipped) + 1, member._replace(name=name), total_bytes)
+            if member.stream is None:
+                skipped.append(name)
+                slots.release()
+                continue
+            stored.append(None)
+            if data is not None:
+                task = asyncio.create_task(store(len(stored) - 1, name, data))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                continue
+            # Large members hold the archive stream: store them before reading on
+            try:
+                stored[-1] = StoredMember(name, await store_large(storage, member._replace(name=name)))
+            except MEMBER_ERRORS:
+                skipped.append(name)
+            finally:
+                slots.release()
+        await asyncio.gather(*tasks)
+    except ValueError:
+        # Nothing of a rejected archive is imported: let the writes in flight finish, then drop every blob
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await storage.adelete_many(sorted({member.blob.storage_path for member in stored if member is not None}))
+        raise
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return [member for member in stored if member is not None], skipped
+
+def latest_versions(session: Session, names: List[str]) -> Dict[str, int]:
+    """Current highest version of each filename, looked up in chunks."""
+    versions: Dict[str, int] = {}
+    unique = list(dict.fromkeys(names))
+    for start in range(0, len(unique), LOOKUP_CHUNK):
+        chunk = unique[start:start + LOOKUP_CHUNK]
+        rows = session.execute(
+            select(ContentItem.original_filename, func.max(ContentItem.version))
+            .where(ContentItem.original_filename.in_(chunk))
+            .group_by(ContentItem.original_filename)
+        ).all()
+        versions.update({name: version for name, version in rows})
+    return versions
+
+def create_content_items(session: Session, members: List[StoredMember], metadata: Dict[str, Any]) -> Tuple[List[ContentItem], List[str]]:
+    """
+    Registers every stored member as one write transaction (run it through
+    `db_writer`): blob references are taken once per distinct checksum,
+    versions are assigned from one lookup per chunk of filenames, and the
+    rows go in with a single executemany. Returns the new items and the
+    storage paths that turned out to duplicate an existing blob.
+    """
+    references: Dict[str, int] = defaultdict(int)
+    first_blob: Dict[str, StoredBlob] = {}
+    for member in members:
+        references[member.blob.checksum] += 1
+        first_blob.setdefault(member.blob.checksum, member.blob)
+
+    blob_paths = {
+        checksum: register_blob(session, checksum, blob.storage_path, blob.size, references[checksum])
+        for checksum, blob in first_blob.items()
+    }
+    duplicates = sorted({
+        member.blob.storage_path for member in members
+        if blob_paths[member.blob.checksum] != member.blob.storage_path
+    })
+
+    versions = latest_versions(session, [member.name for member in members])
+    names = list(versions)
+    for start in range(0, len(names), LOOKUP_CHUNK):
+        session.execute(
+            update(ContentItem)
+            .where(ContentItem.original_filename.in_(names[start:start + LOOKUP_CHUNK]))
+            .where(ContentItem.is_latest == True)
+            .values(is_latest=False)
+            .execution_options(synchronize_session=False)
+        )
+
+    # The last copy of a name inside the archive is its latest version
+    last_index = {member.name: index for index, member in enumerate(members)}
+    metadata_json = json.dumps(metadata)
+    now = datetime.utcnow()
+    items = []
+    for index, member in enumerate(members):
+        versions[member.name] = versions.get(member.name, 0) + 1
+        items.append(ContentItem(
+            id=uuid.uuid4(),
+            original_filename=member.name,
+            storage_path=blob_paths[member.blob.checksum],
+            status=ContentStatus.UNPROCESSED,
+            metadata_json=metadata_json,
+            version=versions[member.name],
+            content_type=mimetypes.guess_type(member.name)[0],
+            checksum=member.blob.checksum,
+            created_at=now,
+            is_latest=last_index[member.name] == index,
+        ))
+    if items:
+        # Generated columns (e.g. sentiment) can't be written
+        generated = {column.name for column in ContentItem.__table__.columns if column.computed is not None}
+        session.execute(insert(ContentItem), [item.model_dump(exclude=generated) for item in items])
+    session.commit()
+    return items, duplicates
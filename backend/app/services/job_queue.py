@@ -0,0 +1,73 @@
+import asyncio
+import uuid
+from typing import List, Optional, Set
+from app.services.metrics import QUEUE_DEPTH
+
+class JobQueue:
+    """
+    In-process queue of item ids waiting to be tagged.
+
+    The API pushes freshly created items here so the worker can start on them
+    immediately instead of discovering them by polling the database.
+    """
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._pending: Set[uuid.UUID] = set()
+        # Turned off in API processes without a worker: standalone workers claim from the database
+        self.accepting = True
+
+    def enqueue(self, item_id: uuid.UUID) -> bool:
+        """Adds an item to the queue. Returns False if it is already pending or the queue isn't in use."""
+        if not self.accepting or item_id in self._pending:
+            return False
+        self._pending.add(item_id)
+        self._queue.put_nowait(item_id)
+        return True
+
+    async def get(self) -> uuid.UUID:
+        """Waits for the next item id. Call `task_done` once it has been handled."""
+        return await self._queue.get()
+
+    def get_nowait(self) -> Optional[uuid.UUID]:
+        """Returns the next item id if one is waiting, otherwise None."""
+        try:
+            return self._queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return None
+
+    def requeue(self, item_id: uuid.UUID):
+        """Puts back an item taken with `get`/`get_nowait` that this consumer can't handle."""
+        self._queue.task_done()
+        self._queue.put_nowait(item_id)
+
+    async def get_batch(self, max_items: int, max_wait: float) -> List[uuid.UUID]:
+        """
+        Waits for one item id, then collects more for up to `max_wait` seconds
+        or until `max_items` are gathered. Call `task_done` for each of them.
+        """
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_wait
+        while len(batch) < max_items:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def task_done(self, item_id: uuid.UUID):
+        self._pending.discard(item_id)
+        self._queue.task_done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+# Global instances
+job_queue = JobQueue()
+index_queue = JobQueue() # TAGGED items waiting for their embedding
+
+QUEUE_DEPTH.labels("tagging").set_function(job_queue.qsize)
+QUEUE_DEPTH.labels("indexing").set_function(index_queue.qsize)
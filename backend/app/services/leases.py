@@ -0,0 +1,222 @@
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import and_, or_, update, select
+from sqlmodel import Session
+
+from app.models import ContentItem, ContentStatus
+
+# How long a claim stays valid without being renewed
+LEASE_SECONDS = float(os.getenv("WORKER_LEASE_SECONDS", "300"))
+# Failed items are retried after RETRY_BASE_SECONDS, doubling per attempt up to
+# RETRY_MAX_SECONDS, and marked FAILED after MAX_ATTEMPTS
+MAX_ATTEMPTS = int(os.getenv("WORKER_MAX_ATTEMPTS", "5"))
+RETRY_BASE_SECONDS = float(os.getenv("WORKER_RETRY_BASE_SECONDS", "30"))
+RETRY_MAX_SECONDS = float(os.getenv("WORKER_RETRY_MAX_SECONDS", "3600"))
+
+def new_owner_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def retry_delay(attempts: int) -> float:
+    """
+    Exponential backoff with jitter: between half and all of the capped
+    delay, so items that failed together (e.g. during an outage) don't all
+    come back at the same moment.
+    """
+    delay = min(RETRY_BASE_SECONDS * 2 ** max(0, attempts - 1), RETRY_MAX_SECONDS)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+class LeaseManager:
+    """
+    Claims items for one worker process so several processes can share the
+    queue. A claim is a single `UPDATE ... RETURNING` that moves an item to
+    PROCESSING with this owner and an expiry; SQLite's single writer makes
+    it atomic across processes. Leases are renewed while the process is
+    alive, so a crashed worker's items become claimable once they expire.
+
+    Methods take the caller's session and commit; run them on `db_writer`.
+    `has_waiting` and `holds_any` only read, so an idle worker can poll
+    them on `db_reader` without taking the write lock.
+    """
+    def __init__(self, owner: Optional[str] = None, lease_seconds: Optional[float] = None):
+        self.owner = owner or new_owner_id()
+        self.lease_seconds = lease_seconds if lease_seconds is not None else LEASE_SECONDS
+
+    def _claimable(self, now: datetime):
+        # Unclaimed items whose retry time (if any) has passed, expired leases, and our own leases
+        return and_(
+            ContentItem.status.in_([ContentStatus.UNPROCESSED, ContentStatus.PROCESSING]),
+            or_(
+                ContentItem.lease_expires_at.is_(None),
+                ContentItem.lease_expires_at < now,
+                ContentItem.lease_owner == self.owner,
+            ),
+        )
+
+    def _claim(self, session: Session, condition, now: datetime) -> List[uuid.UUID]:
+        statement = (
+            update(ContentItem)
+            .where(condition)
+            .where(self._claimable(now))
+            .values(
+                status=ContentStatus.PROCESSING,
+                lease_owner=self.owner,
+                lease_expires_at=now + timedelta(seconds=self.lease_seconds),
+            )
+            .returning(ContentItem.id)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = list(session.execute(statement).scalars())
+        session.commit()
+        return claimed
+
+    def claim(self, session: Session, item_id: uuid.UUID) -> bool:
+        """Claims one item, e.g. one pushed onto the in-process queue by an upload."""
+        return bool(self._claim(session, ContentItem.id == item_id, datetime.utcnow()))
+
+    def _waiting(self, now: datetime):
+        # Claimable items this process doesn't hold yet
+        return select(ContentItem.id).where(self._claimable(now)).where(
+            or_(ContentItem.lease_owner.is_(None), ContentItem.lease_owner != self.owner)
+        )
+
+    def has_waiting(self, session: Session) -> bool:
+        """Read-only check for anything `claim_batch` would claim; run it on `db_reader`."""
+        return session.execute(select(self._waiting(datetime.utcnow()).exists())).scalar()
+
+    def holds_any(self, session: Session) -> bool:
+        """Read-only check for leases `renew` would extend; run it on `db_reader`."""
+        return session.execute(select(
+            select(ContentItem.id)
+            .where(ContentItem.status == ContentStatus.PROCESSING)
+            .where(ContentItem.lease_owner == self.owner)
+            .exists()
+        )).scalar()
+
+    def claim_batch(self, session: Session, limit: int) -> List[uuid.UUID]:
+        """Claims up to `limit` of the oldest claimable items."""
+        now = datetime.utcnow()
+        oldest = self._waiting(now).order_by(ContentItem.created_at).limit(limit)
+        return self._claim(session, ContentItem.id.in_(oldest), now)
+
+    def renew(self, session: Session) -> int:
+        """Extends every lease this process holds. Returns the number renewed."""
+        result = session.execute(
+            update(ContentItem)
+            .where(ContentItem.lease_owner == self.owner)
+            .where(ContentItem.status == ContentStatus.PROCESSING)
+            .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        return result.rowcount
+
+    def holds(self, session: Session, item_id: uuid.UUID) -> bool:
+        owner = session.execute(
+            select(ContentItem.lease_owner).where(ContentItem.id == item_id)
+        ).scalar_one_or_none()
+        return owner == self.owner
+
+    def release(self, session: Session, item_ids: List[uuid.UUID], retry_after: Optional[float] = None):
+        """
+        Hands items this process still holds back as UNPROCESSED, e.g. after
+        tagging failed. They can be claimed again after `retry_after` seconds
+        (one lease period by default), so a failing item doesn't spin.
+        """
+        delay = self.lease_seconds if retry_after is None else retry_after
+        session.execute(
+            update(ContentItem)
+            .where(ContentItem.id.in_(item_ids))
+            .where(ContentItem.lease_owner == self.owner)
+            .where(ContentItem.status == ContentStatus.PROCESSING)
+            .values(
+                status=ContentStatus.UNPROCESSED,
+                lease_owner=None,
+                lease_expires_at=datetime.utcnow() + timedelta(seconds=delay),
+            )
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+
+    def fail(self, session: Session, item_id: uuid.UUID, error: str, transient: bool = True) -> Optional[ContentStatus]:
+        """
+        Records a failed tagging attempt on an item this process holds.
+        Transient failures are retried after `retry_delay`; permanent ones,
+        and the MAX_ATTEMPTS-th failure, move the item to FAILED. Returns the
+        new status, or None if the item is no longer PROCESSING under this
+        owner: deleted, taken over, tagged elsewhere or marked by a bulk delete.
+        """
+        attempts = session.execute(
+            select(ContentItem.attempts).where(ContentItem.id == item_id)
+        ).scalar_one_or_none()
+        if attempts is None:
+            return None
+        attempts += 1
+        now = datetime.utcnow()
+        if transient and attempts < MAX_ATTEMPTS:
+            status, retry_at = ContentStatus.UNPROCESSED, now + timedelta(seconds=retry_delay(attempts))
+        else:
+            status, retry_at = ContentStatus.FAILED, None
+        result = session.execute(
+            update(ContentItem)
+            .where(ContentItem.id == item_id)
+            .where(ContentItem.status == ContentStatus.PROCESSING)
+            .where(ContentItem.lease_owner == self.owner)
+            .values(
+                status=status,
+                attempts=attempts,
+                last_error=error[:2000],
+                lease_owner=None,
+                lease_expires_at=retry_at,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        return status if result.rowcount else None
+
+    def requeue(self, session: Session, item_id: uuid.UUID) -> bool:
+        """
+        Makes a FAILED item, or one waiting for its retry time, claimable
+        right away with a fresh attempt budget. Items being tagged are left alone.
+        """
+        return bool(self.requeue_many(session, [item_id]))
+
+    def requeue_many(self, session: Session, item_ids: List[uuid.UUID]) -> List[uuid.UUID]:
+        """`requeue` for several items at once. Returns the ids that were requeued."""
+        requeued = list(session.execute(
+            update(ContentItem)
+            .where(ContentItem.id.in_(item_ids))
+            .where(or_(
+                ContentItem.status == ContentStatus.FAILED,
+                and_(ContentItem.status == ContentStatus.UNPROCESSED, ContentItem.lease_owner.is_(None)),
+            ))
+            .values(status=ContentStatus.UNPROCESSED, attempts=0, last_error=None, lease_expires_at=None)
+            .returning(ContentItem.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        session.commit()
+        return requeued
+
+    def reset(self, session: Session, item_ids: List[uuid.UUID]) -> List[uuid.UUID]:
+        """
+        Sends items back to be tagged again whatever their state, with a fresh
+        attempt budget. A worker tagging one of them loses its lease, so its
+        result is discarded. Items being deleted are left alone. Returns the
+        ids that were reset.
+        """
+        reset = list(session.execute(
+            update(ContentItem)
+            .where(ContentItem.id.in_(item_ids))
+            .where(ContentItem.status != ContentStatus.DELETING)
+            .values(status=ContentStatus.UNPROCESSED, attempts=0, last_error=None, lease_owner=None, lease_expires_at=None)
+            .returning(ContentItem.id)
+            .execution_options(synchronize_session=False)
+        ).scalars())
+        session.commit()
+        return reset
+
+# Global instance
+leases = LeaseManager()
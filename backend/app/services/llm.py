@@ -1,14 +1,57 @@
-from litellm import acompletion, get_max_tokens, token_counter
+from litellm import acompletion, get_max_tokens
+from litellm.exceptions import BadRequestError, RateLimitError, UnprocessableEntityError
 import json
+import logging
 import os
-import base64
-from typing import Dict, Any, Optional
+import time
+from functools import lru_cache
+from typing import Dict, Any, List, NamedTuple, Optional, Union
 from pathlib import Path
+from app.services.rate_limiter import rate_limiters
+from app.services.prompts import PromptRegistry, prompt_registry
+from app.services.truncation import CHARS_PER_TOKEN_BOUND, count_tokens, truncate
+from app.services.executors import executors
+from app.services.metrics import GENERATE_METADATA_SECONDS, LLM_REQUEST_SECONDS, LLM_TOKENS
+from app.services.extractors import extract, extractor_registry, prepare_image, read_text_excerpt
+
+logger = logging.getLogger(__name__)
+
+# The provider rejected this particular request (too long, refused by a
+# content filter, malformed); sending it again will fail the same way
+PERMANENT_ERRORS = (BadRequestError, UnprocessableEntityError)
+
+class TaggingError(Exception):
+    """
+    The LLM could not tag a file. Transient errors (rate limits that outlasted
+    the retries, timeouts, outages, unparsable answers) are worth another
+    attempt later; permanent ones are not.
+    """
+    def __init__(self, message: str, transient: bool = True):
+        super().__init__(message)
+        self.transient = transient
+
+class BatchResult(NamedTuple):
+    metadata: Union[Dict[str, Any], TaggingError]
+    # Fingerprint of the prompt that produced it: the batched prompt, or the
+    # single-file one for files retried alone. Cached results are keyed by it
+    prompt_version: str
+
+@lru_cache(maxsize=128)
+def prompt_tokens(prompt: str, model: str) -> int:
+    """Token count of an assembled prompt; the same few prompts are sent over and over."""
+    return count_tokens(prompt, model)
 
 class LLMService:
     def __init__(self, model: str = "gpt-3.5-turbo"):
         self.model = model
-        self.prompts_dir = Path(__file__).parent.parent / "prompts"
+        self.rate_limiter = rate_limiters.get(model)
+        self.max_rate_limit_retries = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "5"))
+        # Text files up to this size may be tagged together in one request
+        self.batch_max_bytes = int(os.getenv("LLM_BATCH_MAX_BYTES", "8192"))
+        # Response tokens reserved per file in a batched request
+        self.batch_response_tokens = int(os.getenv("LLM_BATCH_RESPONSE_TOKENS", "150"))
+        self.prompts = prompt_registry
+        self.truncation_strategy = os.getenv("LLM_TRUNCATION_STRATEGY", "head")
         self.type_mapping = {
             ".txt": "text",
             ".md": "text",
@@ -25,33 +68,44 @@ class LLMService:
     def _get_type_for_extension(self, extension: str) -> str:
         return self.type_mapping.get(extension.lower(), "default")
 
-    def _load_prompt_config(self, file_type: str) -> str:
-        base_instr = (self.prompts_dir / "base_instructions.md").read_text()
-        schema = (self.prompts_dir / "common_schema.json").read_text()
-        
-        type_file = self.prompts_dir / "types" / f"{file_type}.md"
-        if not type_file.exists():
-            type_file = self.prompts_dir / "types" / "default.md"
-        
-        type_instr = type_file.read_text()
-        
-        prompt = f"""
-{base_instr}
+    def _get_type(self, file_path: str, content_type: Optional[str] = None) -> str:
+        """
+        Prompt type for a file: documents with a registered extractor first,
+        then the extension mapping, then the top-level MIME type.
+        """
+        extractor = extractor_registry.resolve(file_path, content_type)
+        if extractor:
+            return extractor.prompt_type
+        file_type = self._get_type_for_extension(Path(file_path).suffix)
+        if file_type == "default" and content_type:
+            if content_type.startswith("text/"):
+                return "text"
+            if content_type.startswith("image/"):
+                return "image"
+        return file_type
 
-Type-Specific Instructions:
-{type_instr}
+    @property
+    def prompts_dir(self) -> Path:
+        return self.prompts.prompts_dir
 
-Required JSON Schema:
-{schema}
+    @prompts_dir.setter
+    def prompts_dir(self, prompts_dir: Path):
+        self.prompts = PromptRegistry(prompts_dir)
 
-JSON Result:
-"""
-        return prompt
+    def _load_prompt_config(self, file_type: str, batch: bool = False) -> str:
+        return self.prompts.get(file_type, batch).text
 
-    def _truncate_content(self, prompt: str, content: str, model: str) -> str:
+    def get_prompt_version(self, file_path: str, content_type: Optional[str] = None, batch: bool = False) -> str:
         """
-        Dynamically truncate content based on model context window and prompt size.
+        Fingerprint of every prompt file used for this file's type (with
+        `batch`, of the multi-file prompt it is tagged with in a batch).
+        Cached results keyed by it are invalidated as soon as a prompt changes.
         """
+        file_type = self._get_type(file_path, content_type)
+        return self.prompts.get(file_type, batch).fingerprint
+
+    def _available_tokens(self, model: str) -> int:
+        """Context window left for file content once instructions and the response are reserved."""
         try:
             max_tokens = get_max_tokens(model) or 4096
         except Exception:
@@ -59,45 +113,258 @@ JSON Result:
             
         # Reserved for instructions and response (approx 1500 tokens)
         reserve_tokens = 1500
-        available_tokens = max_tokens - reserve_tokens
+        return max_tokens - reserve_tokens
+
+    def _truncate_content(self, prompt: str, content: str, model: str) -> str:
+        """
+        Cuts content at the exact token boundary where prompt plus content
+        fill the model's context window (minus the reserve), using the
+        LLM_TRUNCATION_STRATEGY (head, head_tail or sections).
+        """
+        available_tokens = self._available_tokens(model)
         
         if available_tokens <= 0:
             return content[:1000] # Extreme fallback
             
-        # Quick check: 1 token approx 4 chars
-        if len(content) < available_tokens * 4:
-            return content
-            
         try:
-            # Iterative truncation
-            current_tokens = token_counter(model=model, text=f"{prompt}\n\n{content}")
-            if current_tokens <= available_tokens:
-                return content
-            
-            # Simple binary search or heuristic for truncation
-            # For simplicity, we'll start with a safe multiplier
-            char_limit = available_tokens * 3 
-            return content[:char_limit]
+            budget = available_tokens - prompt_tokens(prompt, model)
+            return truncate(content, budget, model, self.truncation_strategy)
         except Exception:
             # Fallback to character-based heuristic
             return content[: available_tokens * 2]
 
-    async def generate_metadata(self, file_path: str, content_text: Optional[str] = None) -> Dict[str, Any]:
+    def _read_text(self, file_path: str) -> str:
+        """
+        Reads no more of the file than truncation could keep, so memory use
+        doesn't depend on the file size.
+        """
+        max_bytes = max(self._available_tokens(self.model), 1000) * CHARS_PER_TOKEN_BOUND
+        return read_text_excerpt(file_path, max_bytes, self.truncation_strategy)
+
+    def _estimate_tokens(self, messages: list) -> int:
+        """
+        Cheap token estimate used for the tokens/min budget (1 token ~ 4 chars).
+        Images are counted at a flat rate since their cost depends on the provider.
+        """
+        total = 0
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                total += len(content) // 4
+                continue
+            for part in content:
+                if part["type"] == "text":
+                    total += len(part["text"]) // 4
+                else:
+                    total += 1000
+        return total
+
+    def _retry_after(self, error: RateLimitError, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return min(2 ** attempt, 60)
+
+    async def _completion(self, messages: list, api_base: Optional[str], file_type: str):
+        """
+        Calls the model within its rate limits. A 429 pauses every caller of
+        this model for the retry-after period before trying again. Each
+        request's latency and token usage is recorded under `file_type`.
+        """
+        estimated_tokens = self._estimate_tokens(messages)
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire(estimated_tokens)
+            start = time.perf_counter()
+            try:
+                response = await acompletion(
+                    model=self.model,
+                    api_base=api_base,
+                    messages=messages,
+                )
+            except RateLimitError as e:
+                LLM_REQUEST_SECONDS.labels(self.model, file_type, "rate_limited").observe(time.perf_counter() - start)
+                if attempt >= self.max_rate_limit_retries:
+                    raise
+                delay = self._retry_after(e, attempt)
+                logger.warning(f"Rate limited by {self.model}, backing off for {delay:.1f}s")
+                self.rate_limiter.backoff(delay)
+                attempt += 1
+            except Exception:
+                LLM_REQUEST_SECONDS.labels(self.model, file_type, "error").observe(time.perf_counter() - start)
+                raise
+            else:
+                LLM_REQUEST_SECONDS.labels(self.model, file_type, "ok").observe(time.perf_counter() - start)
+                self._record_usage(response, file_type)
+                return response
+
+    def _record_usage(self, response: Any, file_type: str):
+        usage = getattr(response, "usage", None)
+        for kind in ("prompt", "completion"):
+            tokens = getattr(usage, f"{kind}_tokens", None)
+            # Some providers (and local models) don't report usage
+            if isinstance(tokens, int):
+                LLM_TOKENS.labels(self.model, file_type, kind).observe(tokens)
+
+    def _parse_json(self, content: str, opener: str, closer: str) -> Any:
+        """Robust JSON extraction: strips code fences and text around the outermost brackets."""
+        content = content.strip()
+        if "```json" in content:
+            content = content.split("```json")[1].split("```")[0].strip()
+        elif "```" in content:
+            content = content.split("```")[1].split("```")[0].strip()
+        
+        if opener in content and closer in content:
+            start_index = content.find(opener)
+            end_index = content.rfind(closer)
+            if start_index != -1 and end_index != -1:
+                content = content[start_index:end_index+1]
+
+        return json.loads(content)
+
+    def is_batchable(self, file_path: str, content_type: Optional[str] = None) -> bool:
+        """Small text files can share a request with others (see `generate_metadata_batch`)."""
+        if self._get_type(file_path, content_type) != "text":
+            return False
+        try:
+            return os.path.getsize(file_path) <= self.batch_max_bytes
+        except OSError:
+            return False
+
+    def _pack_batches(self, prompt: str, sections: List[str]) -> List[List[int]]:
+        """
+        Groups section indexes into requests that fit the model's context
+        window, keeping room for one response object per file.
+        """
+        budget = self._available_tokens(self.model) - len(prompt) // 4
+        batches: List[List[int]] = []
+        current: List[int] = []
+        used = 0
+        for index, section in enumerate(sections):
+            cost = len(section) // 4 + self.batch_response_tokens
+            if current and used + cost > budget:
+                batches.append(current)
+                current, used = [], 0
+            current.append(index)
+            used += cost
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _generate_or_error(self, file_path: str, content_type: Optional[str] = None) -> BatchResult:
+        version = self.get_prompt_version(file_path, content_type)
+        try:
+            return BatchResult(await self.generate_metadata(file_path, content_type=content_type), version)
+        except TaggingError as e:
+            return BatchResult(e, version)
+
+    async def generate_metadata_batch(self, file_paths: List[str],
+                                      content_types: Optional[List[Optional[str]]] = None) -> List[BatchResult]:
+        """
+        Tags several small text files with as few requests as the context
+        window allows: the instructions and schema are sent once per request
+        and the model answers with a JSON array keyed by file id. Files missing
+        from an answer, or whose request cannot be parsed, are retried one at
+        a time with `generate_metadata`. Results are in the order of `file_paths`;
+        a file that could not be tagged gets its `TaggingError` instead. Each
+        result records which prompt produced it. `content_types` (parallel to
+        `file_paths`) picks the prompt for files retried alone, as for
+        `generate_metadata`.
+        """
+        content_types = content_types or [None] * len(file_paths)
+        if len(file_paths) == 1:
+            return [await self._generate_or_error(file_paths[0], content_types[0])]
+
+        compiled = self.prompts.get("text", batch=True)
+        prompt = compiled.text
+        sections = []
+        for index, file_path in enumerate(file_paths):
+            try:
+                content_text = self._read_text(file_path)
+            except Exception as e:
+                print(f"Error reading text file {file_path}: {e}")
+                content_text = ""
+            sections.append(f"=== FILE {index + 1}: {Path(file_path).name} ===\n{content_text}")
+
+        api_base = os.getenv("LITELLM_URL")
+        results: List[Optional[BatchResult]] = [None] * len(file_paths)
+        for batch in self._pack_batches(prompt, sections):
+            if len(batch) == 1:
+                continue
+            messages = [{"role": "user", "content": prompt + "\n\n" + "\n\n".join(sections[i] for i in batch)}]
+            try:
+                response = await self._completion(messages, api_base, "text_batch")
+                answers = self._parse_json(response.choices[0].message.content, "[", "]")
+            except Exception as e:
+                print(f"LLM batch error, falling back to single requests: {e}")
+                continue
+            if not isinstance(answers, list):
+                continue
+            wanted = {str(i + 1) for i in batch}
+            for answer in answers:
+                if not isinstance(answer, dict):
+                    continue
+                # Accept 3, "3" or "FILE 3"
+                file_id = "".join(ch for ch in str(answer.pop("file", "")) if ch.isdigit())
+                if file_id in wanted:
+                    results[int(file_id) - 1] = BatchResult(answer, compiled.fingerprint)
+
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = await self._generate_or_error(file_paths[index], content_types[index])
+        return results
+
+    async def generate_metadata(self, file_path: str, content_text: Optional[str] = None,
+                                content_type: Optional[str] = None) -> Dict[str, Any]:
         """
         Generates metadata for the given file, using vision for images if supported.
+        PDFs, office documents and archives go through their extractor first
+        (see `app.services.extractors`). Raises `TaggingError` when the LLM
+        call fails or its answer can't be parsed.
         """
-        ext = Path(file_path).suffix
-        file_type = self._get_type_for_extension(ext)
+        file_type = self._get_type(file_path, content_type)
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            metadata = await self._generate_metadata(file_path, file_type, content_text, content_type)
+            outcome = "ok"
+            return metadata
+        finally:
+            GENERATE_METADATA_SECONDS.labels(self.model, file_type, outcome).observe(time.perf_counter() - start)
+
+    async def _generate_metadata(self, file_path: str, file_type: str, content_text: Optional[str],
+                                 content_type: Optional[str]) -> Dict[str, Any]:
         prompt = self._load_prompt_config(file_type)
         
         api_base = os.getenv("LITELLM_URL")
         messages = []
 
-        if file_type == "image":
+        page_images: List[str] = []
+        if content_text is None and file_type not in ("text", "image", "default"):
+            try:
+                extraction = await extract(file_path, content_type)
+                if extraction:
+                    content_text = extraction.text
+                    page_images = extraction.images
+            except Exception as e:
+                print(f"Error extracting {file_path}: {e}")
+
+        if page_images:
+            # Scanned document: the pages go to the vision model
+            messages = [
+                {
+                    "role": "user",
+                    "content": [{"type": "text", "text": f"{prompt}\nFilename: {Path(file_path).name}"}]
+                    + [{"type": "image_url", "image_url": {"url": url}} for url in page_images]
+                }
+            ]
+        elif file_type == "image":
             # Vision request
             try:
-                with open(file_path, "rb") as image_file:
-                    base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+                # Decoding, resizing and base64 happen in a worker process
+                image = await executors.run_process(prepare_image, file_path)
                 
                 messages = [
                     {
@@ -107,7 +374,7 @@ JSON Result:
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}"
+                                    "url": image.data_url
                                 }
                             }
                         ]
@@ -119,10 +386,9 @@ JSON Result:
                 messages = [{"role": "user", "content": f"{prompt}\nFilename: {Path(file_path).name}"}]
         else:
             # Text request: if no content provided, try to read it
-            if not content_text:
+            if not content_text and file_type in ("text", "default"):
                 try:
-                    with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                        content_text = f.read()
+                    content_text = self._read_text(file_path)
                 except Exception as e:
                     print(f"Error reading text file {file_path}: {e}")
             
@@ -139,31 +405,11 @@ JSON Result:
             ]
 
         try:
-            response = await acompletion(
-                model=self.model,
-                api_base=api_base,
-                messages=messages,
-            )
-            
-            content = response.choices[0].message.content.strip()
-            
-            # Robust JSON extraction
-            if "```json" in content:
-                content = content.split("```json")[1].split("```")[0].strip()
-            elif "```" in content:
-                content = content.split("```")[1].split("```")[0].strip()
-            
-            if "{" in content and "}" in content:
-                start_index = content.find("{")
-                end_index = content.rfind("}")
-                if start_index != -1 and end_index != -1:
-                    content = content[start_index:end_index+1]
-
-            return json.loads(content)
+            response = await self._completion(messages, api_base, file_type)
+            metadata = self._parse_json(response.choices[0].message.content, "{", "}")
         except Exception as e:
             print(f"LLM Error: {e}")
-            return {
-                "error": str(e),
-                "tags": ["processing-failed"],
-                "processing_notes": f"Attempted file: {Path(file_path).name}"
-            }
+            raise TaggingError(f"{type(e).__name__}: {e}", transient=not isinstance(e, PERMANENT_ERRORS)) from e
+        if not isinstance(metadata, dict):
+            raise TaggingError(f"Expected a JSON object, got {type(metadata).__name__}")
+        return metadata
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy import func, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlmodel import Session, select, delete
+from app.models import LLMCacheEntry
+from app.services.metrics import LLM_CACHE_LOOKUPS
+
+class LLMCache:
+    """
+    Persistent cache of LLM metadata keyed by (content checksum, prompt
+    version, model). Least recently used entries are evicted once the table
+    grows past LLM_CACHE_MAX_ENTRIES rows or LLM_CACHE_MAX_BYTES of JSON;
+    the limits are checked by `put` at most every LLM_CACHE_EVICT_INTERVAL
+    seconds, so the table can overshoot by the results stored in between.
+    """
+    def __init__(self):
+        self.max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "100000"))
+        self.max_bytes = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+        self.evict_interval = float(os.getenv("LLM_CACHE_EVICT_INTERVAL", "60"))
+        self._next_eviction = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session: Session, checksum: str, prompt_hash: str, model: str,
+            alternatives: Sequence[str] = ()) -> Optional[Dict[str, Any]]:
+        """
+        Looks up a result without writing anything, so it can run on a
+        reader session; record the use with `touch` in the write transaction.
+        `alternatives` are other prompt versions whose results are just as
+        good (the batched prompt for the same type), tried in order.
+        """
+        entry = None
+        for version in (prompt_hash, *alternatives):
+            entry = session.get(LLMCacheEntry, (checksum, version, model))
+            if entry is not None:
+                break
+        if entry is None:
+            self.misses += 1
+            LLM_CACHE_LOOKUPS.labels("miss").inc()
+            return None
+
+        self.hits += 1
+        LLM_CACHE_LOOKUPS.labels("hit").inc()
+        return json.loads(entry.metadata_json)
+
+    def touch(self, session: Session, checksum: str, prompt_hash: str, model: str, alternatives: Sequence[str] = ()):
+        """Marks the entries `get` would return as just used, for LRU eviction; the caller commits."""
+        session.exec(
+            update(LLMCacheEntry)
+            .where(LLMCacheEntry.checksum == checksum, LLMCacheEntry.prompt_hash.in_([prompt_hash, *alternatives]),
+                   LLMCacheEntry.model == model)
+            .values(last_used_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def contains(self, session: Session, checksum: str, prompt_hash: str, model: str, alternatives: Sequence[str] = ()) -> bool:
+        """Checks for an entry without counting a hit or refreshing it."""
+        return any(session.get(LLMCacheEntry, (checksum, version, model)) is not None for version in (prompt_hash, *alternatives))
+
+    def put(self, session: Session, checksum: str, prompt_hash: str, model: str, metadata: Dict[str, Any]):
+        """Stores a result; the caller commits. Concurrent writers of the same key simply overwrite."""
+        metadata_json = json.dumps(metadata)
+        now = datetime.utcnow()
+        statement = insert(LLMCacheEntry).values(
+            checksum=checksum,
+            prompt_hash=prompt_hash,
+            model=model,
+            metadata_json=metadata_json,
+            size=len(metadata_json),
+            created_at=now,
+            last_used_at=now,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["checksum", "prompt_hash", "model"],
+            set_={"metadata_json": metadata_json, "size": len(metadata_json), "last_used_at": now},
+        )
+        session.exec(statement)
+        # Counting and summing the whole table on every put would cost more than the insert
+        if time.monotonic() >= self._next_eviction:
+            self._next_eviction = time.monotonic() + self.evict_interval
+            self.evict(session)
+
+    def evict(self, session: Session):
+        """Drops least recently used entries until both limits are respected."""
+        count, total_size = session.exec(
+            select(func.count(), func.coalesce(func.sum(LLMCacheEntry.size), 0))
+        ).one()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+
+        excess_entries = max(0, count - self.max_entries)
+        excess_bytes = total_size - self.max_bytes
+        victims = []
+        oldest_first = select(
+            LLMCacheEntry.checksum, LLMCacheEntry.prompt_hash, LLMCacheEntry.model, LLMCacheEntry.size
+        ).order_by(LLMCacheEntry.last_used_at)
+        for checksum, prompt_hash, model, size in session.exec(oldest_first):
+            if len(victims) >= excess_entries and excess_bytes <= 0:
+                break
+            victims.append((checksum, prompt_hash, model))
+            excess_bytes -= size
+
+        for checksum, prompt_hash, model in victims:
+            session.exec(delete(LLMCacheEntry).where(
+                LLMCacheEntry.checksum == checksum,
+                LLMCacheEntry.prompt_hash == prompt_hash,
+                LLMCacheEntry.model == model,
+            ))
+
+    def invalidate(self, session: Session, checksums: List[str]):
+        """Drops every cached result for these contents, whatever the prompt or model; the caller commits."""
+        if checksums:
+            session.exec(delete(LLMCacheEntry).where(LLMCacheEntry.checksum.in_(checksums)))
+
+    def stats(self, session: Session) -> Dict[str, Any]:
+        count, total_size = session.exec(
+            select(func.count(), func.coalesce(func.sum(LLMCacheEntry.size), 0))
+        ).one()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "size_bytes": total_size,
+        }
+
+# Global instance
+llm_cache = LLMCache()
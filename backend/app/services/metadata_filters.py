@@ -0,0 +1,51 @@
+import re
+from typing import Any, Dict, List, Optional
+from sqlalchemy import String, literal_column, select
+
+from app.models import ContentItem, ItemTag, metadata_field
+from app.services.search import normalize_tag
+
+# common_schema.json keys with an indexed generated column on ContentItem
+PROMOTED_KEYS = {"sentiment": ContentItem.sentiment}
+
+# Metadata keys that can be filtered on: plain identifiers, so they can go in a JSON path
+KEY_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+def parse_metadata_filters(filters: Optional[List[str]]) -> Dict[str, str]:
+    """Parses `key:value` filters. Raises ValueError for malformed ones."""
+    parsed = {}
+    for entry in filters or []:
+        key, separator, value = entry.partition(":")
+        if not separator:
+            raise ValueError(f"Metadata filters look like key:value, got {entry!r}")
+        parsed[key] = value
+    return parsed
+
+def metadata_conditions(
+    metadata: Optional[Dict[str, str]] = None,
+    sentiment: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+) -> List[Any]:
+    """
+    WHERE conditions on ContentItem for metadata filters, all evaluated in
+    SQL. Promoted keys and tags are served by indexes (the generated columns
+    and `itemtag`); other keys are read with json_extract, a scan over the
+    rows the other filters leave. Values are compared case-insensitively.
+    Raises ValueError for keys that aren't plain identifiers.
+    """
+    metadata = dict(metadata or {})
+    if sentiment:
+        metadata["sentiment"] = sentiment
+    conditions = []
+    for key, value in metadata.items():
+        if not KEY_PATTERN.match(key):
+            raise ValueError(f"Invalid metadata key: {key!r}")
+        column = PROMOTED_KEYS.get(key)
+        if column is None:
+            column = literal_column(metadata_field(key), String)
+        conditions.append(column == value.lower())
+    for tag in tags or []:
+        tag = normalize_tag(tag)
+        if tag:
+            conditions.append(ContentItem.id.in_(select(ItemTag.item_id).where(ItemTag.tag == tag)))
+    return conditions
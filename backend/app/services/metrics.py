@@ -0,0 +1,110 @@
+import asyncio
+import functools
+import time
+from datetime import datetime
+from typing import Callable
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.models import ContentItem, ContentStatus
+
+# Prometheus metrics, exported by the API at GET /metrics. Standalone workers
+# (`python -m app.workers`) serve their own on WORKER_METRICS_PORT.
+
+# 1 KB .. 4 GB, x4 per bucket
+SIZE_BUCKETS = [1024 * 4 ** i for i in range(12)]
+# 5 ms .. 5 min
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]
+# LLM answers take seconds; large documents and rate limits push them to minutes
+LLM_BUCKETS = [0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300, 600]
+TOKEN_BUCKETS = [16, 64, 256, 1024, 4096, 16384, 65536, 262144]
+
+UPLOAD_SIZE = Histogram(
+    "zibaldone_upload_size_bytes", "Size of uploaded files and archives", ["route"], buckets=SIZE_BUCKETS,
+)
+UPLOAD_SECONDS = Histogram(
+    "zibaldone_upload_duration_seconds", "Time to store and register an upload", ["route"], buckets=LATENCY_BUCKETS,
+)
+
+GENERATE_METADATA_SECONDS = Histogram(
+    "zibaldone_generate_metadata_duration_seconds",
+    "generate_metadata calls, including extraction and waiting on rate limits",
+    ["model", "type", "outcome"], buckets=LLM_BUCKETS,
+)
+LLM_REQUEST_SECONDS = Histogram(
+    "zibaldone_llm_request_duration_seconds", "Individual completion requests to the model provider",
+    ["model", "type", "outcome"], buckets=LLM_BUCKETS,
+)
+LLM_TOKENS = Histogram(
+    "zibaldone_llm_tokens", "Tokens per completion request, as reported by the provider",
+    ["model", "type", "kind"], buckets=TOKEN_BUCKETS,
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "zibaldone_llm_cache_lookups_total", "LLM result cache lookups", ["result"],
+)
+
+QUEUE_DEPTH = Gauge(
+    "zibaldone_queue_depth", "Item ids waiting in this process's in-memory queues", ["queue"],
+)
+ITEMS = Gauge(
+    "zibaldone_items", "Content items by status (all processes; read at scrape time)", ["status"],
+)
+OLDEST_UNPROCESSED_AGE = Gauge(
+    "zibaldone_oldest_unprocessed_age_seconds",
+    "Age of the oldest UNPROCESSED item, 0 when none wait (read at scrape time)",
+)
+
+STORAGE_SECONDS = Histogram(
+    "zibaldone_storage_operation_duration_seconds", "Blob storage operations",
+    ["backend", "operation"], buckets=LATENCY_BUCKETS,
+)
+
+SSE_SUBSCRIBERS = Gauge("zibaldone_sse_subscribers", "Connected SSE clients")
+
+def observe_upload(route: str, size: int, start: float):
+    """Records a finished upload that started at `start` (time.perf_counter())."""
+    UPLOAD_SIZE.labels(route).observe(size)
+    UPLOAD_SECONDS.labels(route).observe(time.perf_counter() - start)
+
+def timed_storage(operation: str) -> Callable:
+    """
+    Decorates a storage method (sync or async) to record its latency under
+    the storage's `backend` name. Operations may nest: an `adelete` also
+    records the `delete` it runs.
+    """
+    def decorator(fn: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(self, *args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await fn(self, *args, **kwargs)
+                finally:
+                    STORAGE_SECONDS.labels(self.backend, operation).observe(time.perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            finally:
+                STORAGE_SECONDS.labels(self.backend, operation).observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+def refresh_item_metrics(session: Session):
+    """
+    Reads the item gauges from the database, which every process shares.
+    Called on each scrape. Both queries go through ix_contentitem_claim; the
+    second only reads the UNPROCESSED rows.
+    """
+    counts = dict(session.exec(select(ContentItem.status, func.count()).group_by(ContentItem.status)).all())
+    for status in ContentStatus:
+        ITEMS.labels(status.value).set(counts.get(status, 0))
+
+    oldest = session.exec(
+        select(func.min(ContentItem.created_at)).where(ContentItem.status == ContentStatus.UNPROCESSED)
+    ).one()
+    OLDEST_UNPROCESSED_AGE.set(max(0.0, (datetime.utcnow() - oldest).total_seconds()) if oldest else 0)
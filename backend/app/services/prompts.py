@@ -0,0 +1,91 @@
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+PROMPTS_DIR = Path(__file__).parent.parent / "prompts"
+
+class CompiledPrompt(NamedTuple):
+    text: str
+    fingerprint: str # SHA-256 over the source files, doubles as the prompt version
+
+class PromptRegistry:
+    """
+    Assembles the prompt for each file type once and keeps it in memory.
+
+    Each lookup only stats the source files (at most every
+    PROMPT_RELOAD_INTERVAL seconds) and recompiles when one of them changed,
+    so prompt edits apply without a restart and without re-reading files for
+    every item. The assembled text puts the static instructions first, giving
+    providers a stable prefix to cache.
+    """
+    def __init__(self, prompts_dir: Optional[Path] = None, reload_interval: Optional[float] = None):
+        self.prompts_dir = Path(prompts_dir or PROMPTS_DIR)
+        if reload_interval is None:
+            reload_interval = float(os.getenv("PROMPT_RELOAD_INTERVAL", "1"))
+        self.reload_interval = reload_interval
+        # (file type, batch) -> (prompt, source signature, last checked)
+        self._compiled: Dict[Tuple[str, bool], Tuple[CompiledPrompt, tuple, float]] = {}
+        self._lock = threading.Lock()
+
+    def _sources(self, file_type: str, batch: bool) -> List[Path]:
+        type_file = self.prompts_dir / "types" / f"{file_type}.md"
+        if not type_file.exists():
+            type_file = self.prompts_dir / "types" / "default.md"
+        sources = [self.prompts_dir / "base_instructions.md", self.prompts_dir / "common_schema.json", type_file]
+        if batch:
+            sources.append(self.prompts_dir / "batch_instructions.md")
+        return sources
+
+    @staticmethod
+    def _signature(sources: List[Path]) -> tuple:
+        signature = []
+        for source in sources:
+            stat = source.stat()
+            signature.append((source, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _compile(self, sources: List[Path]) -> CompiledPrompt:
+        contents = [source.read_bytes() for source in sources]
+        digest = hashlib.sha256()
+        for content in contents:
+            digest.update(content)
+
+        base_instr, schema, type_instr = (content.decode() for content in contents[:3])
+        text = f"""
+{base_instr}
+
+Type-Specific Instructions:
+{type_instr}
+
+Required JSON Schema:
+{schema}
+
+JSON Result:
+"""
+        if len(contents) > 3:
+            text += "\n" + contents[3].decode()
+        return CompiledPrompt(text, digest.hexdigest())
+
+    def get(self, file_type: str, batch: bool = False) -> CompiledPrompt:
+        """The prompt for `file_type`; `batch` appends the multi-file instructions."""
+        key = (file_type, batch)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._compiled.get(key)
+            if entry and now - entry[2] < self.reload_interval:
+                return entry[0]
+
+            sources = self._sources(file_type, batch)
+            signature = self._signature(sources)
+            if entry and entry[1] == signature:
+                prompt = entry[0]
+            else:
+                prompt = self._compile(sources)
+            self._compiled[key] = (prompt, signature, now)
+            return prompt
+
+# Global instance
+prompt_registry = PromptRegistry()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+    A rate of 0 (or less) disables the limit.
+    """
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1):
+        if self.unlimited:
+            return
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+class ModelRateLimiter:
+    """
+    Requests/min and tokens/min limits for a single model, plus a shared
+    pause that every caller honours after the provider answers with a 429.
+    """
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.paused_until = 0.0
+
+    async def acquire(self, tokens: int = 0):
+        delay = self.paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.paused_until - time.monotonic()
+        await self.requests.acquire(1)
+        if tokens:
+            await self.tokens.acquire(tokens)
+
+    def backoff(self, seconds: float):
+        """Holds back all callers for this model for at least `seconds`."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+class RateLimiterRegistry:
+    """
+    Hands out one limiter per model. Defaults come from LLM_REQUESTS_PER_MINUTE
+    and LLM_TOKENS_PER_MINUTE; LLM_RATE_LIMITS can override them per model, e.g.
+    '{"ollama/llama3": {"rpm": 120, "tpm": 200000}}'.
+    """
+    def __init__(self):
+        self.limiters: Dict[str, ModelRateLimiter] = {}
+
+    def _limits_for(self, model: str) -> Dict[str, float]:
+        limits = {
+            "rpm": float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+            "tpm": float(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+        }
+        try:
+            overrides = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+        except json.JSONDecodeError:
+            print("Warning: LLM_RATE_LIMITS is not valid JSON, ignoring it")
+            overrides = {}
+        limits.update(overrides.get(model, {}))
+        return limits
+
+    def get(self, model: str) -> ModelRateLimiter:
+        if model not in self.limiters:
+            limits = self._limits_for(model)
+            self.limiters[model] = ModelRateLimiter(limits["rpm"], limits["tpm"])
+        return self.limiters[model]
+
+# Global instance
+rate_limiters = RateLimiterRegistry()
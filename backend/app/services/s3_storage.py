@@ -1,10 +1,32 @@
+import asyncio
+import functools
 import os
+import hashlib
 import boto3
 from botocore.config import Config
-from typing import Dict, Any
-from app.services.storage import StorageInterface
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, AsyncIterator, Iterator, List, Tuple
+from app.services.executors import executors
+from app.services.metrics import timed_storage
+from app.services.storage import StorageInterface, StoredBlob
+
+# Concurrent S3 requests: both the connection pool size and the number of
+# threads that make blocking boto3 calls on behalf of the event loop
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", "32"))
+# Attempts per request, with adaptive client-side rate limiting on throttling
+S3_MAX_ATTEMPTS = int(os.getenv("S3_MAX_ATTEMPTS", "5"))
+# DeleteObjects accepts at most this many keys per request
+DELETE_BATCH_SIZE = 1000
 
 class S3Storage(StorageInterface):
+    """
+    boto3 is synchronous, so every request runs on a dedicated thread pool
+    sized to the connection pool: the event loop never waits on S3, and
+    S3 I/O doesn't compete with CPU work on the shared executors.
+    """
+    backend = "s3"
+
     def __init__(self):
         self.endpoint_url = os.getenv("S3_ENDPOINT")
         self.access_key = os.getenv("S3_ACCESS_KEY")
@@ -15,7 +37,9 @@ class S3Storage(StorageInterface):
         # Use path-style addressing for MinIO if endpoint is provided
         s3_config = Config(
             signature_version='s3v4',
-            s3={'addressing_style': 'path'} if self.endpoint_url else None
+            s3={'addressing_style': 'path'} if self.endpoint_url else None,
+            max_pool_connections=S3_MAX_CONNECTIONS,
+            retries={'max_attempts': S3_MAX_ATTEMPTS, 'mode': 'adaptive'},
         )
         
         self.s3_client = boto3.client(
@@ -26,6 +50,8 @@ class S3Storage(StorageInterface):
             region_name=self.region,
             config=s3_config
         )
+        # S3 requires every multipart part but the last to be at least 5 MB
+        self.part_size = max(5 * 1024 * 1024, int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024))))
         self.public_url = os.getenv("S3_PUBLIC_URL")
         
         # If public_url is provided, we need a separate client for signing 
@@ -41,18 +67,24 @@ class S3Storage(StorageInterface):
             )
         else:
             self.signer_client = self.s3_client
+        self.io = ThreadPoolExecutor(S3_MAX_CONNECTIONS, thread_name_prefix="s3")
+
+    async def _run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs a blocking boto3 call on the S3 thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.io, functools.partial(fn, *args, **kwargs))
 
+    @timed_storage("save")
     async def save(self, file_content: bytes, original_filename: str) -> str:
         # Note: This is a fallback/simple upload. For efficient transfers, we use pre-signed URLs.
-        import uuid
-        file_ext = os.path.splitext(original_filename)[1]
-        storage_filename = f"{uuid.uuid4()}{file_ext}"
+        storage_filename = self.get_storage_filename(original_filename)
         
         # Implement date-based hierarchy
         date_prefix = self.get_date_prefix()
         storage_key = f"{date_prefix}{storage_filename}"
         
-        self.s3_client.put_object(
+        await self._run(
+            self.s3_client.put_object,
             Bucket=self.bucket_name,
             Key=storage_key,
             Body=file_content
@@ -60,9 +92,153 @@ class S3Storage(StorageInterface):
         
         return storage_key
 
+    @timed_storage("save_stream")
+    async def save_stream(self, chunks: AsyncIterator[bytes], original_filename: str) -> StoredBlob:
+        """
+        Streams into a multipart upload, holding at most one part in memory.
+        Small files that fit in a single part are sent with one put_object.
+        """
+        storage_key = f"{self.get_date_prefix()}{self.get_storage_filename(original_filename)}"
+        digest = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+
+        async def flush_part():
+            nonlocal upload_id
+            if upload_id is None:
+                upload_id = (await self._run(
+                    self.s3_client.create_multipart_upload, Bucket=self.bucket_name, Key=storage_key
+                ))["UploadId"]
+            part_number = len(parts) + 1
+            response = await self._run(
+                self.s3_client.upload_part,
+                Bucket=self.bucket_name,
+                Key=storage_key,
+                UploadId=upload_id,
+                PartNumber=part_number,
+                Body=bytes(buffer),
+            )
+            parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+            buffer.clear()
+
+        try:
+            async for chunk in chunks:
+                await executors.hash_update(digest, chunk)
+                size += len(chunk)
+                buffer.extend(chunk)
+                if len(buffer) >= self.part_size:
+                    await flush_part()
+
+            if upload_id is None:
+                await self._run(self.s3_client.put_object, Bucket=self.bucket_name, Key=storage_key, Body=bytes(buffer))
+            else:
+                if buffer:
+                    await flush_part()
+                await self._run(
+                    self.s3_client.complete_multipart_upload,
+                    Bucket=self.bucket_name,
+                    Key=storage_key,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+        except BaseException:
+            if upload_id is not None:
+                await self._run(self.s3_client.abort_multipart_upload, Bucket=self.bucket_name, Key=storage_key, UploadId=upload_id)
+            raise
+
+        return StoredBlob(storage_key, digest.hexdigest(), size)
+
+    @timed_storage("compute_checksum")
+    async def compute_checksum(self, storage_path: str) -> StoredBlob:
+        def hash_object():
+            body = self.s3_client.get_object(Bucket=self.bucket_name, Key=storage_path)["Body"]
+            digest = hashlib.sha256()
+            size = 0
+            for chunk in body.iter_chunks(chunk_size=1024 * 1024):
+                digest.update(chunk)
+                size += len(chunk)
+            return StoredBlob(storage_path, digest.hexdigest(), size)
+
+        # Streaming a large object is slow; keep it off the event loop
+        return await self._run(hash_object)
+
+    @timed_storage("initiate_multipart_upload")
+    async def initiate_multipart_upload(self, filename: str, content_type: Optional[str] = None) -> Dict[str, Any]:
+        storage_key = f"{self.get_date_prefix()}{self.get_storage_filename(filename)}"
+        params = {"Bucket": self.bucket_name, "Key": storage_key}
+        if content_type:
+            params["ContentType"] = content_type
+        response = await self._run(self.s3_client.create_multipart_upload, **params)
+        return {
+            "mode": "s3-multipart",
+            "upload_id": response["UploadId"],
+            "storage_path": storage_key,
+            "part_size": self.part_size,
+        }
+
+    async def sign_upload_parts(self, storage_path: str, upload_id: str, part_numbers: List[int]) -> Dict[int, str]:
+        # Signing is local to the client, so a whole batch costs no round-trips
+        return {
+            part_number: self.signer_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': self.bucket_name,
+                    'Key': storage_path,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number,
+                },
+                ExpiresIn=3600
+            )
+            for part_number in part_numbers
+        }
+
+    async def list_uploaded_parts(self, storage_path: str, upload_id: str) -> List[Dict[str, Any]]:
+        def list_parts():
+            parts = []
+            paginator = self.s3_client.get_paginator('list_parts')
+            for page in paginator.paginate(Bucket=self.bucket_name, Key=storage_path, UploadId=upload_id):
+                for part in page.get("Parts", []):
+                    parts.append({"PartNumber": part["PartNumber"], "ETag": part["ETag"], "Size": part["Size"]})
+            return parts
+
+        return await self._run(list_parts)
+
+    @timed_storage("complete_multipart_upload")
+    async def complete_multipart_upload(self, storage_path: str, upload_id: str, parts: List[Dict[str, Any]]) -> str:
+        """
+        Completes the upload using the parts S3 actually received. Client-reported
+        ETags must match them, so a corrupted or missing part fails the upload.
+        """
+        uploaded = {part["PartNumber"]: part["ETag"] for part in await self.list_uploaded_parts(storage_path, upload_id)}
+        for part in parts:
+            if uploaded.get(part["PartNumber"]) != part["ETag"]:
+                raise ValueError(f"Part {part['PartNumber']} does not match the uploaded data")
+
+        response = await self._run(
+            self.s3_client.complete_multipart_upload,
+            Bucket=self.bucket_name,
+            Key=storage_path,
+            UploadId=upload_id,
+            MultipartUpload={"Parts": sorted(
+                ({"PartNumber": part["PartNumber"], "ETag": part["ETag"]} for part in parts),
+                key=lambda part: part["PartNumber"]
+            )},
+        )
+        return response["ETag"]
+
+    @timed_storage("abort_multipart_upload")
+    async def abort_multipart_upload(self, storage_path: str, upload_id: str):
+        await self._run(self.s3_client.abort_multipart_upload, Bucket=self.bucket_name, Key=storage_path, UploadId=upload_id)
+
+    def _is_legacy_path(self, storage_path: str) -> bool:
+        return storage_path.startswith(".") or os.path.isabs(storage_path)
+
+    @timed_storage("delete")
     def delete(self, storage_path: str):
         # Gracefully handle legacy filesystem paths if they exist
-        if storage_path.startswith(".") or os.path.isabs(storage_path):
+        if self._is_legacy_path(storage_path):
             if os.path.exists(storage_path):
                 os.remove(storage_path)
             return
@@ -72,14 +248,54 @@ class S3Storage(StorageInterface):
             Key=storage_path
         )
 
+    @timed_storage("adelete")
+    async def adelete(self, storage_path: str):
+        await self._run(self.delete, storage_path)
+
+    def _delete_batch(self, keys: List[str]) -> List[str]:
+        """One DeleteObjects request. Returns the keys S3 reported errors for."""
+        response = self.s3_client.delete_objects(
+            Bucket=self.bucket_name,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+        )
+        return [error["Key"] for error in response.get("Errors", [])]
+
+    def _split_keys(self, storage_paths: List[str]) -> List[List[str]]:
+        """Deletes legacy local paths right away; returns S3 keys in DeleteObjects-sized batches."""
+        keys = []
+        for storage_path in storage_paths:
+            if self._is_legacy_path(storage_path):
+                self.delete(storage_path)
+            else:
+                keys.append(storage_path)
+        return [keys[i:i + DELETE_BATCH_SIZE] for i in range(0, len(keys), DELETE_BATCH_SIZE)]
+
+    @timed_storage("delete_many")
+    def delete_many(self, storage_paths: List[str]) -> List[str]:
+        failed = []
+        for batch in self._split_keys(storage_paths):
+            failed += self._delete_batch(batch)
+        return failed
+
+    @timed_storage("adelete_many")
+    async def adelete_many(self, storage_paths: List[str]) -> List[str]:
+        # Batches go out in parallel, up to the connection pool size
+        batches = await self._run(self._split_keys, storage_paths)
+        results = await asyncio.gather(*(self._run(self._delete_batch, batch) for batch in batches))
+        return [key for failed in results for key in failed]
+
+    def list_blobs(self) -> Iterator[Tuple[str, datetime]]:
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket_name):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['LastModified'].astimezone(timezone.utc).replace(tzinfo=None)
+
     def get_path(self, storage_path: str) -> str:
         # Return the key; the application will need to know how to retrieve it (e.g. via pre-signed URL or CDN)
         return storage_path
 
     async def get_upload_params(self, filename: str) -> Dict[str, Any]:
-        import uuid
-        file_ext = os.path.splitext(filename)[1]
-        storage_filename = f"{uuid.uuid4()}{file_ext}"
+        storage_filename = self.get_storage_filename(filename)
         
         # Implement date-based hierarchy
         date_prefix = self.get_date_prefix()
@@ -100,5 +316,7 @@ class S3Storage(StorageInterface):
             "mode": "s3",
             "upload_url": url,
             "storage_path": storage_key,
-            "method": "PUT"
+            "method": "PUT",
+            # Files larger than this should use the multipart endpoints instead
+            "part_size": self.part_size
         }
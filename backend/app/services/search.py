@@ -0,0 +1,245 @@
+import json
+import re
+import uuid
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from sqlmodel import Session, select, delete
+from app.models import ContentItem, ContentStatus, ItemTag
+from app.services.vector_index import vector_index
+
+FTS_TABLE = "contentitem_fts"
+
+# Column weights for bm25 ranking: filename, summary, tags, body
+RANK_WEIGHTS = (2.0, 3.0, 4.0, 1.0)
+
+# Facets are counted over the best-ranked matches only, so broad queries stay fast
+FACET_SAMPLE = 1000
+
+def create_search_index(engine):
+    """
+    Creates the FTS5 index over item metadata (with prefix indexes for
+    as-you-type queries) and backfills it from already tagged items.
+    """
+    with engine.begin() as conn:
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": FTS_TABLE}
+        ).first()
+        if exists:
+            return
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "item_id UNINDEXED, filename, summary, tags, body, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        ))
+
+    with Session(engine) as session:
+        tagged = select(ContentItem).where(ContentItem.status.in_([ContentStatus.TAGGED, ContentStatus.INDEXED]))
+        for item in session.exec(tagged):
+            try:
+                metadata = json.loads(item.metadata_json or "{}")
+            except json.JSONDecodeError:
+                continue
+            index_item(session, item, metadata)
+        session.commit()
+
+def normalize_tag(tag: Any) -> str:
+    return re.sub(r"\s+", " ", str(tag)).strip().lower()
+
+def flatten_text(value: Any) -> List[str]:
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, dict):
+        return [part for v in value.values() for part in flatten_text(v)]
+    if isinstance(value, list):
+        return [part for v in value for part in flatten_text(v)]
+    return []
+
+def index_item(session: Session, item: ContentItem, metadata: Dict[str, Any]):
+    """Replaces the item's search entry and tags. Runs inside the caller's write transaction."""
+    remove_item(session, item.id)
+
+    tags = sorted({normalize_tag(tag) for tag in metadata.get("tags") or [] if normalize_tag(tag)})
+    body = [part for key, value in metadata.items() if key not in ("summary", "tags") for part in flatten_text(value)]
+    session.exec(
+        text(f"INSERT INTO {FTS_TABLE} (item_id, filename, summary, tags, body) VALUES (:item_id, :filename, :summary, :tags, :body)"),
+        params={
+            "item_id": item.id.hex,
+            "filename": item.original_filename,
+            "summary": metadata.get("summary") if isinstance(metadata.get("summary"), str) else "",
+            "tags": " ".join(tags),
+            "body": "\n".join(body),
+        },
+    )
+    for tag in tags:
+        session.add(ItemTag(item_id=item.id, tag=tag))
+
+def remove_item(session: Session, item_id: uuid.UUID):
+    session.exec(text(f"DELETE FROM {FTS_TABLE} WHERE item_id = :item_id"), params={"item_id": item_id.hex})
+    session.exec(delete(ItemTag).where(ItemTag.item_id == item_id))
+
+def remove_items(session: Session, item_ids: List[uuid.UUID]):
+    """`remove_item` for many items; the FTS table is scanned once rather than once per item."""
+    if not item_ids:
+        return
+    session.exec(
+        text(f"DELETE FROM {FTS_TABLE} WHERE item_id IN (SELECT value FROM json_each(:ids))"),
+        params={"ids": json.dumps([item_id.hex for item_id in item_ids])},
+    )
+    session.exec(delete(ItemTag).where(ItemTag.item_id.in_(item_ids)))
+
+def build_match_query(query: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query: every word must match, and the last
+    one also matches as a prefix. Quoting each term keeps user input from
+    being parsed as FTS syntax.
+    """
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+def _filter_conditions(tags: List[str], show_all_versions: bool, params: Dict[str, Any]) -> List[str]:
+    """SQL conditions on `contentitem c` shared by the keyword and semantic rankings."""
+    # Items marked by a bulk delete are on their way out
+    conditions = ["c.status != 'DELETING'"]
+    if not show_all_versions:
+        conditions.append("c.is_latest = 1")
+    for i, tag in enumerate(tags):
+        params[f"tag{i}"] = tag
+        conditions.append(f"EXISTS (SELECT 1 FROM itemtag t WHERE t.item_id = c.id AND t.tag = :tag{i})")
+    return conditions
+
+def _ranked_candidates(
+    session: Session,
+    match: Optional[str],
+    tags: List[str],
+    show_all_versions: bool,
+    count: int,
+) -> List[tuple]:
+    """Returns up to `count` (item id hex, score) pairs, best first."""
+    params: Dict[str, Any] = {"count": count}
+    conditions = _filter_conditions(tags, show_all_versions, params)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    if not match:
+        if not tags:
+            # Newest first, straight from the listing index
+            return session.exec(text(
+                f"SELECT c.id, 0.0 FROM contentitem c {where} ORDER BY c.created_at DESC LIMIT :count"
+            ), params=params).all()
+        # Drive the lookup from the tag index; CROSS JOIN pins that join order
+        return session.exec(text(
+            f"SELECT c.id, 0.0 FROM itemtag m CROSS JOIN contentitem c ON c.id = m.item_id "
+            f"{where} AND m.tag = :tag0 ORDER BY c.created_at DESC LIMIT :count"
+        ), params=params).all()
+
+    # Rank inside FTS first and only join the best matches; if filters drop too
+    # many of them, fall back to ranking every match (window -1 = unlimited)
+    params["match"] = match
+    weights = ", ".join(map(str, RANK_WEIGHTS))
+    statement = text(
+        f"SELECT c.id, m.score FROM ("
+        f"SELECT item_id, bm25({FTS_TABLE}, 0, {weights}) AS score FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH :match ORDER BY score LIMIT :window"
+        f") m JOIN contentitem c ON c.id = m.item_id {where} ORDER BY m.score LIMIT :count"
+    )
+    rows = session.exec(statement, params={**params, "window": count * 2}).all()
+    if len(rows) < count and conditions:
+        rows = session.exec(statement, params={**params, "window": -1}).all()
+    return rows
+
+def search_items(
+    session: Session,
+    query: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    limit: int = 20,
+    offset: int = 0,
+    show_all_versions: bool = False,
+) -> Dict[str, Any]:
+    """
+    Ranked full-text search over filename, summary, tags and the rest of the
+    metadata, optionally restricted to items carrying all of `tags`.
+    Returns the page of items with their scores plus tag facets.
+    """
+    match = build_match_query(query) if query else None
+    tags = [normalize_tag(tag) for tag in tags or [] if normalize_tag(tag)]
+
+    candidates = _ranked_candidates(session, match, tags, show_all_versions, max(offset + limit, FACET_SAMPLE))
+    return _results_page(session, candidates, limit, offset, scores=[-score for _, score in candidates] if match else None)
+
+def _results_page(
+    session: Session,
+    candidates: List[tuple],
+    limit: int,
+    offset: int,
+    scores: Optional[List[float]] = None,
+) -> Dict[str, Any]:
+    """Loads the requested page of ranked (item id hex, score) candidates and counts tag facets over all of them."""
+    page = candidates[offset:offset + limit]
+
+    ids = [uuid.UUID(item_id) for item_id, _ in page]
+    by_id = {item.id: item for item in session.exec(select(ContentItem).where(ContentItem.id.in_(ids)))} if ids else {}
+    results = [
+        {**by_id[item_id].model_dump(), "score": scores[offset + i] if scores else None}
+        for i, item_id in enumerate(ids) if item_id in by_id
+    ]
+
+    facets = session.exec(
+        text(
+            "SELECT tag, COUNT(*) AS count FROM itemtag "
+            "WHERE item_id IN (SELECT value FROM json_each(:ids)) "
+            "GROUP BY tag ORDER BY count DESC, tag LIMIT 20"
+        ),
+        params={"ids": json.dumps([item_id for item_id, _ in candidates])},
+    ).all() if candidates else []
+
+    return {
+        "items": results,
+        "facets": [{"tag": row.tag, "count": row.count} for row in facets],
+    }
+
+def semantic_search(
+    session: Session,
+    vector,
+    query: Optional[str] = None,
+    tags: Optional[List[str]] = None,
+    limit: int = 20,
+    offset: int = 0,
+    show_all_versions: bool = False,
+    exclude: Optional[uuid.UUID] = None,
+) -> Dict[str, Any]:
+    """
+    Ranks items by cosine similarity of their embedding to `vector`. Filters
+    (keyword `query`, `tags`, latest versions only) are applied to the nearest
+    neighbours, widening the neighbour window until the page is filled.
+    Same response shape as `search_items`, with the similarity as score.
+    """
+    tags = [normalize_tag(tag) for tag in tags or [] if normalize_tag(tag)]
+    params: Dict[str, Any] = {}
+    conditions = _filter_conditions(tags, show_all_versions, params)
+    match = build_match_query(query) if query else None
+    if match:
+        params["match"] = match
+        conditions.append(f"c.id IN (SELECT item_id FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match)")
+
+    count = max(offset + limit, FACET_SAMPLE)
+    window = count
+    while True:
+        hits = vector_index.search(vector, k=window, exclude=exclude)
+        if not conditions:
+            candidates = [(item_id.hex, score) for item_id, score in hits]
+            break
+        allowed = {
+            row[0] for row in session.exec(text(
+                f"SELECT c.id FROM contentitem c WHERE c.id IN (SELECT value FROM json_each(:ids)) AND {' AND '.join(conditions)}"
+            ), params={**params, "ids": json.dumps([item_id.hex for item_id, _ in hits])})
+        }
+        candidates = [(item_id.hex, score) for item_id, score in hits if item_id.hex in allowed]
+        if len(candidates) >= count or len(hits) < window:
+            break
+        window *= 4
+
+    candidates = candidates[:count]
+    return _results_page(session, candidates, limit, offset, scores=[score for _, score in candidates])
@@ -1,13 +1,47 @@
 from abc import ABC, abstractmethod
 import aiofiles
+import hashlib
 import os
+import re
 import uuid
-from typing import Dict, Any, Optional
+from datetime import datetime
+from typing import Dict, Any, Optional, AsyncIterator, Iterator, NamedTuple, List, Tuple
+
+from app.services.executors import executors
+from app.services.metrics import timed_storage
+
+# Blobs are stored as YYYY/MM/DD/<name>; see StorageInterface.get_date_prefix
+BLOB_PATH = re.compile(r"^\d{4}/\d{2}/\d{2}/[^/]+$")
+
+def is_blob_path(storage_path: str) -> bool:
+    """Whether a client-supplied path has the layout this app issues (and can't escape the storage root)."""
+    return bool(BLOB_PATH.match(storage_path)) and ".." not in storage_path.split("/")
+
+class StoredBlob(NamedTuple):
+    storage_path: str
+    checksum: str # SHA-256, computed while the bytes were written
+    size: int
 
 class StorageInterface(ABC):
+    # Label for storage latency metrics
+    backend = "unknown"
+
     @abstractmethod
     async def save(self, file_content: bytes, original_filename: str) -> str:
-        """Saves a file and returns its storage path or identifier."""
+        """
+        Saves a file under a fresh unique name and returns its storage path
+        or identifier. Identical content is deduplicated through the `blob`
+        table, never by reusing a name: a path freed by a delete can't be
+        written again while its unlink is still pending.
+        """
+        pass
+
+    @abstractmethod
+    async def save_stream(self, chunks: AsyncIterator[bytes], original_filename: str) -> StoredBlob:
+        """
+        Saves a file from an async stream of chunks, hashing it on the way,
+        so memory use stays bounded regardless of file size.
+        """
         pass
 
     @abstractmethod
@@ -15,6 +49,35 @@ class StorageInterface(ABC):
         """Deletes a file from storage."""
         pass
 
+    @timed_storage("delete_many")
+    def delete_many(self, storage_paths: List[str]) -> List[str]:
+        """Deletes several files, with as few requests as the backend allows. Returns the paths that failed."""
+        failed = []
+        for storage_path in storage_paths:
+            try:
+                self.delete(storage_path)
+            except OSError:
+                failed.append(storage_path)
+        return failed
+
+    # For async routes and workers. Local deletes are cheap enough to run
+    # inline; remote backends override these to keep the event loop free.
+    @timed_storage("adelete")
+    async def adelete(self, storage_path: str):
+        self.delete(storage_path)
+
+    @timed_storage("adelete_many")
+    async def adelete_many(self, storage_paths: List[str]) -> List[str]:
+        return self.delete_many(storage_paths)
+
+    def list_blobs(self) -> Iterator[Tuple[str, datetime]]:
+        """
+        Every stored blob with when it was last written (naive UTC), for the
+        garbage collector. Staging areas and sidecar files are left out.
+        Blocking: iterate on a thread.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def get_path(self, storage_path: str) -> str:
         """Returns the local path or an identifier for the file."""
@@ -25,20 +88,51 @@ class StorageInterface(ABC):
         """Returns parameters for browser-side upload (e.g. pre-signed URL)."""
         pass
 
+    async def compute_checksum(self, storage_path: str) -> StoredBlob:
+        """
+        Hashes a stored blob server-side. Used to verify direct uploads
+        instead of trusting a checksum reported by the client.
+        """
+        raise NotImplementedError
+
+    # Resumable multipart uploads straight from the browser. Only backends
+    # that support presigned URLs (S3) implement these.
+    async def initiate_multipart_upload(self, filename: str, content_type: Optional[str] = None) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def sign_upload_parts(self, storage_path: str, upload_id: str, part_numbers: List[int]) -> Dict[int, str]:
+        raise NotImplementedError
+
+    async def list_uploaded_parts(self, storage_path: str, upload_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def complete_multipart_upload(self, storage_path: str, upload_id: str, parts: List[Dict[str, Any]]) -> str:
+        raise NotImplementedError
+
+    async def abort_multipart_upload(self, storage_path: str, upload_id: str):
+        raise NotImplementedError
+
     def get_date_prefix(self) -> str:
         """Returns the date-based prefix YYYY/MM/DD/."""
         from datetime import datetime
         now = datetime.utcnow()
         return now.strftime("%Y/%m/%d/")
 
+    def get_storage_filename(self, original_filename: str) -> str:
+        """Returns `<uuid><ext>`."""
+        file_ext = os.path.splitext(original_filename)[1]
+        return f"{uuid.uuid4()}{file_ext}"
+
 class FileSystemStorage(StorageInterface):
+    backend = "filesystem"
+
     def __init__(self, storage_dir: str):
         self.storage_dir = storage_dir
         os.makedirs(self.storage_dir, exist_ok=True)
 
+    @timed_storage("save")
     async def save(self, file_content: bytes, original_filename: str) -> str:
-        file_ext = os.path.splitext(original_filename)[1]
-        storage_filename = f"{uuid.uuid4()}{file_ext}"
+        storage_filename = self.get_storage_filename(original_filename)
         
         # Implement date-based hierarchy
         date_prefix = self.get_date_prefix()
@@ -53,12 +147,69 @@ class FileSystemStorage(StorageInterface):
             
         return relative_path # Return relative path for database storage
 
+    @timed_storage("save_stream")
+    async def save_stream(self, chunks: AsyncIterator[bytes], original_filename: str) -> StoredBlob:
+        # Stage under a temporary name so a half-written stream never sits at a blob path
+        incoming_dir = os.path.join(self.storage_dir, ".incoming")
+        os.makedirs(incoming_dir, exist_ok=True)
+        temp_path = os.path.join(incoming_dir, f"{uuid.uuid4()}.part")
+
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with aiofiles.open(temp_path, 'wb') as out_file:
+                async for chunk in chunks:
+                    await executors.hash_update(digest, chunk)
+                    size += len(chunk)
+                    await out_file.write(chunk)
+
+            checksum = digest.hexdigest()
+            relative_path = os.path.join(self.get_date_prefix(), self.get_storage_filename(original_filename))
+            full_path = os.path.join(self.storage_dir, relative_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return StoredBlob(relative_path, checksum, size)
+
+    @timed_storage("compute_checksum")
+    async def compute_checksum(self, storage_path: str) -> StoredBlob:
+        digest = hashlib.sha256()
+        size = 0
+        async with aiofiles.open(self.get_path(storage_path), 'rb') as in_file:
+            while chunk := await in_file.read(1024 * 1024):
+                await executors.hash_update(digest, chunk)
+                size += len(chunk)
+        return StoredBlob(storage_path, digest.hexdigest(), size)
+
+    @timed_storage("delete")
     def delete(self, storage_path: str):
         # Join with storage_dir since DB stores relative path now
         full_path = os.path.join(self.storage_dir, storage_path) if not os.path.isabs(storage_path) else storage_path
         if os.path.exists(full_path):
             if os.path.isfile(full_path):
                 os.remove(full_path)
+        # Text extracted from the blob is cached beside it (see extractors.run_extractor)
+        sidecar = full_path + ".extracted.json"
+        if os.path.isfile(sidecar):
+            os.remove(sidecar)
+
+    def list_blobs(self) -> Iterator[Tuple[str, datetime]]:
+        for root, dirs, names in os.walk(self.storage_dir):
+            # `.incoming` holds streams still being written
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(names):
+                if name.endswith(".extracted.json"):
+                    continue
+                full_path = os.path.join(root, name)
+                try:
+                    modified = datetime.utcfromtimestamp(os.path.getmtime(full_path))
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(full_path, self.storage_dir), modified
 
     def get_path(self, storage_path: str) -> str:
         if os.path.isabs(storage_path):
@@ -0,0 +1,59 @@
+import os
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from sqlmodel import Session, select
+
+from app.database import db_reader
+from app.models import Blob, ContentItem
+from app.services.executors import executors
+from app.services.storage import BLOB_PATH, StorageInterface
+
+# Blobs younger than this are never collected: uploads write the blob before
+# the row that refers to it exists (direct and multipart S3 uploads, archive imports)
+GC_GRACE_SECONDS = float(os.getenv("GC_GRACE_SECONDS", str(24 * 3600)))
+# How often the workers schedule a sweep; 0 turns periodic sweeps off
+GC_INTERVAL_SECONDS = float(os.getenv("GC_INTERVAL_SECONDS", str(6 * 3600)))
+# Unreferenced blobs deleted per request
+GC_BATCH_SIZE = 1000
+
+def referenced_paths(session: Session) -> Set[str]:
+    """Storage paths the database still points at: tracked blobs, and items stored before blobs were tracked."""
+    paths = set(session.exec(select(Blob.storage_path)).all())
+    paths.update(session.exec(select(ContentItem.storage_path).distinct()).all())
+    return paths
+
+def find_orphans(storage: StorageInterface, referenced: Set[str], cutoff: datetime) -> Tuple[int, List[str]]:
+    """Walks the storage tree. Returns the number of blobs seen and the unreferenced ones older than `cutoff`."""
+    scanned = 0
+    orphans = []
+    for storage_path, modified in storage.list_blobs():
+        # Anything else in the bucket or directory is left alone
+        if not BLOB_PATH.match(storage_path):
+            continue
+        scanned += 1
+        if storage_path not in referenced and modified < cutoff:
+            orphans.append(storage_path)
+    return scanned, orphans
+
+async def sweep_storage(storage: StorageInterface, session: Session, grace: Optional[float] = None,
+                        renew: Optional[Callable[[], Awaitable[bool]]] = None) -> Optional[Dict[str, int]]:
+    """
+    Reconciles the storage tree against the database and deletes blobs
+    nothing refers to, GC_BATCH_SIZE per request. These are left behind when
+    a process dies between committing a delete and removing the blob, when a
+    blob delete fails, or when an upload is abandoned before it is registered.
+
+    `renew` is awaited before every batch to extend the sweep job's lease;
+    when it returns False another process took the job over, and the sweep
+    stops and returns None.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=GC_GRACE_SECONDS if grace is None else grace)
+    referenced = await db_reader.run(referenced_paths, session)
+    scanned, orphans = await executors.run_thread(find_orphans, storage, referenced, cutoff)
+
+    failed: List[str] = []
+    for start in range(0, len(orphans), GC_BATCH_SIZE):
+        if renew is not None and not await renew():
+            return None
+        failed += await storage.adelete_many(orphans[start:start + GC_BATCH_SIZE])
+    return {"scanned": scanned, "deleted": len(orphans) - len(failed), "failed": len(failed)}
@@ -0,0 +1,134 @@
+import re
+from functools import lru_cache
+from typing import Callable, List, NamedTuple
+import litellm
+
+# Tokens never span more characters than this in practice; used to size the
+# slice of a document that is tokenized instead of tokenizing all of it
+CHARS_PER_TOKEN_BOUND = 8
+
+OMISSION_MARKER = "\n\n[... {omitted} characters omitted ...]\n\n"
+
+class Tokenizer(NamedTuple):
+    encode: Callable[[str], List[int]]
+    decode: Callable[[List[int]], str]
+
+@lru_cache(maxsize=32)
+def get_tokenizer(model: str) -> Tokenizer:
+    """
+    The model's tokenizer as picked by LiteLLM, resolved once per model.
+    Falls back to tiktoken's cl100k_base (via the gpt-4 tokenizer) when the
+    model's own tokenizer cannot be loaded, e.g. offline Hugging Face models.
+    """
+    def for_model(name: str) -> Tokenizer:
+        def encode(text: str) -> List[int]:
+            encoded = litellm.encode(model=name, text=text)
+            return list(getattr(encoded, "ids", encoded))
+        return Tokenizer(encode, lambda tokens: litellm.decode(model=name, tokens=tokens))
+
+    tokenizer = for_model(model)
+    try:
+        tokenizer.decode(tokenizer.encode("probe"))
+        return tokenizer
+    except Exception as e:
+        print(f"Tokenizer for {model} unavailable ({e}), using cl100k_base")
+        return for_model("gpt-4")
+
+def count_tokens(text: str, model: str) -> int:
+    return len(get_tokenizer(model).encode(text))
+
+def truncate_head(text: str, budget: int, model: str) -> str:
+    """
+    The longest prefix of `text` that fits in `budget` tokens, cut at a token
+    boundary. Only a slice about `budget * CHARS_PER_TOKEN_BOUND` characters
+    long is tokenized, so the cost does not grow with the document size.
+    """
+    if budget <= 0:
+        return ""
+    # Every token covers at least one byte, and a character is at most four
+    if len(text) * 4 <= budget:
+        return text
+
+    tokenizer = get_tokenizer(model)
+    window = budget * CHARS_PER_TOKEN_BOUND
+    while True:
+        tokens = tokenizer.encode(text[:window])
+        if len(tokens) <= budget:
+            if window >= len(text):
+                return text
+            # Unusually long tokens (e.g. runs of whitespace): look further
+            window *= 2
+            continue
+        # The last token of the slice may be cut mid-word; everything before it is exact.
+        # A cut inside a multi-byte character decodes to a replacement character
+        head = tokenizer.decode(tokens[:budget]).rstrip("\ufffd")
+        return text[:len(head)]
+
+def truncate_tail(text: str, budget: int, model: str) -> str:
+    """The longest suffix of `text` that fits in `budget` tokens."""
+    if budget <= 0:
+        return ""
+    if len(text) * 4 <= budget:
+        return text
+
+    tokenizer = get_tokenizer(model)
+    window = budget * CHARS_PER_TOKEN_BOUND
+    while True:
+        tokens = tokenizer.encode(text[-window:])
+        if len(tokens) <= budget:
+            if window >= len(text):
+                return text
+            window *= 2
+            continue
+        tail = tokenizer.decode(tokens[-budget:]).lstrip("\ufffd")
+        return text[len(text) - len(tail):]
+
+def truncate_head_tail(text: str, budget: int, model: str, head_share: float = 0.7) -> str:
+    """
+    Keeps the start and the end of a long document (conclusions, signatures,
+    the latest log lines) with a marker for the omitted middle.
+    """
+    if truncate_head(text, budget, model) == text:
+        return text
+
+    marker_budget = count_tokens(OMISSION_MARKER.format(omitted=len(text)), model)
+    head_budget = int((budget - marker_budget) * head_share)
+    head = truncate_head(text, head_budget, model)
+    tail = truncate_tail(text, budget - marker_budget - head_budget, model)
+    omitted = len(text) - len(head) - len(tail)
+    if omitted <= 0:
+        return text
+    return head + OMISSION_MARKER.format(omitted=omitted) + tail
+
+SECTION_BREAK = re.compile(r"\n(?=#{1,6} )|\n\s*\n")
+
+def truncate_sections(text: str, budget: int, model: str, max_sections: int = 32) -> str:
+    """
+    Samples the document's structure instead of only its start: splits on
+    headings and blank lines, picks up to `max_sections` evenly spaced
+    sections and keeps the beginning of each within an equal share of the budget.
+    """
+    if truncate_head(text, budget, model) == text:
+        return text
+    sections = [section for section in SECTION_BREAK.split(text) if section.strip()]
+    if len(sections) <= 1:
+        return truncate_head_tail(text, budget, model)
+
+    if len(sections) > max_sections:
+        step = len(sections) / max_sections
+        sections = [sections[int(i * step)] for i in range(max_sections)]
+    marker = "\n\n[...]\n\n"
+    share = (budget - count_tokens(marker, model) * (len(sections) - 1)) // len(sections)
+    if share <= 0:
+        return truncate_head(text, budget, model)
+    return marker.join(truncate_head(section, share, model) for section in sections)
+
+STRATEGIES = {
+    "head": truncate_head,
+    "head_tail": truncate_head_tail,
+    "sections": truncate_sections,
+}
+
+def truncate(text: str, budget: int, model: str, strategy: str = "head") -> str:
+    """Fits `text` into `budget` tokens of `model` using the named strategy."""
+    return STRATEGIES.get(strategy, truncate_head)(text, budget, model)
@@ -0,0 +1,397 @@
+import fcntl
+import json
+import math
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+
+from app.database import DATA_DIR
+
+# Below this many vectors a brute-force scan is fast enough; above it an IVF
+# (inverted file) partition is trained so queries only scan a few clusters
+IVF_MIN_ITEMS = int(os.getenv("VECTOR_IVF_MIN_ITEMS", "100000"))
+# Clusters scanned per query; more means better recall and slower queries
+IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "16"))
+
+class VectorIndex:
+    """
+    Append-only on-disk store of unit-length float32 embeddings for nearest
+    neighbour search by cosine similarity.
+
+    `vectors.f32` is a row-major float32 matrix memory-mapped for queries,
+    `ids.bin` holds the 16-byte item id of each row, and `meta.json` records
+    the dimension and embedding model. Re-indexing an item overwrites its row
+    in place; removing it zeroes the row and its id (a tombstone) so rows never
+    move. `compact()` rewrites the files without tombstones.
+
+    Small indexes are scanned brute force. Once `needs_training()` says so,
+    `train()` clusters the vectors (spherical k-means, `centroids.npy`) and
+    records each row's cluster in `assignments.i32`; queries then only scan
+    the IVF_NPROBE clusters closest to the query.
+
+    The API and standalone workers (`python -m app.workers`) share the files.
+    Writers hold an exclusive flock on `index.lock`, readers a shared one, and
+    every operation first compares the files with what this process loaded:
+    rows appended or tombstoned elsewhere are read from `ids.bin`, and a
+    compaction, reset or training elsewhere (which rewrite `meta.json`)
+    reloads the index.
+    """
+    ID_BYTES = 16
+
+    def __init__(self, directory: Optional[Path] = None):
+        self.directory = Path(directory or os.getenv("VECTOR_INDEX_DIR", DATA_DIR / "vectors"))
+        self.vectors_path = self.directory / "vectors.f32"
+        self.ids_path = self.directory / "ids.bin"
+        self.meta_path = self.directory / "meta.json"
+        self.centroids_path = self.directory / "centroids.npy"
+        self.assignments_path = self.directory / "assignments.i32"
+        self.lock_path = self.directory / "index.lock"
+        self._lock = threading.Lock()
+        self._loaded = False
+        # Bumped on every full load; tells train() whether rows moved under it
+        self._generation = 0
+
+    @contextmanager
+    def _locked(self, exclusive: bool = False):
+        """
+        Holds the thread lock and the cross-process file lock, with the
+        in-memory state brought up to date with the files.
+        """
+        with self._lock:
+            handle = None
+            if exclusive or self.directory.exists():
+                self.directory.mkdir(parents=True, exist_ok=True)
+                handle = open(self.lock_path, "a+b")
+                fcntl.flock(handle, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                self._sync(exclusive)
+                yield
+            except BaseException:
+                if exclusive:
+                    self._loaded = False # A failed write may have left memory and files apart
+                raise
+            else:
+                if exclusive and self._loaded:
+                    self._state = self._file_state()
+            finally:
+                if handle:
+                    handle.close() # Releases the flock
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _file_state(self) -> tuple:
+        return self._stat(self.meta_path), self._stat(self.ids_path), self._stat(self.assignments_path)
+
+    def _sync(self, exclusive: bool):
+        """Catches up with writes other processes made since this one last looked."""
+        state = self._file_state()
+        if not self._loaded or state != self._state:
+            meta, ids, _ = state
+            loaded_meta, loaded_ids, _ = self._state if self._loaded else (None, None, None)
+            if self._loaded and meta == loaded_meta and ids and loaded_ids and ids[0] == loaded_ids[0] and ids[1] >= loaded_ids[1]:
+                # Only appends and tombstones, so rows kept their numbers
+                self._refresh_rows()
+                if self._centroids is not None:
+                    self._refresh_assignments()
+            else:
+                self._load()
+            self._state = state
+        if exclusive and self.dim is not None:
+            # A crash between the appends can leave a file a row ahead; trim it before appending
+            self._trim(self.ids_path, self._count * self.ID_BYTES)
+            self._trim(self.vectors_path, self._count * self.dim * 4)
+            if self._centroids is not None:
+                self._trim(self.assignments_path, self._count * 4)
+                if len(self._assignments) < self._count:
+                    self._assign_rows(np.asarray(self._matrix[len(self._assignments):self._count]))
+
+    @staticmethod
+    def _trim(path: Path, size: int):
+        if path.stat().st_size > size:
+            os.truncate(path, size)
+
+    def _load(self):
+        self.dim: Optional[int] = None
+        self.model: Optional[str] = None
+        self.rows: dict = {}
+        self._row_ids: list = []
+        self._matrix: Optional[np.ndarray] = None
+        self._valid: np.ndarray = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+        self._trained_on = 0
+        self._lists = None
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text())
+            self.dim, self.model = meta["dim"], meta.get("model")
+            raw_ids = self.ids_path.read_bytes()
+            count = min(len(raw_ids) // self.ID_BYTES, self.vectors_path.stat().st_size // (self.dim * 4))
+            for row in range(count):
+                item_id = raw_ids[row * self.ID_BYTES:(row + 1) * self.ID_BYTES]
+                item_id = uuid.UUID(bytes=item_id) if item_id.strip(b"\0") else None
+                self._row_ids.append(item_id)
+                if item_id:
+                    self.rows[item_id] = row
+            self._valid = np.zeros(count, dtype=bool)
+            self._valid[list(self.rows.values())] = True
+            self._remap(count)
+
+            if self.centroids_path.exists():
+                self._centroids = np.load(self.centroids_path)
+                self._trained_on = meta.get("trained_on", count)
+                self._refresh_assignments()
+        self._generation += 1
+        self._loaded = True
+
+    def _refresh_rows(self):
+        """Reads rows other processes appended to, or tombstoned in, `ids.bin`."""
+        raw_ids = np.fromfile(self.ids_path, dtype=np.uint8)
+        count = min(len(raw_ids) // self.ID_BYTES, self.vectors_path.stat().st_size // (self.dim * 4))
+        raw_ids = raw_ids[:count * self.ID_BYTES].reshape(count, self.ID_BYTES)
+        present = raw_ids.any(axis=1)
+        for row in np.flatnonzero(self._valid & ~present[:self._count]):
+            self.rows.pop(self._row_ids[row], None)
+            self._row_ids[row] = None
+        for row in range(self._count, count):
+            item_id = uuid.UUID(bytes=raw_ids[row].tobytes()) if present[row] else None
+            self._row_ids.append(item_id)
+            if item_id:
+                self.rows[item_id] = row
+        self._valid = present
+        self._remap(count)
+
+    def _refresh_assignments(self):
+        if self.assignments_path.exists():
+            self._assignments = np.fromfile(self.assignments_path, dtype=np.int32)[:self._count]
+        else:
+            self._assignments = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    def _remap(self, count: int):
+        self._count = count
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim)) if count else None
+
+    def _write_meta(self):
+        self.meta_path.write_text(json.dumps({"dim": self.dim, "model": self.model, "trained_on": self._trained_on}))
+
+    def __len__(self) -> int:
+        with self._locked():
+            return len(self.rows)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return vectors / norms
+
+    def add(self, item_ids: Sequence[uuid.UUID], vectors, model: Optional[str] = None):
+        """Stores (or replaces) the embeddings of the given items."""
+        if not item_ids:
+            return
+        vectors = self._normalize(vectors)
+        with self._locked(exclusive=True):
+            if self.dim is None:
+                self.dim, self.model = vectors.shape[1], model
+                self._write_meta()
+                self.vectors_path.touch()
+                self.ids_path.touch()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}; rebuild the index after changing models")
+
+            new_ids, new_rows = [], []
+            with open(self.vectors_path, "r+b") as f:
+                for item_id, vector in zip(item_ids, vectors):
+                    row = self.rows.get(item_id)
+                    if row is None:
+                        new_ids.append(item_id)
+                        new_rows.append(vector)
+                        continue
+                    f.seek(row * self.dim * 4)
+                    f.write(vector.tobytes())
+                    if self._centroids is not None:
+                        self._reassign_row(row, vector)
+            if new_ids:
+                new_rows = np.asarray(new_rows, dtype=np.float32)
+                with open(self.vectors_path, "ab") as f:
+                    f.write(new_rows.tobytes())
+                with open(self.ids_path, "ab") as f:
+                    f.write(b"".join(item_id.bytes for item_id in new_ids))
+                for offset, item_id in enumerate(new_ids):
+                    self.rows[item_id] = self._count + offset
+                self._row_ids.extend(new_ids)
+                self._valid = np.concatenate([self._valid, np.ones(len(new_ids), dtype=bool)])
+                if self._centroids is not None:
+                    self._assign_rows(new_rows)
+            self._remap(self._count + len(new_ids))
+
+    def _assign_rows(self, vectors: np.ndarray):
+        """Appends the nearest cluster of each of `vectors` (rows at the end of the index)."""
+        assigned = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 8192):
+            assigned[start:start + 8192] = (vectors[start:start + 8192] @ self._centroids.T).argmax(axis=1)
+        with open(self.assignments_path, "ab") as f:
+            f.write(assigned.tobytes())
+        self._assignments = np.concatenate([self._assignments, assigned])
+        self._lists = None
+
+    def _reassign_row(self, row: int, vector: np.ndarray):
+        cluster = int((self._centroids @ vector).argmax())
+        with open(self.assignments_path, "r+b") as f:
+            f.seek(row * 4)
+            f.write(np.int32(cluster).tobytes())
+        self._assignments[row] = cluster
+        self._lists = None
+
+    def remove(self, item_id: uuid.UUID):
+        with self._locked(exclusive=True):
+            row = self.rows.pop(item_id, None)
+            if row is None:
+                return
+            with open(self.vectors_path, "r+b") as f:
+                f.seek(row * self.dim * 4)
+                f.write(bytes(self.dim * 4))
+            with open(self.ids_path, "r+b") as f:
+                f.seek(row * self.ID_BYTES)
+                f.write(bytes(self.ID_BYTES))
+            self._valid[row] = False
+            self._row_ids[row] = None
+
+    def get(self, item_id: uuid.UUID) -> Optional[np.ndarray]:
+        with self._locked():
+            row = self.rows.get(item_id)
+            return None if row is None else np.array(self._matrix[row])
+
+    def needs_training(self) -> bool:
+        """True once the index is big enough for IVF, or has grown 4x since it was last trained."""
+        with self._locked():
+            size = len(self.rows)
+            return size >= IVF_MIN_ITEMS and (self._centroids is None or size >= 4 * self._trained_on)
+
+    def train(self, iterations: int = 8, seed: int = 0):
+        """
+        Clusters the stored vectors into ~sqrt(n) cells with spherical k-means
+        on a sample, then assigns every row to its nearest cell. Takes seconds
+        at a few hundred thousand vectors, so run it off the request path.
+        """
+        with self._locked():
+            rows = np.flatnonzero(self._valid)
+            if len(rows) == 0:
+                return
+            matrix, count, generation = self._matrix, self._count, self._generation
+
+        rng = np.random.default_rng(seed)
+        clusters = max(1, min(int(math.sqrt(len(rows))), 4096))
+        sample = np.sort(rng.choice(rows, size=min(len(rows), clusters * 64), replace=False))
+        sample = np.asarray(matrix[sample], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=clusters, replace=False)]
+        for _ in range(iterations):
+            nearest = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, sample)
+            empty = np.bincount(nearest, minlength=clusters) == 0
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = self._normalize(sums)
+
+        assignments = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 8192):
+            assignments[start:start + 8192] = (np.asarray(matrix[start:start + 8192]) @ centroids.T).argmax(axis=1)
+
+        with self._locked(exclusive=True):
+            if self._generation != generation:
+                return # Compacted, reset or trained by another process meanwhile; the rows moved
+            np.save(self.centroids_path, centroids)
+            assignments.tofile(self.assignments_path)
+            self._centroids, self._assignments, self._lists = centroids, assignments, None
+            self._trained_on = len(rows)
+            self._write_meta()
+            # Rows added while training was running
+            if self._count > count:
+                self._assign_rows(np.asarray(self._matrix[count:self._count]))
+
+    def _inverted_lists(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Row numbers grouped by cluster, plus the offset of each cluster's group."""
+        if self._lists is None:
+            order = np.argsort(self._assignments, kind="stable").astype(np.int64)
+            bounds = np.searchsorted(self._assignments[order], np.arange(len(self._centroids) + 1))
+            self._lists = (order, bounds)
+        return self._lists
+
+    def search(self, vector, k: int = 10, exclude: Optional[uuid.UUID] = None, nprobe: int = IVF_NPROBE) -> List[Tuple[uuid.UUID, float]]:
+        """Returns up to `k` (item id, cosine similarity) pairs, most similar first."""
+        with self._locked():
+            matrix, valid, dim, row_ids = self._matrix, self._valid, self.dim, self._row_ids
+            exclude_row = self.rows.get(exclude) if exclude is not None else None
+            centroids = self._centroids
+            lists = self._inverted_lists() if centroids is not None else None
+        if matrix is None or k <= 0:
+            return []
+        query = self._normalize(vector)[0]
+        if query.shape[0] != dim:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match index dimension {dim}")
+
+        candidates = None
+        if centroids is not None and k * 4 < len(matrix):
+            order, bounds = lists
+            # Closest clusters first, adding more until there are enough candidates for k
+            probe = np.argsort(-(centroids @ query))
+            sizes = bounds[probe + 1] - bounds[probe]
+            needed = max(nprobe, int(np.searchsorted(np.cumsum(sizes), k * 2)) + 1)
+            candidates = np.concatenate([order[bounds[c]:bounds[c + 1]] for c in probe[:needed]])
+            candidates.sort()
+            scores = np.asarray(matrix[candidates]) @ query
+            scores[~valid[candidates]] = -np.inf
+            if exclude_row is not None:
+                scores[candidates == exclude_row] = -np.inf
+        else:
+            scores = matrix @ query
+            scores[~valid[:len(scores)]] = -np.inf
+            if exclude_row is not None:
+                scores[exclude_row] = -np.inf
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = candidates[top] if candidates is not None else top
+        return [(row_ids[row], float(score)) for row, score in zip(rows, scores[top]) if np.isfinite(score) and row_ids[row] is not None]
+
+    def compact(self):
+        """Rewrites the index without tombstoned rows."""
+        with self._locked(exclusive=True):
+            if self._matrix is None:
+                return
+            keep = sorted(self.rows.items(), key=lambda entry: entry[1])
+            rows = [row for _, row in keep]
+            files = [
+                (self.vectors_path, np.asarray(self._matrix[rows], dtype=np.float32).tobytes()),
+                (self.ids_path, b"".join(item_id.bytes for item_id, _ in keep)),
+            ]
+            if self._centroids is not None:
+                files.append((self.assignments_path, self._assignments[rows].tobytes()))
+            for path, data in files:
+                tmp = path.with_suffix(".tmp")
+                tmp.write_bytes(data)
+                os.replace(tmp, path)
+            self._write_meta() # Tells other processes to reload
+            self._load()
+
+    def reset(self):
+        """Drops every stored vector, e.g. before re-embedding with another model."""
+        with self._locked(exclusive=True):
+            for path in (self.vectors_path, self.ids_path, self.meta_path, self.centroids_path, self.assignments_path):
+                path.unlink(missing_ok=True)
+            self._loaded = False
+
+# Global instance
+vector_index = VectorIndex()
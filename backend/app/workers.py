@@ -1,10 +1,22 @@
 import asyncio
-from sqlmodel import Session, select
+from sqlmodel import Session, select, update
 from app.models import engine, ContentItem, ContentStatus
+from app.database import db_writer, db_reader
 import json
+from typing import List, Optional
 from litellm import completion
 
-from app.services.llm import LLMService
+from app.services.llm import BatchResult, LLMService, TaggingError
+from app.services.executors import executors
+from app.services.job_queue import job_queue, index_queue
+from app.services.leases import leases
+from app.services.bulk_jobs import bulk_jobs
+from app.services.llm_cache import llm_cache
+from app.services.search import index_item
+from app.services.embeddings import embedding_service
+from app.services.vector_index import vector_index
+from app.services.storage import get_storage
+from app.services.event_broadcaster import broadcaster, has_expired_events, prune_events
 import os
 
 # Initialize LLM Service
@@ -12,8 +24,8 @@ import os
 llm_model = os.getenv("LLM_MODEL", "gpt-3.5-turbo") 
 llm_service = LLMService(model=llm_model)
 
-# Simple worker loop
-# Simple worker loop
+# Blobs are stored under relative paths; the LLM service reads them from here
+storage = get_storage()
 
 import logging
 
@@ -21,12 +33,27 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def process_item(item: ContentItem, session: Session, llm_service: LLMService):
+def prompt_versions(llm_service: LLMService, item: ContentItem) -> List[str]:
+    """
+    Prompt versions whose cached results fit the item: its type's prompt,
+    then the batched prompt if the item can be tagged in a batch.
+    """
+    versions = [llm_service.get_prompt_version(item.storage_path, item.content_type)]
+    if llm_service.is_batchable(storage.get_path(item.storage_path), item.content_type):
+        versions.append(llm_service.get_prompt_version(item.storage_path, item.content_type, batch=True))
+    return versions
+
+async def process_item(item: ContentItem, session: Session, llm_service: LLMService,
+                       generated: Optional[BatchResult] = None):
     """
     Process a single item: extract content, generate metadata via LLM, 
-    merge with existing metadata, and update status.
+    merge with existing metadata, and update status. `generated` is metadata
+    already produced by a batched request (or the error it failed with), used
+    instead of a new LLM call. Failures are recorded with `record_failure`.
     """
     logger.info(f"Processing item: {item.original_filename}")
+    # Claimed by this process (see worker_loop); unclaimed items are handled as-is
+    claimed = item.status == ContentStatus.PROCESSING
     
     # Read content (assuming text for now, or just tagging filename)
     try:
@@ -34,13 +61,30 @@ async def process_item(item: ContentItem, session: Session, llm_service: LLMServ
         existing_metadata = {}
         if item.metadata_json:
             try:
-                existing_metadata = json.loads(item.metadata_json)
+                existing_metadata = await executors.json_loads(item.metadata_json)
             except json.JSONDecodeError:
                 logger.warning(f"Warning: Could not parse existing metadata for item {item.id}")
                 pass
 
-        # Generate new metadata from LLM
-        llm_metadata = await llm_service.generate_metadata(item.storage_path)
+        # Identical bytes tagged with the same prompt and model don't need another LLM call
+        llm_metadata = None
+        fresh_result = False
+        if item.checksum:
+            prompt_hash, *alternatives = prompt_versions(llm_service, item)
+            llm_metadata = await db_reader.run(llm_cache.get, session, item.checksum, prompt_hash, llm_service.model, alternatives)
+
+        if llm_metadata is None:
+            if generated is not None:
+                # Cached under the version of the prompt that actually produced it
+                llm_metadata, prompt_hash = generated
+                if isinstance(llm_metadata, Exception):
+                    raise llm_metadata
+            else:
+                # Generate new metadata from LLM
+                llm_metadata = await llm_service.generate_metadata(
+                    storage.get_path(item.storage_path), content_type=item.content_type
+                )
+            fresh_result = bool(item.checksum)
         
         # Merge: existing metadata takes precedence? 
         # Requirement: "not overwritten by the LLM, unless there is metadata key collisions, which LLM can overwrite"
@@ -52,28 +96,337 @@ async def process_item(item: ContentItem, session: Session, llm_service: LLMServ
         merged_metadata = existing_metadata.copy()
         merged_metadata.update(llm_metadata)
         
-        item.metadata_json = json.dumps(merged_metadata)
-        item.status = ContentStatus.TAGGED
-        session.add(item)
-        session.commit()
-        logger.info(f"Item {item.id} tagged. Metadata: {merged_metadata}")
+        # Large metadata (e.g. long OCR text) is encoded off the event loop. The
+        # estimate covers what the LLM added, not only the drop-time metadata
+        size_hint = len(item.metadata_json or "") + sum(len(str(value)) for value in llm_metadata.values())
+        metadata_json = await executors.json_dumps(merged_metadata, size_hint=size_hint)
+
+        def save_metadata() -> bool:
+            if fresh_result:
+                llm_cache.put(session, item.checksum, prompt_hash, llm_service.model, llm_metadata)
+            elif item.checksum:
+                llm_cache.touch(session, item.checksum, prompt_hash, llm_service.model, alternatives)
+            # A lease that expired while the LLM was busy may have been taken over.
+            # Checked before the item is modified, so autoflush can't write it early
+            if claimed and not leases.holds(session, item.id):
+                session.commit()
+                return False
+            item.metadata_json = metadata_json
+            item.status = ContentStatus.TAGGED
+            item.lease_owner = None
+            item.lease_expires_at = None
+            session.add(item)
+            index_item(session, item, merged_metadata)
+            session.commit()
+            return True
+
+        if not await db_writer.run(save_metadata):
+            logger.warning(f"Lost the lease on item {item.id}; another worker is tagging it")
+            return
+        logger.info(f"Item {item.id} tagged ({len(merged_metadata)} metadata keys)")
+        logger.debug(f"Item {item.id} metadata: {merged_metadata}")
         
         # Broadcast event
-        from app.services.event_broadcaster import broadcaster
         await broadcaster.broadcast(json.dumps({"type": "update", "item_id": str(item.id)}))
 
+        if embedding_service.enabled:
+            index_queue.enqueue(item.id)
+
     except Exception as e:
         logger.error(f"Error processing item {item.id}: {e}", exc_info=True)
+        await record_failure(item, session, e)
 
 
-async def process_unprocessed_items():
+async def record_failure(item: ContentItem, session: Session, error: Exception):
+    """
+    Counts a failed attempt: the item is retried with exponential backoff, or
+    marked FAILED for good after a permanent error or WORKER_MAX_ATTEMPTS
+    (see `LeaseManager.fail`). Errors other than `TaggingError` (a broken
+    file, a database error) count as transient.
+    """
+    transient = getattr(error, "transient", True)
+    message = str(error) if isinstance(error, TaggingError) else f"{type(error).__name__}: {error}"
+
+    def fail():
+        # Whatever the failed attempt left in the session is discarded
+        session.rollback()
+        return leases.fail(session, item.id, message, transient)
+
+    try:
+        status = await db_writer.run(fail)
+    except Exception as e:
+        logger.error(f"Error recording the failure of item {item.id}: {e}", exc_info=True)
+        return
+    if status == ContentStatus.FAILED:
+        logger.warning(f"Giving up on item {item.id}: {message}")
+    if status is not None:
+        await broadcaster.broadcast(json.dumps({"type": "update", "item_id": str(item.id)}))
+
+
+async def index_items(item_ids: list):
+    """
+    Embeds a batch of TAGGED items in one request, stores the vectors in the
+    on-disk index and marks the items INDEXED.
+    """
+    def load_items():
+        with Session(engine) as session:
+            statement = select(ContentItem).where(ContentItem.id.in_(item_ids)).where(ContentItem.status == ContentStatus.TAGGED)
+            return session.exec(statement).all()
+
+    items = await db_reader.run(load_items)
+    if not items:
+        return
+
+    texts = []
+    for item in items:
+        try:
+            metadata = await executors.json_loads(item.metadata_json or "{}")
+        except json.JSONDecodeError:
+            metadata = {}
+        texts.append(embedding_service.document_text(item, metadata))
+
+    vectors = await embedding_service.embed(texts)
+    ids = [item.id for item in items]
+    await asyncio.to_thread(vector_index.add, ids, vectors, embedding_service.model)
+    if vector_index.needs_training():
+        logger.info("Training the vector index partition")
+        await asyncio.to_thread(vector_index.train)
+
+    def mark_indexed():
+        with Session(engine) as session:
+            session.exec(
+                update(ContentItem)
+                .where(ContentItem.id.in_(ids))
+                .where(ContentItem.status == ContentStatus.TAGGED)
+                .values(status=ContentStatus.INDEXED)
+            )
+            session.commit()
+
+    await db_writer.run(mark_indexed)
+    logger.info(f"Indexed {len(ids)} item(s)")
+
+    for item_id in ids:
+        await broadcaster.broadcast(json.dumps({"type": "update", "item_id": str(item_id)}))
+
+
+async def indexer_loop():
+    """Consumes the index queue in batches of up to EMBEDDING_BATCH_SIZE items."""
+    max_wait = float(os.getenv("EMBEDDING_BATCH_WAIT", "0.5"))
     while True:
+        item_ids = await index_queue.get_batch(embedding_service.batch_size, max_wait)
+        try:
+            await index_items(item_ids)
+        except Exception as e:
+            # Items stay TAGGED and are picked up again on the next start
+            logger.error(f"Error indexing {len(item_ids)} item(s): {e}", exc_info=True)
+        finally:
+            for item_id in item_ids:
+                index_queue.task_done(item_id)
+
+
+async def recover_unprocessed_items():
+    """
+    Re-queues TAGGED items that still need their embedding. Items left
+    UNPROCESSED (or PROCESSING by a crashed worker) are picked up by
+    `lease_loop` instead.
+    """
+    if not embedding_service.enabled:
+        return
+
+    def load_tagged_ids():
+        with Session(engine) as session:
+            statement = select(ContentItem.id).where(ContentItem.status == ContentStatus.TAGGED).order_by(ContentItem.created_at)
+            return session.exec(statement).all()
+
+    tagged_ids = await db_reader.run(load_tagged_ids)
+    for item_id in tagged_ids:
+        index_queue.enqueue(item_id)
+    if tagged_ids:
+        logger.info(f"Recovered {len(tagged_ids)} item(s) waiting for indexing")
+
+
+def claim(item_id) -> bool:
+    with Session(engine) as session:
+        return leases.claim(session, item_id)
+
+
+def release(item_ids: list):
+    with Session(engine) as session:
+        leases.release(session, item_ids)
+
+
+async def lease_loop(concurrency: int):
+    """
+    Keeps this process's leases alive and claims work from the database:
+    uploads handled by other processes, items left behind by a crash once
+    their lease expires, and anything waiting at startup. Claimed ids go
+    onto the local queue, topping it up to `concurrency` waiting items.
+    """
+    poll_interval = float(os.getenv("WORKER_POLL_INTERVAL", "5"))
+    renew_every = leases.lease_seconds / 3
+    last_renewal = asyncio.get_running_loop().time()
+
+    def renew():
+        with Session(engine) as session:
+            leases.renew(session)
+
+    def holding() -> bool:
+        with Session(engine) as session:
+            return leases.holds_any(session)
+
+    def waiting() -> bool:
         with Session(engine) as session:
-            statement = select(ContentItem).where(ContentItem.status == ContentStatus.UNPROCESSED)
-            results = session.exec(statement)
-            items = results.all()
-            
-            for item in items:
-                await process_item(item, session, llm_service)
-                
-        await asyncio.sleep(5) # Poll every 5 seconds
+            return leases.has_waiting(session)
+
+    def claim_waiting(limit: int):
+        with Session(engine) as session:
+            return leases.claim_batch(session, limit)
+
+    while True:
+        claimed = []
+        try:
+            # Each write is preceded by a read-only check, so an idle worker
+            # only reads: it never queues for the write lock
+            now = asyncio.get_running_loop().time()
+            if now - last_renewal >= renew_every:
+                if await db_reader.run(holding):
+                    await db_writer.run(renew)
+                if await db_reader.run(has_expired_events):
+                    await db_writer.run(prune_events)
+                last_renewal = now
+            room = concurrency - job_queue.qsize()
+            if room > 0 and await db_reader.run(waiting):
+                claimed = await db_writer.run(claim_waiting, room)
+                for item_id in claimed:
+                    job_queue.enqueue(item_id)
+                if claimed:
+                    logger.info(f"Claimed {len(claimed)} waiting item(s)")
+        except Exception as e:
+            logger.error(f"Error claiming items: {e}", exc_info=True)
+        # A full batch means more is probably waiting: check again as soon as the queue has room
+        await asyncio.sleep(0.1 if claimed and len(claimed) >= room else poll_interval)
+
+
+async def is_batch_candidate(item: ContentItem, session: Session) -> bool:
+    """Small text files without a cached result can share an LLM request."""
+    if not llm_service.is_batchable(storage.get_path(item.storage_path), item.content_type):
+        return False
+    if not item.checksum:
+        return True
+    prompt_hash, *alternatives = prompt_versions(llm_service, item)
+    return not await db_reader.run(llm_cache.contains, session, item.checksum, prompt_hash, llm_service.model, alternatives)
+
+
+async def collect_batch(session: Session, max_items: int, taken: list) -> list:
+    """
+    Takes up to `max_items` more batch candidates that are already waiting in
+    the queue. Ids taken off the queue are appended to `taken`; other items
+    are put back for the next worker.
+    """
+    batch, put_back = [], []
+    for _ in range(max_items):
+        item_id = job_queue.get_nowait()
+        if item_id is None:
+            break
+        item = await db_reader.run(session.get, ContentItem, item_id)
+        if item and item.status in (ContentStatus.UNPROCESSED, ContentStatus.PROCESSING) \
+                and not await is_batch_candidate(item, session):
+            put_back.append(item_id)
+            continue
+        taken.append(item_id)
+        if item and await db_writer.run(claim, item_id):
+            await db_reader.run(session.refresh, item)
+            batch.append(item)
+    for item_id in put_back:
+        job_queue.requeue(item_id)
+    return batch
+
+
+async def process_batch(items: list, session: Session):
+    """Tags several small text files with shared LLM requests, then saves each as usual."""
+    results = await llm_service.generate_metadata_batch(
+        [storage.get_path(item.storage_path) for item in items], [item.content_type for item in items]
+    )
+    for item, result in zip(items, results):
+        await process_item(item, session, llm_service, generated=result)
+
+
+async def worker_loop():
+    """
+    Consumes the job queue, one LLM request at a time. When the item is a
+    small text file, other small text files already waiting in the queue
+    (up to LLM_BATCH_SIZE in total) are tagged in the same request.
+    """
+    batch_size = max(1, int(os.getenv("LLM_BATCH_SIZE", "8")))
+    while True:
+        item_id = await job_queue.get()
+        taken = [item_id]
+        try:
+            with Session(engine) as session:
+                # The item may have been deleted, handled in the meantime or claimed by another process
+                item = None
+                if await db_writer.run(claim, item_id):
+                    item = await db_reader.run(session.get, ContentItem, item_id)
+                if item:
+                    batch = [item]
+                    if batch_size > 1 and await is_batch_candidate(item, session):
+                        batch += await collect_batch(session, batch_size - 1, taken)
+                    if len(batch) > 1:
+                        await process_batch(batch, session)
+                    else:
+                        await process_item(item, session, llm_service)
+        except Exception as e:
+            logger.error(f"Error loading item {item_id}: {e}", exc_info=True)
+        finally:
+            # Items that weren't tagged go back for a later attempt
+            try:
+                await db_writer.run(release, taken)
+            except Exception as e:
+                logger.error(f"Error releasing {len(taken)} item(s): {e}", exc_info=True)
+            for taken_id in taken:
+                job_queue.task_done(taken_id)
+
+
+async def process_unprocessed_items():
+    """
+    Event-driven worker pool: WORKER_CONCURRENCY loops wait on the in-process
+    job queue, which the upload endpoints push to, so a bulk drop is tagged
+    in parallel without waiting for a poll. Every item is claimed with a
+    lease before it is tagged, so any number of processes (API processes
+    running this pool and standalone `python -m app.workers`) can share the
+    work without tagging an item twice; `lease_loop` claims what no local
+    upload announced. Bulk jobs (including storage sweeps) run on their own
+    loop. Per-model rate limits are enforced by the LLM service itself.
+    Tagged items then go through a single batching indexer loop
+    that computes their embeddings.
+    """
+    await recover_unprocessed_items()
+
+    concurrency = max(1, int(os.getenv("WORKER_CONCURRENCY", "4")))
+    logger.info(f"Starting {concurrency} worker(s) as {leases.owner}")
+    loops = [worker_loop() for _ in range(concurrency)]
+    loops.append(lease_loop(concurrency))
+    loops.append(bulk_jobs.run_forever(storage))
+    if embedding_service.enabled:
+        loops.append(indexer_loop())
+    await asyncio.gather(*loops)
+
+
+async def main():
+    """Standalone worker: `python -m app.workers`, alongside API processes started with RUN_WORKER=false."""
+    from app.models import create_db_and_tables
+    create_db_and_tables()
+    # LLM, storage and queue metrics live in this process; Prometheus scrapes them here
+    metrics_port = int(os.getenv("WORKER_METRICS_PORT", "0"))
+    if metrics_port:
+        from prometheus_client import start_http_server
+        start_http_server(metrics_port)
+        logger.info(f"Serving metrics on port {metrics_port}")
+    try:
+        await process_unprocessed_items()
+    finally:
+        executors.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
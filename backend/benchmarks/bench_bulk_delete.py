@@ -0,0 +1,101 @@
+"""
+Clearing thousands of items: one DELETE /api/items/{id} per item versus a
+single bulk delete job (POST /api/jobs, then run by a worker in chunks).
+
+Items are imported with distinct content, so every delete also removes a
+blob. Everything goes through the real routes into a temporary database
+and blob directory, in process.
+
+Usage (from backend/): python -m benchmarks.bench_bulk_delete [--items 5000]
+"""
+import argparse
+import asyncio
+import io
+import logging
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+from sqlmodel import Session, func, select
+
+from app import api
+from app.database import create_sqlite_engine
+from app.main import app
+from app.models import ContentItem, create_db_and_tables, get_session
+from app.services import bulk_jobs as bulk_module
+from app.services.bulk_jobs import BulkJobRunner
+from app.services.executors import executors
+from app.services.storage import FileSystemStorage
+from app.services.vector_index import VectorIndex
+
+def make_tar(prefix: str, count: int) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for i in range(count):
+            data = f"{prefix} note {i}".encode()
+            info = tarfile.TarInfo(f"{prefix}/note-{i}.md")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def count_items(engine) -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(ContentItem)).one()
+
+async def run(items: int, engine, storage: FileSystemStorage):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=3600) as client:
+        for prefix in ("serial", "bulk"):
+            response = await client.post("/api/ingest/archive", files={"file": (f"{prefix}.tar", make_tar(prefix, items))})
+            response.raise_for_status()
+
+        with Session(engine) as session:
+            ids = session.exec(select(ContentItem.id).where(ContentItem.original_filename.startswith("serial/"))).all()
+        start = time.perf_counter()
+        for item_id in ids:
+            (await client.delete(f"/api/items/{item_id}")).raise_for_status()
+        elapsed = time.perf_counter() - start
+        print(f"{'DELETE per item':>18}: {len(ids)} items in {elapsed:6.1f}s ({len(ids) / elapsed:6.0f} items/s)")
+
+        start = time.perf_counter()
+        response = await client.post("/api/jobs", json={"action": "delete", "after": "2000-01-01T00:00:00"})
+        response.raise_for_status()
+        submitted = time.perf_counter() - start
+        await BulkJobRunner("bench").run_pending(storage)
+        elapsed = time.perf_counter() - start
+        job = (await client.get(f"/api/jobs/{response.json()['id']}")).json()
+        print(f"{'bulk delete job':>18}: {job['processed']} items in {elapsed:6.1f}s ({job['processed'] / elapsed:6.0f} items/s), "
+              f"hidden from listings after {submitted * 1000:.0f} ms, {count_items(engine)} left")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        engine = create_sqlite_engine(f"sqlite:///{tmp / 'bench.db'}")
+        create_db_and_tables(engine)
+
+        def bench_session():
+            with Session(engine) as session:
+                yield session
+        app.dependency_overrides[get_session] = bench_session
+
+        storage = FileSystemStorage(str(tmp / "blobs"))
+        vectors = VectorIndex(tmp / "vectors")
+        with patch.object(api, "storage", storage), \
+             patch.object(api, "vector_index", vectors), \
+             patch.object(bulk_module, "vector_index", vectors), \
+             patch.object(api.job_queue, "enqueue", lambda item_id: None), \
+             patch.object(bulk_module, "engine", engine), \
+             patch.object(bulk_module, "GC_INTERVAL_SECONDS", 0):
+            asyncio.run(run(args.items, engine, storage))
+        executors.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Peak memory of preparing one large text file and one large photo for the
+LLM: reading everything (the previous behaviour) versus bounded extractors.
+Each case runs in a fresh process and reports its peak RSS growth
+(Linux only).
+
+Usage (from backend/): python -m benchmarks.bench_extractors [--text-mb 500] [--megapixels 100]
+"""
+import argparse
+import base64
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+def peak_rss_mb() -> float:
+    # VmHWM rather than ru_maxrss, which a spawned child inherits from its parent on Linux
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError("VmHWM not available (Linux only)")
+
+def run_case(case: str, path: str, queue):
+    from app.services.extractors import prepare_image, read_text_excerpt
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    if case == "text, read all":
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            f.read()
+    elif case == "text, excerpt":
+        read_text_excerpt(path, 2596 * 8)
+    elif case == "image, base64 all":
+        with open(path, "rb") as f:
+            base64.b64encode(f.read()).decode("utf-8")
+    elif case == "image, downscaled":
+        prepare_image(path)
+    queue.put((peak_rss_mb() - baseline, time.perf_counter() - start))
+
+def measure(case: str, path: str):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_case, args=(case, path, queue))
+    process.start()
+    growth, seconds = queue.get()
+    process.join()
+    print(f"{case:>18}: +{growth:7.1f} MB peak RSS, {seconds * 1000:7.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--text-mb", type=int, default=500)
+    parser.add_argument("--megapixels", type=int, default=100)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text_path = Path(tmp) / "big.log"
+        line = b"2024-01-01T00:00:00 INFO request handled in 12ms path=/api/items\n"
+        with open(text_path, "wb") as f:
+            block = line * (1024 * 1024 // len(line))
+            for _ in range(args.text_mb):
+                f.write(block)
+
+        from PIL import Image
+        side = int((args.megapixels * 1_000_000) ** 0.5)
+        image_path = Path(tmp) / "photo.jpg"
+        Image.effect_noise((side, side), 64).convert("RGB").save(image_path, quality=90)
+        print(f"{args.text_mb} MB log, {side}x{side} JPEG ({image_path.stat().st_size / 1e6:.0f} MB)")
+
+        for case in ("text, read all", "text, excerpt"):
+            measure(case, str(text_path))
+        for case in ("image, base64 all", "image, downscaled"):
+            measure(case, str(image_path))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Importing a folder of small notes: one /api/upload request per file (the
+fastest per-file path the frontend has; the presigned flow adds two more
+round-trips) versus a single /api/ingest/archive request with the folder
+as a tar.gz or zip.
+
+Both go through the real routes into a temporary database and blob
+directory, in process; enqueueing for tagging is stubbed out. Per-file
+uploads are timed on a sample and extrapolated to the full count.
+
+Usage (from backend/): python -m benchmarks.bench_ingest [--files 100000] [--sample 2000] [--size 2048]
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+import httpx
+from sqlmodel import Session, func, select
+
+from app import api
+from app.database import create_sqlite_engine
+from app.main import app
+from app.models import ContentItem, create_db_and_tables, get_session
+from app.services.executors import executors
+from app.services.storage import FileSystemStorage
+
+def notes(count: int, size: int):
+    for i in range(count):
+        # Distinct content so nothing is deduplicated
+        yield f"notes/{i // 1000:03d}/note-{i}.md", i.to_bytes(8, "big") + os.urandom(size - 8)
+
+def make_tar(count: int, size: int) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz", compresslevel=1) as archive:
+        for name, data in notes(count, size):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def make_zip(count: int, size: int) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=1) as archive:
+        for name, data in notes(count, size):
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+async def per_file(client: httpx.AsyncClient, count: int, size: int) -> float:
+    start = time.perf_counter()
+    for name, data in notes(count, size):
+        response = await client.post("/api/upload", files={"file": (name, data)})
+        response.raise_for_status()
+    return time.perf_counter() - start
+
+async def archive(client: httpx.AsyncClient, filename: str, body: bytes) -> float:
+    start = time.perf_counter()
+    response = await client.post("/api/ingest/archive", files={"file": (filename, body)})
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+def count_items(engine) -> int:
+    with Session(engine) as session:
+        return session.exec(select(func.count()).select_from(ContentItem)).one()
+
+async def run(files: int, sample: int, size: int, engine):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=3600) as client:
+        elapsed = await per_file(client, sample, size)
+        rate = sample / elapsed
+        print(f"{'/api/upload per file':>28}: {sample} files in {elapsed:6.1f}s ({rate:7.0f} files/s), "
+              f"{files} files would take ~{files / rate / 60:.1f} min")
+
+        for label, filename, build in (("/api/ingest/archive, tar.gz", "notes.tar.gz", make_tar),
+                                       ("/api/ingest/archive, zip", "notes.zip", make_zip)):
+            body = build(files, size)
+            before = count_items(engine)
+            elapsed = await archive(client, filename, body)
+            created = count_items(engine) - before
+            print(f"{label:>28}: {created} files in {elapsed:6.1f}s ({created / elapsed:7.0f} files/s), "
+                  f"{len(body) / 2**20:.0f} MB archive")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=100_000)
+    parser.add_argument("--sample", type=int, default=2000, help="Files uploaded one by one")
+    parser.add_argument("--size", type=int, default=2048, help="Bytes per file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        engine = create_sqlite_engine(f"sqlite:///{tmp / 'bench.db'}")
+        create_db_and_tables(engine)
+
+        def bench_session():
+            with Session(engine) as session:
+                yield session
+        app.dependency_overrides[get_session] = bench_session
+
+        with patch.object(api, "storage", FileSystemStorage(str(tmp / "blobs"))), \
+             patch.object(api.job_queue, "enqueue", lambda item_id: None):
+            asyncio.run(run(args.files, args.sample, args.size, engine))
+        executors.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Prompt tokens and wall time for tagging many small text files, one request
+per file versus batched requests, against a simulated LLM endpoint.
+
+Usage (from backend/): python -m benchmarks.bench_llm_batch [--files 200] [--latency 0.3]
+"""
+import argparse
+import asyncio
+import json
+import re
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+from app.services.llm import LLMService
+
+def fake_llm(latency: float, per_token: float, stats: dict):
+    """Answers like a model would, taking a fixed round-trip plus time per prompt token."""
+    async def acompletion(model, api_base, messages):
+        prompt = messages[0]["content"]
+        tokens = len(prompt) // 4
+        stats["requests"] += 1
+        stats["prompt_tokens"] += tokens
+        await asyncio.sleep(latency + tokens * per_token)
+        file_ids = re.findall(r"^=== FILE (\d+):", prompt, re.MULTILINE)
+        answer = {"summary": "A snippet", "tags": ["code"], "sentiment": "neutral"}
+        content = json.dumps([{"file": int(i), **answer} for i in file_ids] if file_ids else answer)
+        return MagicMock(choices=[MagicMock(message=MagicMock(content=content))])
+    return acompletion
+
+async def run(paths, batch_size: int, concurrency: int, llm_factory) -> dict:
+    stats = {"requests": 0, "prompt_tokens": 0}
+    service = LLMService(model="gpt-3.5-turbo")
+    queue = list(paths)
+
+    async def worker():
+        while queue:
+            batch = [queue.pop() for _ in range(min(batch_size, len(queue)))]
+            if batch_size == 1:
+                await service.generate_metadata(batch[0])
+            else:
+                await service.generate_metadata_batch(batch)
+
+    start = time.perf_counter()
+    with patch("app.services.llm.acompletion", llm_factory(stats)):
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.3, help="Seconds per request round-trip")
+    parser.add_argument("--per-token", type=float, default=0.0002, help="Seconds of prefill per prompt token")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(args.files):
+            path = Path(tmp) / f"snippet{i}.py"
+            path.write_text(f"def helper_{i}(value):\n    # Small utility number {i}\n    return value * {i}\n")
+            paths.append(str(path))
+
+        factory = lambda stats: fake_llm(args.latency, args.per_token, stats)
+        for label, batch_size in (("single", 1), (f"batch of {args.batch_size}", args.batch_size)):
+            stats = asyncio.run(run(paths, batch_size, args.concurrency, factory))
+            print(f"{label:>12}: {stats['requests']} requests, {stats['prompt_tokens']} prompt tokens, {stats['seconds']:.1f}s")
+
+if __name__ == "__main__":
+    main()
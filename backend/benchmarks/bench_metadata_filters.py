@@ -0,0 +1,103 @@
+"""
+Listing items by LLM metadata: loading every row and filtering the parsed
+`metadata_json` in Python, versus the /api/items metadata filters (the
+indexed `sentiment` column, the `itemtag` table, json_extract for other keys).
+
+Usage (from backend/): python -m benchmarks.bench_metadata_filters [--items 200000]
+"""
+import argparse
+import json
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from fastapi import Response
+from sqlalchemy import text
+from sqlmodel import Session
+from app.api import read_items
+from app.database import create_sqlite_engine
+from app.models import create_db_and_tables
+
+SENTIMENTS = ["positive", "negative", "neutral", "mixed", "Positive"]
+LANGUAGES = ["en", "de", "fr", "it", "es"]
+TAGS = [f"tag{i}" for i in range(500)]
+PAGE = 100
+
+def populate(engine, count: int):
+    base = datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, count, 10000):
+            items, tags = [], []
+            for i in range(start, min(start + 10000, count)):
+                item_id = uuid.uuid4().hex
+                item_tags = random.sample(TAGS, 3)
+                metadata = {
+                    "summary": f"Summary of file {i}",
+                    "tags": item_tags,
+                    "sentiment": random.choice(SENTIMENTS),
+                    "language": random.choice(LANGUAGES),
+                }
+                items.append({"id": item_id, "name": f"file{i}.txt", "created_at": base + timedelta(seconds=i),
+                              "metadata": json.dumps(metadata)})
+                tags += [{"id": item_id, "tag": tag} for tag in item_tags]
+            conn.execute(text(
+                "INSERT INTO contentitem (id, status, original_filename, version, storage_path, created_at, metadata_json, is_latest, attempts) "
+                "VALUES (:id, 'TAGGED', :name, 1, :name, :created_at, :metadata, 1, 0)"
+            ), items)
+            conn.execute(text("INSERT INTO itemtag (item_id, tag) VALUES (:id, :tag)"), tags)
+        conn.execute(text("ANALYZE"))
+
+def python_scan(session: Session, key: str, value: str) -> list:
+    """What a client had to do before: fetch everything, parse, filter, sort."""
+    rows = session.exec(text("SELECT id, created_at, metadata_json FROM contentitem WHERE is_latest = 1")).all()
+    matches = []
+    for row in rows:
+        metadata = json.loads(row.metadata_json)
+        field = metadata.get(key)
+        if (value in [tag.lower() for tag in field]) if isinstance(field, list) else str(field).lower() == value:
+            matches.append(row)
+    matches.sort(key=lambda row: (row.created_at, row.id), reverse=True)
+    return matches[:PAGE]
+
+def sql_filter(session: Session, **filters) -> list:
+    params = {"sentiment": None, "tags": None, "metadata": None, **filters}
+    return read_items(Response(), filename=None, content_type=None, status=None, after=None, show_all_versions=False,
+                      cursor=None, limit=PAGE, fields=None, session=session, **params)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(f"sqlite:///{Path(tmp) / 'metadata.db'}")
+        create_db_and_tables(engine)
+        start = time.perf_counter()
+        populate(engine, args.items)
+        print(f"Populated {args.items} items in {time.perf_counter() - start:.1f}s")
+
+        cases = {
+            "sentiment": (lambda: ("sentiment", "positive"), lambda key, value: {"sentiment": value}),
+            "tag": (lambda: ("tags", random.choice(TAGS)), lambda key, value: {"tags": value}),
+            "other key": (lambda: ("language", random.choice(LANGUAGES)), lambda key, value: {"metadata": [f"{key}:{value}"]}),
+        }
+        with Session(engine) as session:
+            for name, (make_filter, as_params) in cases.items():
+                for label, run in (("python scan", lambda key, value: python_scan(session, key, value)),
+                                   ("sql filter", lambda key, value: sql_filter(session, **as_params(key, value)))):
+                    timings = []
+                    for _ in range(args.queries):
+                        key, value = make_filter()
+                        start = time.perf_counter()
+                        run(key, value)
+                        timings.append((time.perf_counter() - start) * 1000)
+                    timings.sort()
+                    print(f"{name:>10} {label:>12}: p50 {statistics.median(timings):8.1f} ms  "
+                          f"max {timings[-1]:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
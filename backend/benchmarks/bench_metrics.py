@@ -0,0 +1,84 @@
+"""
+Cost of the metrics: one GET /metrics scrape (item gauges read from the
+database, then every series rendered) at archive sizes, and the overhead a
+timed storage operation adds to each call.
+
+Usage (from backend/): python -m benchmarks.bench_metrics [--items 1000000]
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from prometheus_client import generate_latest
+from sqlalchemy import text
+from sqlmodel import Session
+from app.database import create_sqlite_engine
+from app.models import create_db_and_tables
+from app.services.metrics import refresh_item_metrics, timed_storage
+
+# Mostly tagged, with a backlog waiting
+STATUSES = ["INDEXED"] * 80 + ["TAGGED"] * 10 + ["UNPROCESSED"] * 8 + ["FAILED"] * 2
+
+def populate(engine, count: int):
+    base = datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, count, 10000):
+            conn.execute(text(
+                "INSERT INTO contentitem (id, status, original_filename, version, storage_path, created_at, metadata_json, is_latest, attempts) "
+                "VALUES (:id, :status, :name, 1, :name, :created_at, '{}', 1, 0)"
+            ), [
+                {"id": uuid.uuid4().hex, "status": random.choice(STATUSES), "name": f"file{i}.txt",
+                 "created_at": base + timedelta(seconds=i)}
+                for i in range(start, min(start + 10000, count))
+            ])
+        conn.execute(text("ANALYZE"))
+
+class Timed:
+    backend = "bench"
+
+    @timed_storage("noop")
+    def timed(self):
+        pass
+
+    def plain(self):
+        pass
+
+def per_call_ns(fn, calls: int = 200_000) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e9
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--scrapes", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(f"sqlite:///{Path(tmp) / 'metrics.db'}")
+        create_db_and_tables(engine)
+        start = time.perf_counter()
+        populate(engine, args.items)
+        print(f"Populated {args.items} items in {time.perf_counter() - start:.1f}s")
+
+        timings = []
+        with Session(engine) as session:
+            for _ in range(args.scrapes):
+                start = time.perf_counter()
+                refresh_item_metrics(session)
+                body = generate_latest()
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        print(f"scrape: p50 {statistics.median(timings):6.1f} ms  max {timings[-1]:6.1f} ms  ({len(body)} bytes)")
+
+    storage = Timed()
+    plain, timed = per_call_ns(storage.plain), per_call_ns(storage.timed)
+    print(f"timed storage call: {timed:.0f} ns vs {plain:.0f} ns untimed (+{timed - plain:.0f} ns)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+S3 backend against moto, with a simulated network round-trip added to every
+request (moto itself answers in-process).
+
+1. Concurrent uploads with boto3 called on the event loop versus on the S3
+   thread pool, measuring wall time and the worst event-loop stall seen by
+   a 10 ms ticker (what every other request would have waited).
+2. Deleting many keys one DeleteObject at a time versus `delete_many`
+   (DeleteObjects, 1000 keys per request) and `adelete_many` (batches in
+   parallel).
+
+Usage (from backend/): python -m benchmarks.bench_s3 [--uploads 200] [--keys 5000] [--rtt-ms 20]
+"""
+import argparse
+import asyncio
+import os
+import time
+from contextlib import nullcontext
+from unittest.mock import patch
+
+from moto import mock_aws
+
+from app.services.s3_storage import S3Storage
+
+class Latency:
+    """Sleeps for one round-trip before each request reaches moto, and counts requests."""
+    def __init__(self, storage: S3Storage, rtt: float):
+        self.rtt = rtt
+        self.enabled = True
+        self.requests = 0
+        storage.s3_client.meta.events.register_first("before-send.s3", self.before_send)
+
+    def before_send(self, **kwargs):
+        if self.enabled:
+            self.requests += 1
+            time.sleep(self.rtt)
+
+async def ticker(stop: asyncio.Event, stalls: list):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        stalls.append(time.perf_counter() - start - 0.01)
+
+async def upload_all(storage: S3Storage, count: int, payload: bytes) -> tuple:
+    stop, stalls = asyncio.Event(), []
+    ticking = asyncio.create_task(ticker(stop, stalls))
+    start = time.perf_counter()
+    await asyncio.gather(*(storage.save(payload, f"file-{i}.bin") for i in range(count)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticking
+    return elapsed, max(stalls, default=0.0)
+
+def bench_uploads(storage: S3Storage, count: int):
+    payload = os.urandom(64 * 1024)
+
+    async def inline(fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+    for label, mode in (("boto3 on the event loop", patch.object(storage, "_run", inline)),
+                        ("S3 thread pool", nullcontext())):
+        with mode:
+            elapsed, stall = asyncio.run(upload_all(storage, count, payload))
+        print(f"{label:>26}: {count} uploads in {elapsed:6.2f}s, longest event-loop stall {stall * 1000:7.1f} ms")
+
+def bench_deletes(storage: S3Storage, keys: int, latency: Latency):
+    names = [f"2024/01/01/{i}.bin" for i in range(keys)]
+
+    def one_by_one(paths):
+        for path in paths:
+            storage.delete(path)
+        return []
+
+    for label, delete in (("delete_object per key", one_by_one),
+                          ("delete_many", storage.delete_many),
+                          ("adelete_many", lambda paths: asyncio.run(storage.adelete_many(paths)))):
+        # Populate without the simulated latency
+        latency.enabled = False
+        for name in names:
+            storage.s3_client.put_object(Bucket=storage.bucket_name, Key=name, Body=b"x")
+        latency.enabled, latency.requests = True, 0
+        start = time.perf_counter()
+        failed = delete(names)
+        elapsed = time.perf_counter() - start
+        print(f"{label:>26}: {keys} keys in {elapsed:6.2f}s with {latency.requests} requests, {len(failed)} failed")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--keys", type=int, default=5000)
+    parser.add_argument("--rtt-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    with mock_aws(), patch.dict(os.environ, {"S3_ACCESS_KEY": "bench", "S3_SECRET_KEY": "bench", "S3_BUCKET_NAME": "bench"}):
+        storage = S3Storage()
+        storage.s3_client.create_bucket(Bucket="bench")
+        latency = Latency(storage, args.rtt_ms / 1000)
+        bench_uploads(storage, args.uploads)
+        bench_deletes(storage, args.keys, latency)
+        storage.io.shutdown()
+
+if __name__ == "__main__":
+    main()
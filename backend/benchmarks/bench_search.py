@@ -0,0 +1,73 @@
+"""
+Latency of /api/search queries over a synthetic archive.
+
+Usage (from backend/): python -m benchmarks.bench_search [--items 1000000]
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from sqlalchemy import text
+from sqlmodel import Session
+from app.database import create_sqlite_engine
+from app.models import create_db_and_tables
+from app.services.search import FTS_TABLE, search_items
+
+WORDS = [f"word{i}" for i in range(5000)]
+TAGS = [f"tag{i}" for i in range(500)]
+
+def populate(engine, count: int):
+    base = datetime(2020, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, count, 10000):
+            items, fts, tags = [], [], []
+            for i in range(start, min(start + 10000, count)):
+                item_id = uuid.uuid4().hex
+                item_tags = random.sample(TAGS, 3)
+                summary = " ".join(random.choices(WORDS, k=12))
+                items.append({"id": item_id, "name": f"file{i}.txt", "created_at": base + timedelta(seconds=i)})
+                fts.append({"id": item_id, "name": f"file{i}.txt", "summary": summary, "tags": " ".join(item_tags)})
+                tags += [{"id": item_id, "tag": tag} for tag in item_tags]
+            conn.execute(text(
+                "INSERT INTO contentitem (id, status, original_filename, version, storage_path, created_at, metadata_json, is_latest) "
+                "VALUES (:id, 'TAGGED', :name, 1, :name, :created_at, '{}', 1)"
+            ), items)
+            conn.execute(text(f"INSERT INTO {FTS_TABLE} (item_id, filename, summary, tags, body) VALUES (:id, :name, :summary, :tags, '')"), fts)
+            conn.execute(text("INSERT INTO itemtag (item_id, tag) VALUES (:id, :tag)"), tags)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_sqlite_engine(f"sqlite:///{Path(tmp) / 'search.db'}")
+        create_db_and_tables(engine)
+        start = time.perf_counter()
+        populate(engine, args.items)
+        print(f"Indexed {args.items} items in {time.perf_counter() - start:.1f}s")
+
+        cases = {
+            "word": lambda: {"query": random.choice(WORDS)},
+            "prefix": lambda: {"query": random.choice(WORDS)[:6]},
+            "two words": lambda: {"query": " ".join(random.sample(WORDS, 2))},
+            "tag filter": lambda: {"tags": [random.choice(TAGS)]},
+            "word + tag": lambda: {"query": random.choice(WORDS), "tags": [random.choice(TAGS)]},
+        }
+        with Session(engine) as session:
+            for name, make_args in cases.items():
+                timings = []
+                for _ in range(args.queries):
+                    start = time.perf_counter()
+                    search_items(session, **make_args())
+                    timings.append((time.perf_counter() - start) * 1000)
+                timings.sort()
+                print(f"{name:>10}: p50 {statistics.median(timings):6.1f} ms  p99 {timings[int(len(timings) * 0.99) - 1]:6.1f} ms")
+
+if __name__ == "__main__":
+    main()
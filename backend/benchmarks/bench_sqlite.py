@@ -0,0 +1,81 @@
+"""
+Concurrent upload (insert) and list (paged read) throughput against SQLite,
+before and after the tuning layer in app/database.py.
+
+"before": a bare create_engine() with default journaling; writers and
+readers share the database lock and writers race each other.
+"after": WAL + pragmas + pooled connections, with every write funnelled
+through the single db-writer thread.
+
+Usage (from backend/): python -m benchmarks.bench_sqlite [--seconds 5] [--writers 8] [--readers 8]
+"""
+import argparse
+import tempfile
+import threading
+import time
+from pathlib import Path
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine, select, desc
+from app.database import create_sqlite_engine, DatabaseExecutor
+from app.models import ContentItem
+
+def run(engine, writer, seconds: float, writers: int, readers: int):
+    SQLModel.metadata.create_all(engine)
+    stop = time.monotonic() + seconds
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+    lock = threading.Lock()
+
+    def insert():
+        with Session(engine) as session:
+            session.add(ContentItem(original_filename="bench.txt", storage_path="bench.txt"))
+            session.commit()
+
+    def write_loop():
+        while time.monotonic() < stop:
+            try:
+                writer.run_blocking(insert) if writer else insert()
+                key = "writes"
+            except OperationalError:
+                key = "locked"
+            with lock:
+                counts[key] += 1
+
+    def read_loop():
+        while time.monotonic() < stop:
+            try:
+                with Session(engine) as session:
+                    session.exec(select(ContentItem).order_by(desc(ContentItem.created_at)).limit(100)).all()
+                key = "reads"
+            except OperationalError:
+                key = "locked"
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=write_loop) for _ in range(writers)]
+    threads += [threading.Thread(target=read_loop) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {key: value / seconds for key, value in counts.items()}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = create_engine(
+            f"sqlite:///{Path(tmp) / 'before.db'}",
+            connect_args={"check_same_thread": False},
+        )
+        after = create_sqlite_engine(f"sqlite:///{Path(tmp) / 'after.db'}")
+
+        for name, engine, writer in (("before", before, None), ("after", after, DatabaseExecutor(1, "db-writer"))):
+            result = run(engine, writer, args.seconds, args.writers, args.readers)
+            print(f"{name:>6}: {result['writes']:8.0f} uploads/s  {result['reads']:8.0f} lists/s  {result['locked']:6.0f} locked errors/s")
+
+if __name__ == "__main__":
+    main()
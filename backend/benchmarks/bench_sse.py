@@ -0,0 +1,164 @@
+"""
+SSE fan-out under a bulk ingest: thousands of clients connected to
+/api/events (some of them stalled tabs that never read) while update events
+are broadcast at a steady rate. Compares the original broadcaster (an
+unbounded queue per client, one message per event) with the current one
+(bounded queues, coalesced ticks, shared frames).
+
+Reports how long the whole run took (the ingest rate can't be kept up
+when broadcasting falls behind), frames each client had to read, how soon
+clients saw the last event, and the largest backlog queued in the server.
+
+The server is the real app under uvicorn on localhost, in this process;
+clients are raw sockets. Stalled clients use a tiny receive buffer so the
+backlog stays in the server rather than in the kernel.
+
+Usage (from backend/): python -m benchmarks.bench_sse [--clients 2000] [--stalled 200] [--events 2000] [--rate 1000]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import statistics
+import time
+
+import uvicorn
+
+from app import main
+from app.services.event_broadcaster import EventBroadcaster
+
+DONE = "done"
+
+class UnboundedBroadcaster:
+    """The broadcaster before bounded queues and coalescing, for comparison."""
+    def __init__(self):
+        self.subscribers = []
+
+    async def subscribe(self, last_event_id=None):
+        queue = asyncio.Queue()
+        self.subscribers.append(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        if queue in self.subscribers:
+            self.subscribers.remove(queue)
+
+    async def broadcast(self, message: str):
+        for queue in self.subscribers:
+            await queue.put(message)
+
+    async def next_frame(self, queue, timeout=None) -> str:
+        return f"data: {await queue.get()}\n\n"
+
+    def backlog(self) -> int:
+        return sum(queue.qsize() for queue in self.subscribers)
+
+def backlog(broadcaster) -> int:
+    if isinstance(broadcaster, UnboundedBroadcaster):
+        return broadcaster.backlog()
+    return sum(subscriber.queue.qsize() for subscriber in broadcaster.subscribers)
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+async def connect(port: int, receive_buffer: int = 0):
+    sock = socket.socket()
+    if receive_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(b"GET /api/events HTTP/1.1\r\nHost: bench\r\n\r\n")
+    await writer.drain()
+    return reader, writer
+
+async def active_client(port: int, ready: asyncio.Event, stats: dict):
+    reader, writer = await connect(port)
+    frames = 0
+    try:
+        while line := await reader.readline():
+            if line.startswith(b"retry:"):
+                ready.set()
+            elif line.startswith(b"data:"):
+                frames += 1
+                if DONE.encode() in line:
+                    stats["latencies"].append(time.perf_counter() - stats["sent_done"])
+                    break
+    finally:
+        stats["frames"].append(frames)
+        writer.close()
+
+async def run(clients: int, stalled: int, events: int, rate: float, broadcaster, port: int) -> dict:
+    main.broadcaster = broadcaster
+    config = uvicorn.Config(main.app, port=port, lifespan="off", log_level="warning", backlog=4096)
+    server = uvicorn.Server(config)
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    stats = {"latencies": [], "frames": [], "sent_done": 0.0}
+    stalled_connections = [await connect(port, receive_buffer=4096) for _ in range(stalled)]
+    readies = []
+    tasks = []
+    for _ in range(clients):
+        ready = asyncio.Event()
+        readies.append(ready)
+        tasks.append(asyncio.create_task(active_client(port, ready, stats)))
+    await asyncio.gather(*(ready.wait() for ready in readies))
+    rss_before = rss_mb()
+
+    start = time.perf_counter()
+    peak_backlog = 0
+    for i in range(events):
+        await broadcaster.broadcast(json.dumps({"type": "update", "item_id": f"item-{i}"}))
+        if i % 100 == 0:
+            peak_backlog = max(peak_backlog, backlog(broadcaster))
+        # Steady ingest rate; sleeping also lets the server and clients run
+        await asyncio.sleep(max(0.0, start + (i + 1) / rate - time.perf_counter()))
+    stats["sent_done"] = time.perf_counter()
+    await broadcaster.broadcast(json.dumps({"type": "update", "item_id": DONE}))
+    await asyncio.wait(tasks, timeout=300)
+    result = {
+        "frames": statistics.mean(stats["frames"]) if stats["frames"] else 0,
+        "latencies": sorted(stats["latencies"]),
+        "backlog": peak_backlog,
+        "rss": rss_mb() - rss_before,
+        "seconds": time.perf_counter() - start,
+    }
+
+    for reader, writer in stalled_connections:
+        writer.close()
+    for task in tasks:
+        task.cancel()
+    server.should_exit = True
+    await serving
+    return result
+
+def report(label: str, result: dict, clients: int):
+    latencies = result["latencies"] or [float("nan")]
+    print(f"{label:>22}: {len(result['latencies'])}/{clients} clients done in {result['seconds']:.1f}s, "
+          f"{result['frames']:.0f} frames/client, last event after p50 {statistics.median(latencies) * 1000:.0f} ms "
+          f"/ max {latencies[-1] * 1000:.0f} ms, peak {result['backlog']} frames queued, "
+          f"RSS +{result['rss']:.0f} MB")
+
+def main_cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--stalled", type=int, default=200)
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=1000, help="Events per second")
+    args = parser.parse_args()
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    for port, (label, broadcaster) in enumerate((
+        ("unbounded, per event", UnboundedBroadcaster()),
+        ("bounded, coalesced", EventBroadcaster()),
+    ), start=18700):
+        result = asyncio.run(run(args.clients, args.stalled, args.events, args.rate, broadcaster, port))
+        report(label, result, args.clients)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,63 @@
+"""
+Truncation speed and accuracy for 1 KB to 50 MB inputs: the previous
+count-everything-then-guess approach versus the token-exact engine.
+
+Usage (from backend/): python -m benchmarks.bench_truncation [--model gpt-3.5-turbo] [--budget 2596]
+"""
+import argparse
+import random
+import time
+from litellm import token_counter
+from app.services.truncation import count_tokens, truncate
+
+SIZES = [1_000, 100_000, 1_000_000, 10_000_000, 50_000_000]
+
+def previous_truncate(prompt: str, content: str, model: str, available_tokens: int) -> str:
+    """The old `_truncate_content` body, kept here as the baseline."""
+    if len(content) < available_tokens * 4:
+        return content
+    if token_counter(model=model, text=f"{prompt}\n\n{content}") <= available_tokens:
+        return content
+    return content[:available_tokens * 3]
+
+def make_document(size: int) -> str:
+    rng = random.Random(size)
+    words = ["data", "report", "quarterly", "def", "return", "x", "=", "{", "}", "naïve", "日本", "1234", "\n"]
+    parts, length = [], 0
+    while length < size:
+        word = rng.choice(words)
+        parts.append(word)
+        length += len(word) + 1
+    return " ".join(parts)[:size]
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--budget", type=int, default=2596, help="Tokens available for prompt plus content")
+    parser.add_argument("--skip-baseline-above", type=int, default=10_000_000, help="The baseline tokenizes everything; skip it for larger inputs")
+    args = parser.parse_args()
+
+    prompt = "Analyze the following file and provide metadata in strict JSON format."
+    content_budget = args.budget - count_tokens(prompt, args.model)
+    print(f"{'size':>10} | {'previous':>22} | {'head':>22} | {'head_tail':>22}")
+    for size in SIZES:
+        document = make_document(size)
+        cells = []
+        if size <= args.skip_baseline_above:
+            result, ms = timed(lambda: previous_truncate(prompt, document, args.model, args.budget))
+            cells.append(f"{ms:8.1f}ms {count_tokens(result, args.model):7d} tok")
+        else:
+            cells.append(f"{'skipped':>22}")
+        for strategy in ("head", "head_tail"):
+            result, ms = timed(lambda: truncate(document, content_budget, args.model, strategy))
+            cells.append(f"{ms:8.1f}ms {count_tokens(result, args.model):7d} tok")
+        print(f"{size:>10} | " + " | ".join(cells))
+    print(f"Content budget: {content_budget} tokens")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Upload latency while the worker is busy with CPU-heavy tagging work
+(downscaling and base64-encoding large images, encoding large metadata),
+with that work done on the event loop versus on the shared executors.
+
+Uploads go through the real /api/upload route into a temporary database and
+blob directory; the LLM call itself is simulated
+(50 ms per request).
+
+Usage (from backend/): python -m benchmarks.bench_upload_latency [--seconds 3] [--upload-mb 2] [--workers 2]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+import httpx
+from PIL import Image
+from sqlmodel import Session
+
+from app import api
+from app.database import create_sqlite_engine
+from app.main import app
+from app.models import create_db_and_tables, get_session
+from app.services.executors import executors
+from app.services.llm import LLMService
+from app.services.storage import FileSystemStorage
+
+async def fast_completion(model, api_base, messages):
+    await asyncio.sleep(0.05)
+    return MagicMock(choices=[MagicMock(message=MagicMock(content='{"summary": "a photo", "tags": ["photo"]}'))])
+
+async def busy_worker(image_path: str, stop: asyncio.Event, counter: list):
+    """What a worker slot does per image item: prepare the image, then encode the merged metadata."""
+    service = LLMService(model="gpt-3.5-turbo")
+    metadata = {"ocr_text": "lorem ipsum " * 50_000}
+    while not stop.is_set():
+        result = await service.generate_metadata(image_path)
+        await executors.json_dumps({**metadata, **result}, size_hint=len(metadata["ocr_text"]))
+        counter[0] += 1
+
+async def measure(client: httpx.AsyncClient, payload: bytes, seconds: float) -> list:
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    index = 0
+    while time.perf_counter() < deadline:
+        index += 1
+        # Distinct bytes each time so nothing is deduplicated
+        body = index.to_bytes(8, "big") + payload
+        start = time.perf_counter()
+        response = await client.post("/api/upload", files={"file": (f"upload-{index}.bin", body)})
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return latencies
+
+def report(label: str, latencies: list, tagged: int):
+    latencies = sorted(latencies)
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(f"{label:>24}: {len(latencies):4d} uploads, p50 {statistics.median(latencies) * 1000:7.1f} ms, "
+          f"p99 {p99 * 1000:7.1f} ms, max {latencies[-1] * 1000:7.1f} ms, {tagged} items tagged")
+
+async def run(seconds: float, upload_mb: int, workers: int, tmp: Path):
+    image_path = tmp / "scan.png"
+    # PNGs can't be decoded at reduced scale, so each one is a full decode and resize
+    Image.effect_noise((4000, 3000), 64).convert("RGB").save(image_path)
+    payload = os.urandom(upload_mb * 1024 * 1024)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        report("idle", await measure(client, payload, seconds), 0)
+
+        for label, inline in (("busy, on the event loop", True), ("busy, offloaded", False)):
+            def run_inline(fn, *args, **kwargs):
+                async def call():
+                    return fn(*args, **kwargs)
+                return call()
+            mode = patch.multiple(executors, run_thread=run_inline, run_process=run_inline) if inline else nullcontext()
+            with mode:
+                stop = asyncio.Event()
+                counter = [0]
+                tasks = [asyncio.create_task(busy_worker(str(image_path), stop, counter)) for _ in range(workers)]
+                # Let the process pool start before measuring
+                await asyncio.sleep(2)
+                counter[0] = 0
+                latencies = await measure(client, payload, seconds)
+                stop.set()
+                await asyncio.gather(*tasks)
+            report(label, latencies, counter[0])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--upload-mb", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        engine = create_sqlite_engine(f"sqlite:///{tmp / 'bench.db'}")
+        create_db_and_tables(engine)
+
+        def bench_session():
+            with Session(engine) as session:
+                yield session
+        app.dependency_overrides[get_session] = bench_session
+
+        with patch.object(api, "storage", FileSystemStorage(str(tmp / "blobs"))), \
+             patch("app.services.llm.acompletion", fast_completion), \
+             patch.object(api.job_queue, "enqueue", lambda item_id: None):
+            asyncio.run(run(args.seconds, args.upload_mb, args.workers, tmp))
+        executors.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Nearest-neighbour latency and recall of the on-disk vector index.
+
+Usage (from backend/): python -m benchmarks.bench_vectors [--items 500000] [--dim 768]
+"""
+import argparse
+import statistics
+import tempfile
+import time
+import uuid
+import numpy as np
+from app.services.vector_index import VectorIndex
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return f"p50 {statistics.median(timings):.1f}ms, p99 {timings[int(len(timings) * 0.99) - 1]:.1f}ms"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=500_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Embeddings cluster by topic; uniform noise would make every neighbour equally far
+    topics = rng.standard_normal((2000, args.dim), dtype=np.float32)
+    def embeddings(count):
+        return topics[rng.integers(len(topics), size=count)] + 0.5 * rng.standard_normal((count, args.dim), dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = VectorIndex(tmp)
+        start = time.perf_counter()
+        for offset in range(0, args.items, 50_000):
+            count = min(50_000, args.items - offset)
+            index.add([uuid.uuid4() for _ in range(count)], embeddings(count))
+        print(f"Built {args.items} x {args.dim} index in {time.perf_counter() - start:.1f}s")
+
+        queries = embeddings(args.queries)
+        exact, timings = [], []
+        for query in queries:
+            start = time.perf_counter()
+            exact.append({item_id for item_id, _ in index.search(query, k=args.k)})
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"brute force top-{args.k}: {percentiles(timings)}")
+
+        start = time.perf_counter()
+        index.train()
+        print(f"IVF training: {time.perf_counter() - start:.1f}s")
+
+        timings, recall = [], []
+        for query, expected in zip(queries, exact):
+            start = time.perf_counter()
+            found = {item_id for item_id, _ in index.search(query, k=args.k)}
+            timings.append((time.perf_counter() - start) * 1000)
+            recall.append(len(found & expected) / len(expected))
+        print(f"IVF top-{args.k}: {percentiles(timings)}, recall {statistics.mean(recall):.3f}")
+
+        start = time.perf_counter()
+        VectorIndex(tmp).search(queries[0], k=args.k)
+        print(f"Cold load + first query: {(time.perf_counter() - start) * 1000:.0f}ms")
+
+if __name__ == "__main__":
+    main()
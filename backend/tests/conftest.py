@@ -1,19 +1,53 @@
 import pytest
 from sqlmodel import SQLModel, Session, create_engine
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
 from fastapi.testclient import TestClient
 from app.main import app
-from app.models import get_session
+from app.models import get_session, create_db_and_tables
+from app.services.search import FTS_TABLE
+from app.services.embeddings import embedding_service
+from app.services.executors import executors
+from app.services.vector_index import VectorIndex
 
 # Use in-memory SQLite for tests
 sqlite_url = "sqlite://"
-engine = create_engine(sqlite_url, connect_args={"check_same_thread": False})
+# StaticPool keeps a single connection so every session sees the same in-memory DB
+engine = create_engine(sqlite_url, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+
+@pytest.fixture(name="vector_index", autouse=True)
+def vector_index_fixture(tmp_path, monkeypatch):
+    # Keep vectors out of the real data dir and embedding calls off the network
+    index = VectorIndex(tmp_path / "vectors")
+    for module in ("app.api", "app.services.bulk_jobs", "app.services.search", "app.workers"):
+        monkeypatch.setattr(f"{module}.vector_index", index)
+    monkeypatch.setattr(embedding_service, "enabled", False)
+    return index
+
+@pytest.fixture(autouse=True)
+def inline_cpu_work(monkeypatch):
+    # Spawning worker processes costs a second per test; CPU work runs on threads
+    monkeypatch.setattr(executors, "process_count", 0)
+
+@pytest.fixture(autouse=True)
+def bulk_jobs_on_test_db(monkeypatch):
+    # The worker pool runs bulk jobs too: keep them on the test database, without scheduled sweeps
+    monkeypatch.setattr("app.services.bulk_jobs.engine", engine)
+    monkeypatch.setattr("app.services.bulk_jobs.GC_INTERVAL_SECONDS", 0)
+
+@pytest.fixture(autouse=True)
+def events_on_test_db(monkeypatch):
+    # Every broadcast is written to the event log: keep it off the real database
+    monkeypatch.setattr("app.services.event_broadcaster.engine", engine)
 
 @pytest.fixture(name="session")
 def session_fixture():
-    SQLModel.metadata.create_all(engine)
+    create_db_and_tables(engine)
     with Session(engine) as session:
         yield session
     SQLModel.metadata.drop_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
 
 @pytest.fixture(name="client")
 def client_fixture(session: Session):
@@ -1,6 +1,6 @@
 from fastapi.testclient import TestClient
 from sqlmodel import Session
-from app.models import ContentItem, ContentStatus
+from app.models import ContentItem
 
 def test_read_root(client: TestClient):
     response = client.get("/")
@@ -34,3 +34,54 @@ def test_create_item(client: TestClient, session: Session):
     data = response.json()
     assert len(data) == 1
     assert data[0]["original_filename"] == "test.txt"
+
+def _add_items(session: Session, count: int, filename_prefix: str = "file"):
+    from datetime import datetime, timedelta
+    base = datetime(2024, 1, 1)
+    items = [
+        ContentItem(original_filename=f"{filename_prefix}{i}.txt", storage_path=f"{i}.txt", created_at=base + timedelta(minutes=i))
+        for i in range(count)
+    ]
+    session.add_all(items)
+    session.commit()
+    return items
+
+def test_read_items_paginates_with_cursor(client: TestClient, session: Session):
+    _add_items(session, 5)
+
+    first = client.get("/api/items", params={"limit": 2})
+    assert [item["original_filename"] for item in first.json()] == ["file4.txt", "file3.txt"]
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get("/api/items", params={"limit": 2, "cursor": cursor})
+    assert [item["original_filename"] for item in second.json()] == ["file2.txt", "file1.txt"]
+
+    third = client.get("/api/items", params={"limit": 2, "cursor": second.headers["X-Next-Cursor"]})
+    assert [item["original_filename"] for item in third.json()] == ["file0.txt"]
+    assert "X-Next-Cursor" not in third.headers
+
+def test_read_items_projects_fields(client: TestClient, session: Session):
+    _add_items(session, 1)
+
+    response = client.get("/api/items", params={"fields": "original_filename,status"})
+    assert response.status_code == 200
+    assert set(response.json()[0]) == {"id", "created_at", "original_filename", "status"}
+
+    assert client.get("/api/items", params={"fields": "nope"}).status_code == 400
+
+def test_latest_flag_follows_uploads_and_deletes(client: TestClient, session: Session, tmp_path):
+    from unittest.mock import patch
+    from app.services.job_queue import JobQueue
+    from app.services.storage import FileSystemStorage
+
+    with patch("app.api.storage", FileSystemStorage(str(tmp_path))), patch("app.api.job_queue", JobQueue()):
+        v1 = client.post("/api/upload", files={"file": ("doc.txt", b"one")}).json()
+        v2 = client.post("/api/upload", files={"file": ("doc.txt", b"two")}).json()
+
+        latest = client.get("/api/items").json()
+        assert [item["id"] for item in latest] == [v2["id"]]
+        assert len(client.get("/api/items", params={"show_all_versions": True}).json()) == 2
+
+        client.delete(f"/api/items/{v2['id']}")
+        latest = client.get("/api/items").json()
+        assert [item["id"] for item in latest] == [v1["id"]]
@@ -0,0 +1,118 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from unittest.mock import patch
+from app.models import Blob, ContentItem
+from app.services.storage import FileSystemStorage
+from app.services.job_queue import JobQueue
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = FileSystemStorage(str(tmp_path))
+    with patch("app.api.storage", storage), patch("app.api.job_queue", JobQueue()):
+        yield storage
+
+def test_duplicate_upload_reuses_blob(client: TestClient, session: Session, storage):
+    first = client.post("/api/upload", files={"file": ("a.txt", b"same bytes")}).json()
+    second = client.post("/api/upload", files={"file": ("b.txt", b"same bytes")}).json()
+
+    assert first["storage_path"] == second["storage_path"]
+    stored_files = [name for _, _, names in os.walk(storage.storage_dir) for name in names]
+    assert len(stored_files) == 1
+    blob = session.exec(select(Blob)).one()
+    assert blob.ref_count == 2
+    assert blob.size == len(b"same bytes")
+
+def test_delete_keeps_blob_until_last_reference(client: TestClient, session: Session, storage):
+    first = client.post("/api/upload", files={"file": ("a.txt", b"shared")}).json()
+    second = client.post("/api/upload", files={"file": ("b.txt", b"shared")}).json()
+    full_path = storage.get_path(first["storage_path"])
+
+    client.delete(f"/api/items/{first['id']}")
+    session.expire_all()
+    assert session.exec(select(Blob)).one().ref_count == 1
+    assert storage.get_path(second["storage_path"]) == full_path
+    assert os.path.exists(full_path)
+
+    client.delete(f"/api/items/{second['id']}")
+    assert session.exec(select(Blob)).first() is None
+    assert not os.path.exists(full_path)
+
+def test_delete_untracked_item_removes_file(client: TestClient, session: Session, storage, tmp_path):
+    # Items stored before blob tracking have no Blob row
+    blob_file = tmp_path / "legacy.txt"
+    blob_file.write_bytes(b"legacy")
+    item = ContentItem(original_filename="legacy.txt", storage_path="legacy.txt", checksum="unknown")
+    session.add(item)
+    session.commit()
+
+    assert client.delete(f"/api/items/{item.id}").status_code == 200
+    assert not blob_file.exists()
+
+def test_finalize_duplicate_drops_new_upload(client: TestClient, session: Session, storage, tmp_path):
+    first = client.post("/api/upload", files={"file": ("a.txt", b"direct")}).json()
+    # Simulate the same bytes arriving through a direct upload
+    (tmp_path / "2024/01/01").mkdir(parents=True)
+    (tmp_path / "2024/01/01/duplicate.txt").write_bytes(b"direct")
+    with patch.object(storage, "delete") as mock_delete:
+        response = client.post("/api/upload/finalize", data={
+            "original_filename": "a.txt",
+            "storage_path": "2024/01/01/duplicate.txt",
+            "checksum": first["checksum"],
+        })
+        mock_delete.assert_called_once_with("2024/01/01/duplicate.txt")
+
+    assert response.json()["storage_path"] == first["storage_path"]
+    assert response.json()["version"] == 2
+
+def test_finalize_only_touches_paths_it_could_have_issued(client: TestClient, session: Session, storage, tmp_path):
+    outside = tmp_path.parent / "outside.txt"
+    outside.write_bytes(b"not yours")
+    for storage_path in (str(outside), "../outside.txt", "2024/01/01/../../../outside.txt", "notes.txt"):
+        response = client.post("/api/upload/finalize", data={
+            "original_filename": "x.txt", "storage_path": storage_path, "checksum": "bogus",
+        })
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid storage path"
+    assert outside.exists()
+
+    # Another item's live blob survives a bogus checksum and a duplicate finalize
+    first = client.post("/api/upload", files={"file": ("a.txt", b"live")}).json()
+    live = storage.get_path(first["storage_path"])
+    response = client.post("/api/upload/finalize", data={
+        "original_filename": "b.txt", "storage_path": first["storage_path"], "checksum": "bogus",
+    })
+    assert response.status_code == 400
+    assert os.path.exists(live)
+    # An item stored before blobs were tracked has the same bytes under its own path
+    (tmp_path / "2024/01/02").mkdir(parents=True)
+    (tmp_path / "2024/01/02/legacy.txt").write_bytes(b"live")
+    session.add(ContentItem(original_filename="legacy.txt", storage_path="2024/01/02/legacy.txt"))
+    session.commit()
+    response = client.post("/api/upload/finalize", data={
+        "original_filename": "b.txt", "storage_path": "2024/01/02/legacy.txt",
+    })
+    assert response.json()["storage_path"] == first["storage_path"]
+    assert os.path.exists(live)
+    assert (tmp_path / "2024/01/02/legacy.txt").exists()
+
+def test_release_blobs_counts_references_per_batch(session: Session):
+    from app.services.blobs import release_blobs
+    session.add_all([
+        Blob(checksum="a" * 64, storage_path="2024/01/01/a.txt", ref_count=3),
+        Blob(checksum="b" * 64, storage_path="2024/01/01/b.txt", ref_count=1),
+        # Untracked (legacy) items: one path is still used by another item
+        ContentItem(original_filename="kept.txt", storage_path="legacy/kept.txt"),
+    ])
+    session.commit()
+
+    orphaned = release_blobs(session, [
+        ("a" * 64, "2024/01/01/a.txt"), ("a" * 64, "2024/01/01/a.txt"),
+        ("b" * 64, "2024/01/01/b.txt"),
+        (None, "legacy/kept.txt"), (None, "legacy/gone.txt"),
+    ])
+    session.commit()
+
+    assert sorted(orphaned) == ["2024/01/01/b.txt", "legacy/gone.txt"]
+    assert [(blob.checksum[0], blob.ref_count) for blob in session.exec(select(Blob)).all()] == [("a", 1)]
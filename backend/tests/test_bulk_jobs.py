@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import time
+import uuid
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from app.api import create_content_item
+from app.models import Blob, BulkAction, BulkJob, ContentItem, ContentStatus, JobStatus
+from app.services import bulk_jobs as bulk_module
+from app.services import storage_gc
+from app.services.bulk_jobs import BulkJobRunner, select_item_ids, submit_job
+from app.services.job_queue import JobQueue
+from app.services.llm_cache import llm_cache
+from app.services.storage import FileSystemStorage, StoredBlob
+from app.services.storage_gc import find_orphans, sweep_storage
+
+@pytest.fixture
+def storage(tmp_path):
+    return FileSystemStorage(str(tmp_path / "blobs"))
+
+async def add_item(session: Session, storage: FileSystemStorage, filename: str, data: bytes) -> ContentItem:
+    checksum = hashlib.sha256(data).hexdigest()
+    storage_path = await storage.save(data, filename)
+    return create_content_item(session, StoredBlob(storage_path, checksum, len(data)), filename, "{}", None)
+
+def write_blob(storage: FileSystemStorage, storage_path: str, age_seconds: float = 0):
+    full_path = storage.get_path(storage_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "wb") as f:
+        f.write(b"x")
+    modified = time.time() - age_seconds
+    os.utime(full_path, (modified, modified))
+
+def test_jobs_api_marks_deletes_before_returning(client: TestClient, session: Session):
+    kept = ContentItem(original_filename="keep.md", storage_path="keep.md")
+    doomed = [ContentItem(original_filename="old.md", storage_path="old.md", version=v, is_latest=v == 2) for v in (1, 2)]
+    session.add_all([kept, *doomed])
+    session.commit()
+
+    assert client.post("/api/jobs", json={"action": "delete"}).status_code == 400
+    response = client.post("/api/jobs", json={"action": "delete", "filename": "old.md"})
+    assert response.status_code == 202
+    job = response.json()
+    assert (job["action"], job["status"], job["total"]) == ("delete", "pending", 2)
+    assert "item_ids_json" not in job
+
+    # Marked, not yet removed: gone from listings and search, no longer claimable
+    for item in doomed:
+        session.refresh(item)
+        assert item.status == ContentStatus.DELETING
+    listed = client.get("/api/items", params={"show_all_versions": True}).json()
+    assert [item["original_filename"] for item in listed] == ["keep.md"]
+    assert [item["original_filename"] for item in client.get("/api/search").json()["items"]] == ["keep.md"]
+    assert len(client.get("/api/items", params={"status": "deleting", "show_all_versions": True}).json()) == 2
+
+    assert client.get(f"/api/jobs/{job['id']}").json()["status"] == "pending"
+    assert [listed["id"] for listed in client.get("/api/jobs").json()] == [job["id"]]
+    assert client.get(f"/api/jobs/{uuid.uuid4()}").status_code == 404
+
+@pytest.mark.parametrize("filters", [
+    {"filename": ""}, {"content_type": ""}, {"ids": []}, {"tags": []}, {"tags": [" "]}, {"metadata": {}},
+    {"filename": "", "status": "unprocessed"},
+])
+def test_jobs_api_rejects_empty_filters(client: TestClient, session: Session, filters):
+    item = ContentItem(original_filename="keep.md", storage_path="keep.md")
+    session.add(item)
+    session.commit()
+
+    response = client.post("/api/jobs", json={"action": "delete", **filters})
+    assert response.status_code == 400
+    assert "Empty filters" in response.json()["detail"]
+    session.refresh(item)
+    assert item.status == ContentStatus.UNPROCESSED
+    assert session.exec(select(BulkJob)).all() == []
+
+def test_select_item_ids_treats_empty_strings_as_filters(session: Session):
+    session.add(ContentItem(original_filename="keep.md", storage_path="keep.md"))
+    session.commit()
+    assert select_item_ids(session, filename="") == []
+    assert select_item_ids(session, content_type="") == []
+
+@pytest.mark.asyncio
+async def test_delete_job_removes_items_and_unreferenced_blobs(session: Session, storage):
+    v1 = await add_item(session, storage, "a.md", b"shared")
+    v2 = await add_item(session, storage, "a.md", b"second")
+    other = await add_item(session, storage, "b.md", b"shared")
+    v2_path = v2.storage_path
+
+    job = submit_job(session, BulkAction.DELETE, select_item_ids(session, ids=[v2.id, other.id]))
+    runner = BulkJobRunner("runner")
+    assert await runner.run_pending(storage) == 1
+
+    session.expire_all()
+    job = session.get(BulkJob, job.id)
+    assert (job.status, job.processed, job.skipped, job.lease_owner) == (JobStatus.DONE, 2, 0, None)
+    assert [item.id for item in session.exec(select(ContentItem)).all()] == [v1.id]
+    # The previous version takes over, and the shared blob stays with it
+    assert session.get(ContentItem, v1.id).is_latest
+    assert session.get(Blob, v1.checksum).ref_count == 1
+    assert os.path.exists(storage.get_path(v1.storage_path))
+    assert not os.path.exists(storage.get_path(v2_path))
+
+@pytest.mark.asyncio
+async def test_job_taken_over_continues_from_saved_progress(session: Session, storage):
+    items = [await add_item(session, storage, f"note-{i}.md", f"note {i}".encode()) for i in range(5)]
+    job = submit_job(session, BulkAction.DELETE, [item.id for item in items])
+    item_ids = [item.id for item in items]
+
+    crashed, survivor = BulkJobRunner("crashed"), BulkJobRunner("survivor")
+    with patch.object(bulk_module, "BULK_CHUNK_SIZE", 2):
+        assert crashed.claim(session) == job.id
+        assert crashed.delete_chunk(session, job.id, item_ids[:2]) is not None
+        assert survivor.claim(session) is None
+
+        # The crashed runner's lease runs out
+        job = session.get(BulkJob, job.id)
+        job.lease_expires_at = job.created_at
+        session.add(job)
+        session.commit()
+        assert survivor.claim(session) == job.id
+        # The crashed runner's late chunk is rolled back
+        assert crashed.delete_chunk(session, job.id, item_ids[2:4]) is None
+        assert len(session.exec(select(ContentItem)).all()) == 3
+
+        await survivor.run(job.id, storage)
+
+    session.expire_all()
+    job = session.get(BulkJob, job.id)
+    assert (job.status, job.processed) == (JobStatus.DONE, 5)
+    assert session.exec(select(ContentItem)).all() == []
+    assert session.exec(select(Blob)).all() == []
+
+@pytest.mark.asyncio
+async def test_requeue_and_retag_jobs(session: Session, storage):
+    failed = await add_item(session, storage, "failed.md", b"failed")
+    tagged = await add_item(session, storage, "tagged.md", b"tagged")
+    failed.status, failed.attempts, failed.last_error = ContentStatus.FAILED, 5, "Timeout"
+    tagged.status = ContentStatus.TAGGED
+    session.add_all([failed, tagged])
+    llm_cache.put(session, tagged.checksum, "prompt", "model", {"summary": "old"})
+    session.commit()
+
+    queue = JobQueue()
+    runner = BulkJobRunner("runner")
+    with patch.object(bulk_module, "job_queue", queue):
+        requeue = submit_job(session, BulkAction.REQUEUE, [failed.id, tagged.id])
+        await runner.run_pending(storage)
+        session.expire_all()
+        assert (session.get(BulkJob, requeue.id).processed, session.get(BulkJob, requeue.id).skipped) == (2, 1)
+        assert session.get(ContentItem, failed.id).status == ContentStatus.UNPROCESSED
+        assert session.get(ContentItem, tagged.id).status == ContentStatus.TAGGED
+
+        retag = submit_job(session, BulkAction.RETAG, [failed.id, tagged.id])
+        await runner.run_pending(storage)
+        session.expire_all()
+        assert session.get(BulkJob, retag.id).skipped == 0
+        assert session.get(ContentItem, tagged.id).status == ContentStatus.UNPROCESSED
+        # The cached result would just be served again
+        assert not llm_cache.contains(session, tagged.checksum, "prompt", "model")
+    assert queue.qsize() == 2
+
+@pytest.mark.asyncio
+async def test_sweep_deletes_old_unreferenced_blobs_only(session: Session, storage):
+    item = await add_item(session, storage, "kept.md", b"kept")
+    os.utime(storage.get_path(item.storage_path), (0, 0))
+    write_blob(storage, "2020/01/01/orphan.bin", age_seconds=7200)
+    write_blob(storage, "2020/01/01/orphan.bin.extracted.json", age_seconds=7200)
+    write_blob(storage, "2020/01/02/just-uploaded.bin")
+    write_blob(storage, ".incoming/stream.part", age_seconds=7200)
+    write_blob(storage, "notes.txt", age_seconds=7200)
+
+    result = await sweep_storage(storage, session, grace=3600)
+
+    assert result == {"scanned": 3, "deleted": 1, "failed": 0}
+    remaining = sorted(os.path.relpath(os.path.join(root, name), storage.storage_dir)
+                       for root, _, names in os.walk(storage.storage_dir) for name in names)
+    assert remaining == sorted([".incoming/stream.part", "2020/01/02/just-uploaded.bin", item.storage_path, "notes.txt"])
+
+@pytest.mark.asyncio
+async def test_sweeps_are_scheduled_periodically(session: Session, storage):
+    runner = BulkJobRunner("runner")
+    with patch.object(bulk_module, "GC_INTERVAL_SECONDS", 3600):
+        assert await runner.run_pending(storage) == 1
+        assert await runner.run_pending(storage) == 0
+    job = session.exec(select(BulkJob)).one()
+    assert (job.action, job.status) == (BulkAction.SWEEP, JobStatus.DONE)
+    assert json.loads(job.result_json) == {"scanned": 0, "deleted": 0, "failed": 0}
+
+@pytest.mark.asyncio
+async def test_idle_runner_only_reads(session: Session, storage):
+    runner = BulkJobRunner("runner")
+    with patch.object(bulk_module, "GC_INTERVAL_SECONDS", 3600):
+        assert await runner.run_pending(storage) == 1 # The first sweep
+        with patch.object(bulk_module.db_writer, "run", side_effect=AssertionError("write while idle")):
+            assert await runner.run_pending(storage) == 0
+
+@pytest.mark.asyncio
+async def test_sweep_stops_when_its_lease_is_taken_over(session: Session, storage):
+    write_blob(storage, "2020/01/01/orphan.bin", age_seconds=7200)
+
+    def walk_while_another_worker_takes_over(*args):
+        with Session(session.get_bind()) as other:
+            job = other.exec(select(BulkJob)).one()
+            job.lease_owner = "other"
+            other.add(job)
+            other.commit()
+        return find_orphans(*args)
+
+    runner = BulkJobRunner("runner")
+    with patch.object(bulk_module, "GC_INTERVAL_SECONDS", 3600), patch.object(storage_gc, "GC_GRACE_SECONDS", 3600), \
+            patch.object(storage_gc, "find_orphans", walk_while_another_worker_takes_over):
+        await runner.run_pending(storage)
+
+    assert os.path.exists(storage.get_path("2020/01/01/orphan.bin"))
+    job = session.exec(select(BulkJob)).one()
+    assert (job.status, job.lease_owner) == (JobStatus.RUNNING, "other")
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import pytest
+from sqlalchemy import text
+from app.database import create_sqlite_engine, DatabaseExecutor
+
+def test_engine_applies_pragmas(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1 # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+        assert conn.execute(text("PRAGMA mmap_size")).scalar() > 0
+
+@pytest.mark.asyncio
+async def test_writer_runs_writes_one_at_a_time():
+    writer = DatabaseExecutor(1, "db-writer")
+    running = 0
+    peak = 0
+    threads = set()
+    lock = threading.Lock()
+
+    def write():
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        threads.add(threading.current_thread().name)
+        threading.Event().wait(0.01)
+        with lock:
+            running -= 1
+
+    await asyncio.gather(*(writer.run(write) for _ in range(10)))
+    assert peak == 1
+    assert len(threads) == 1
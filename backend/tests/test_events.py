@@ -0,0 +1,72 @@
+import json
+import pytest
+from app.services.event_broadcaster import EventBroadcaster, coalesce
+
+def update(item_id: str) -> str:
+    return json.dumps({"type": "update", "item_id": item_id})
+
+def parse(frame: str) -> dict:
+    fields = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+    return {"id": fields["id"], **json.loads(fields["data"])}
+
+def test_coalesce_merges_updates_in_place():
+    other = json.dumps({"type": "notice"})
+    merged = coalesce([update("1"), other, update("2"), update("1")])
+    assert merged[1] == other
+    assert json.loads(merged[0]) == {"type": "update", "item_ids": ["1", "2"]}
+    # A lone update goes out as it came in
+    assert coalesce([update("3")]) == [update("3")]
+
+@pytest.mark.asyncio
+async def test_bulk_updates_arrive_as_one_numbered_event():
+    broadcaster = EventBroadcaster(coalesce_interval=0.01)
+    subscriber = await broadcaster.subscribe()
+    for i in range(500):
+        await broadcaster.broadcast(update(str(i)))
+
+    event = parse(await broadcaster.next_frame(subscriber, timeout=1))
+    assert len(event["item_ids"]) == 500
+    assert event["id"] == broadcaster.last_event_id
+    assert subscriber.queue.empty()
+
+@pytest.mark.asyncio
+async def test_stalled_subscriber_is_bounded_and_resynced():
+    broadcaster = EventBroadcaster(queue_size=5, coalesce_interval=0)
+    stalled = await broadcaster.subscribe()
+    for i in range(50):
+        broadcaster.publish(update(str(i)))
+        broadcaster.flush()
+
+    assert stalled.overflowed and stalled.queue.qsize() == 0
+    event = parse(await broadcaster.next_frame(stalled, timeout=1))
+    assert event["resync"] and event["id"] == broadcaster.last_event_id
+    # Back to normal delivery afterwards
+    broadcaster.publish(update("next"))
+    broadcaster.flush()
+    assert parse(await broadcaster.next_frame(stalled, timeout=1))["item_id"] == "next"
+
+@pytest.mark.asyncio
+async def test_reconnect_replays_missed_events():
+    broadcaster = EventBroadcaster(replay_size=3)
+    for i in range(2):
+        broadcaster.publish(update(str(i)))
+        broadcaster.flush()
+    last_seen = broadcaster.last_event_id
+    for i in range(2, 4):
+        broadcaster.publish(update(str(i)))
+        broadcaster.flush()
+
+    subscriber = await broadcaster.subscribe(last_seen)
+    replayed = [parse(await broadcaster.next_frame(subscriber, timeout=1))["item_id"] for _ in range(2)]
+    assert replayed == ["2", "3"]
+
+    # Fell out of the replay buffer, or ids from before a restart: reload everything
+    for last_event_id in (f"{broadcaster.epoch}-0", "oldepoch-3", "garbage"):
+        subscriber = await broadcaster.subscribe(last_event_id)
+        assert parse(await broadcaster.next_frame(subscriber, timeout=1))["resync"]
+
+@pytest.mark.asyncio
+async def test_idle_connections_get_heartbeats():
+    broadcaster = EventBroadcaster()
+    subscriber = await broadcaster.subscribe()
+    assert await broadcaster.next_frame(subscriber, timeout=0.01) == ": ping\n\n"
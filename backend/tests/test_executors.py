@@ -0,0 +1,45 @@
+import hashlib
+import json
+import threading
+import pytest
+from app.services import executors as executors_module
+from app.services.executors import Executors
+
+@pytest.mark.asyncio
+async def test_large_chunks_are_hashed_on_the_thread_pool(monkeypatch):
+    pool = Executors(threads=2, processes=0)
+    hashed_on = []
+    original = executors_module._hash_update
+    def recording_update(digest, data):
+        hashed_on.append(threading.current_thread().name)
+        original(digest, data)
+    monkeypatch.setattr(executors_module, "_hash_update", recording_update)
+
+    data = b"x" * (executors_module.OFFLOAD_MIN_BYTES * 3)
+    digest = hashlib.sha256()
+    await pool.hash_update(digest, data[:10]) # Small: inline
+    await pool.hash_update(digest, data[10:])
+    assert digest.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert len(hashed_on) == 1 and hashed_on[0].startswith("cpu")
+    assert await pool.sha256(data) == hashlib.sha256(data).hexdigest()
+    pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_json_round_trip_through_process_pool():
+    pool = Executors(threads=1, processes=1)
+    value = {"ocr_text": "word " * executors_module.OFFLOAD_MIN_BYTES, "tags": ["a"]}
+    try:
+        text = await pool.json_dumps(value, size_hint=executors_module.OFFLOAD_MIN_BYTES)
+        assert pool._processes is not None
+        assert await pool.json_loads(text) == value
+        with pytest.raises(json.JSONDecodeError):
+            await pool.json_loads("{" * executors_module.OFFLOAD_MIN_BYTES)
+    finally:
+        pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_without_processes_work_runs_on_threads():
+    pool = Executors(threads=1, processes=0)
+    assert await pool.run_process(sum, [1, 2, 3]) == 6
+    assert pool.processes is None
+    pool.shutdown()
@@ -0,0 +1,188 @@
+import base64
+import io
+import json
+import re
+import tarfile
+import tracemalloc
+import zipfile
+import pytest
+from PIL import Image
+from app.services import extractors
+from app.services.executors import executors
+from app.services.extractors import extract, extractor_registry, prepare_image, read_text_excerpt, run_extractor
+
+@pytest.fixture
+def big_text(tmp_path):
+    path = tmp_path / "big.log"
+    with open(path, "w") as f:
+        f.write("FIRST LINE\n")
+        for i in range(200_000):
+            f.write(f"line {i:06d} of a long log file\n")
+        f.write("LAST LINE\n")
+    return path
+
+def test_excerpt_reads_only_what_is_needed(big_text):
+    tracemalloc.start()
+    text = read_text_excerpt(str(big_text), 4096)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert text.startswith("FIRST LINE")
+    assert len(text) <= 4096
+    assert peak < 64 * 1024 # The file is ~6 MB
+
+def test_excerpt_strategies(big_text, tmp_path):
+    both_ends = read_text_excerpt(str(big_text), 4096, "head_tail")
+    assert both_ends.startswith("FIRST LINE") and both_ends.endswith("LAST LINE\n")
+
+    sections = read_text_excerpt(str(big_text), 32 * 128, "sections")
+    numbers = [int(n) for n in re.findall(r"line (\d{6})", sections)]
+    # Samples come from across the whole file
+    assert min(numbers) < 1000 and max(numbers) > 190_000
+
+    small = tmp_path / "small.txt"
+    small.write_text("héllo")
+    assert read_text_excerpt(str(small), 4096, "head_tail") == "héllo"
+
+def test_excerpt_drops_split_characters(tmp_path):
+    path = tmp_path / "utf8.txt"
+    path.write_text("é" * 100)
+    assert read_text_excerpt(str(path), 5) == "éé"
+
+def _decode(prepared):
+    return Image.open(io.BytesIO(base64.b64decode(prepared.data_url.split(",", 1)[1])))
+
+def test_large_jpeg_is_downscaled(tmp_path):
+    path = tmp_path / "photo.jpg"
+    Image.new("RGB", (6000, 4000), "red").save(path, quality=50)
+
+    prepared = prepare_image(str(path), max_side=1024)
+    assert prepared.data_url.startswith("data:image/jpeg;base64,")
+    assert (prepared.width, prepared.height) == (1024, 683)
+    assert _decode(prepared).size == (1024, 683)
+
+def test_png_is_converted_and_limited(tmp_path, monkeypatch):
+    path = tmp_path / "diagram.png"
+    Image.new("RGBA", (3000, 1000), (0, 0, 255, 128)).save(path)
+    prepared = prepare_image(str(path), max_side=600)
+    assert _decode(prepared).size == (600, 200)
+
+    monkeypatch.setattr(extractors, "IMAGE_MAX_DECODE_PIXELS", 1_000_000)
+    with pytest.raises(ValueError):
+        prepare_image(str(path))
+
+def test_unreadable_images_pass_through_only_when_small(tmp_path, monkeypatch):
+    path = tmp_path / "photo.heic"
+    path.write_bytes(b"not decodable here")
+    assert prepare_image(str(path)).data_url.endswith(base64.b64encode(b"not decodable here").decode())
+
+    monkeypatch.setattr(extractors, "IMAGE_MAX_RAW_BYTES", 4)
+    with pytest.raises(ValueError):
+        prepare_image(str(path))
+
+def _minimal_pdf(text: str) -> bytes:
+    """A one-page PDF with a text layer, assembled by hand."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode()
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return pdf
+
+def _docx(path, paragraphs):
+    body = "".join(f'<w:p><w:r><w:t>{p}</w:t></w:r></w:p>' for p in paragraphs)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml",
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f"<w:body>{body}</w:body></w:document>")
+
+def test_registry_prefers_content_type_over_extension():
+    assert extractor_registry.resolve("blob.pdf").name == "pdf"
+    assert extractor_registry.resolve("blob.bin", "application/pdf; charset=binary").name == "pdf"
+    # Generic types fall back to the extension
+    assert extractor_registry.resolve("report.docx", "application/octet-stream").name == "docx"
+    assert extractor_registry.resolve("notes.txt", "text/plain") is None
+
+def test_pdf_text_layer(tmp_path):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(_minimal_pdf("Quarterly revenue report"))
+    extraction = extractors.extract_pdf(str(path), 10_000)
+    assert "Quarterly revenue report" in extraction.text
+    assert extraction.images == []
+
+def test_office_documents(tmp_path):
+    docx = tmp_path / "letter.docx"
+    _docx(docx, ["Dear Ada,", "The engine works."])
+    assert extractors.extract_docx(str(docx), 10_000).text.split("\n")[:2] == ["Dear Ada,", "The engine works."]
+    assert extractors.extract_docx(str(docx), 5).text == "Dear "
+
+    pptx = tmp_path / "deck.pptx"
+    ns = 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+    with zipfile.ZipFile(pptx, "w") as archive:
+        for number in (10, 2, 1):
+            archive.writestr(f"ppt/slides/slide{number}.xml", f"<p:sld {ns} xmlns:p=\"p\"><a:p><a:t>Slide text {number}</a:t></a:p></p:sld>")
+    text = extractors.extract_pptx(str(pptx), 10_000).text
+    assert text.index("Slide text 1") < text.index("Slide text 2") < text.index("Slide text 10")
+
+    xlsx = tmp_path / "budget.xlsx"
+    with zipfile.ZipFile(xlsx, "w") as archive:
+        archive.writestr("xl/workbook.xml", '<workbook><sheets><sheet name="Q1"/><sheet name="Q2"/></sheets></workbook>')
+        archive.writestr("xl/sharedStrings.xml", "<sst><si><t>Rent</t></si><si><t>Payroll</t></si></sst>")
+    text = extractors.extract_xlsx(str(xlsx), 10_000).text
+    assert "Sheets: Q1, Q2" in text and "Rent" in text and "Payroll" in text
+
+def test_archive_listing(tmp_path):
+    zipped = tmp_path / "project.zip"
+    with zipfile.ZipFile(zipped, "w") as archive:
+        archive.writestr("project/README.md", "A tool for cataloguing notes")
+        archive.writestr("project/main.py", "print('hi')")
+    text = extractors.extract_archive(str(zipped), 10_000).text
+    assert "2 entries" in text and "project/main.py" in text
+    assert "A tool for cataloguing notes" in text
+
+    tarred = tmp_path / "photos.tar.gz"
+    with tarfile.open(tarred, "w:gz") as archive:
+        archive.add(zipped, arcname="backup/project.zip")
+    assert "backup/project.zip" in extractors.extract_archive(str(tarred), 10_000).text
+
+def test_extraction_is_cached_next_to_blob(tmp_path, monkeypatch):
+    path = tmp_path / "letter.docx"
+    _docx(path, ["Cached paragraph"])
+    assert "Cached paragraph" in run_extractor("docx", str(path), 10_000).text
+    cache = json.loads((tmp_path / "letter.docx.extracted.json").read_text())
+    assert cache["extractor"] == "docx" and "Cached paragraph" in cache["text"]
+
+    def fail(*args):
+        raise AssertionError("re-parsed")
+    monkeypatch.setitem(extractor_registry.by_name, "docx", extractor_registry.by_name["docx"]._replace(function=fail))
+    assert "Cached paragraph" in run_extractor("docx", str(path), 10_000).text
+    # A newer extractor version parses again
+    monkeypatch.setitem(extractor_registry.by_name, "docx", extractor_registry.by_name["docx"]._replace(version=99))
+    with pytest.raises(AssertionError):
+        run_extractor("docx", str(path), 10_000)
+
+@pytest.mark.asyncio
+async def test_extract_runs_in_process_pool(tmp_path, monkeypatch):
+    path = tmp_path / "paper.pdf"
+    path.write_bytes(_minimal_pdf("Parsed elsewhere"))
+    monkeypatch.setattr(executors, "process_count", 1)
+    try:
+        extraction = await extract(str(path), "application/pdf")
+        assert "Parsed elsewhere" in extraction.text
+        assert executors._processes is not None
+    finally:
+        executors.shutdown()
+    assert await extract(str(tmp_path / "notes.txt"), "text/plain") is None
@@ -0,0 +1,127 @@
+import io
+import json
+import os
+import tarfile
+import zipfile
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from app.models import Blob, ContentItem
+from app.services import ingest
+from app.services.job_queue import JobQueue
+from app.services.storage import FileSystemStorage
+
+@pytest.fixture
+def ingest_env(tmp_path):
+    storage = FileSystemStorage(str(tmp_path / "blobs"))
+    queue = JobQueue()
+    with patch("app.api.storage", storage), patch("app.api.job_queue", queue):
+        yield storage, queue
+
+def make_zip(files: dict, encrypted=()) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    data = bytearray(buffer.getvalue())
+    # zipfile can't encrypt: set the "encrypted" flag in the local and central headers instead
+    for name in encrypted:
+        encoded = name.encode()
+        for signature, flag_offset, name_offset in ((b"PK\x03\x04", 6, 30), (b"PK\x01\x02", 8, 46)):
+            position = data.find(signature)
+            while position != -1:
+                if data[position + name_offset:position + name_offset + len(encoded)] == encoded:
+                    data[position + flag_offset] |= 0x1
+                position = data.find(signature, position + 1)
+    return bytes(data)
+
+def make_tar(files: dict) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def items_by_name(session: Session) -> dict:
+    return {item.original_filename: item for item in session.exec(select(ContentItem)).all()}
+
+def blob_files(storage: FileSystemStorage) -> list:
+    return [os.path.join(root, name) for root, _, names in os.walk(storage.storage_dir) for name in names]
+
+def test_zip_members_become_items(client: TestClient, session: Session, ingest_env):
+    storage, queue = ingest_env
+    archive = make_zip({
+        "notes/a.md": b"# A",
+        "notes/copy-of-a.md": b"# A",
+        "notes/sub/b.txt": b"bee",
+        "__MACOSX/notes/._a.md": b"junk",
+        "notes/.DS_Store": b"junk",
+        "notes/secret.txt": b"hidden",
+    }, encrypted={"notes/secret.txt"})
+
+    response = client.post("/api/ingest/archive", files={"file": ("notes.zip", archive)}, data={"metadata": '{"project": "x"}'})
+
+    assert response.status_code == 200
+    assert response.json() == {"created": 3, "skipped": ["notes/secret.txt"]}
+    items = items_by_name(session)
+    assert set(items) == {"notes/a.md", "notes/copy-of-a.md", "notes/sub/b.txt"}
+    assert items["notes/sub/b.txt"].content_type == "text/plain"
+    assert json.loads(items["notes/a.md"].metadata_json) == {"source_archive": "notes.zip", "project": "x"}
+    # Identical members share one blob, written once
+    assert items["notes/a.md"].storage_path == items["notes/copy-of-a.md"].storage_path
+    assert session.get(Blob, items["notes/a.md"].checksum).ref_count == 2
+    assert len(blob_files(storage)) == 2
+    assert queue.qsize() == 3
+
+def test_tar_reingest_adds_versions(client: TestClient, session: Session, ingest_env):
+    storage, queue = ingest_env
+    client.post("/api/upload", files={"file": ("notes/a.md", b"# A")})
+    archive = make_tar({"./notes/a.md": b"# A v2", "notes/b.md": b"# B", "notes/b.md.bak": b"# A"})
+
+    for _ in range(2):
+        response = client.post("/api/ingest/archive", files={"file": ("notes.tar.gz", archive)})
+        assert response.json()["created"] == 3
+
+    versions = {}
+    for item in session.exec(select(ContentItem)).all():
+        versions.setdefault(item.original_filename, []).append((item.version, item.is_latest))
+    assert sorted(versions["notes/a.md"]) == [(1, False), (2, False), (3, True)]
+    assert sorted(versions["notes/b.md"]) == [(1, False), (2, True)]
+    # Content already stored (by the upload or the first import) isn't kept twice
+    assert len(blob_files(storage)) == 3
+
+def test_large_members_are_streamed(client: TestClient, session: Session, ingest_env):
+    storage, _ = ingest_env
+    big = os.urandom(300_000)
+    with patch.object(ingest, "INGEST_INLINE_BYTES", 100_000), patch.object(ingest, "STREAM_CHUNK", 64 * 1024):
+        response = client.post("/api/ingest/archive", files={"file": ("data.tar.gz", make_tar({"big.bin": big, "small.txt": b"s"}))})
+
+    assert response.json()["created"] == 2
+    item = items_by_name(session)["big.bin"]
+    with open(storage.get_path(item.storage_path), "rb") as f:
+        assert f.read() == big
+
+def test_rejects_non_archives(client: TestClient, session: Session, ingest_env):
+    response = client.post("/api/ingest/archive", files={"file": ("notes.txt", b"just text")})
+    assert response.status_code == 400
+    assert session.exec(select(ContentItem)).all() == []
+
+@pytest.mark.parametrize("limit, value", [
+    ("INGEST_MAX_MEMBERS", 2),
+    ("INGEST_MAX_MEMBER_BYTES", 1000),
+    ("INGEST_MAX_TOTAL_BYTES", 2500),
+])
+def test_rejects_archives_over_the_limits(client: TestClient, session: Session, ingest_env, limit, value):
+    storage, queue = ingest_env
+    # Compresses to almost nothing, unpacks to 4.5 KB
+    archive = make_zip({"a.txt": b"a" * 500, "b.txt": b"b" * 2000, "c.txt": b"c" * 2000})
+    with patch.object(ingest, limit, value):
+        response = client.post("/api/ingest/archive", files={"file": ("bomb.zip", archive)})
+
+    assert response.status_code == 413
+    assert session.exec(select(ContentItem)).all() == []
+    assert blob_files(storage) == []
+    assert queue.qsize() == 0
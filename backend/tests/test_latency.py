@@ -0,0 +1,73 @@
+import asyncio
+import time
+import pytest
+import httpx
+from unittest.mock import AsyncMock, MagicMock, patch
+from app.main import app
+from app.models import ContentItem, ContentStatus
+from app.services.leases import leases
+from app.services.job_queue import JobQueue
+
+DB_STALL = 0.05 # Seconds each simulated worker DB round-trip takes
+
+def slow_session_factory():
+    """Sessions whose every DB round-trip takes DB_STALL seconds of blocking I/O."""
+    def slow(result=None):
+        def call(*args, **kwargs):
+            time.sleep(DB_STALL)
+            return result
+        return call
+
+    def factory(*args, **kwargs):
+        session = MagicMock()
+        session.__enter__.return_value = session
+        item = ContentItem(original_filename="a.txt", storage_path="a.txt", status=ContentStatus.PROCESSING)
+        session.get.side_effect = slow(item)
+        session.exec.side_effect = slow(MagicMock(all=MagicMock(return_value=[])))
+        # Lease statements: every claim succeeds and the lease is still ours when saving
+        session.execute.side_effect = slow(MagicMock(
+            scalars=MagicMock(return_value=[item.id]),
+            scalar_one_or_none=MagicMock(return_value=leases.owner),
+        ))
+        session.commit.side_effect = slow()
+        return session
+    return factory
+
+@pytest.mark.asyncio
+async def test_request_latency_independent_of_worker_db_activity():
+    from app import workers
+    queue = JobQueue()
+    mock_llm = MagicMock(model="test-model")
+    mock_llm.generate_metadata = AsyncMock(return_value={"summary": "ok"})
+    mock_llm.is_batchable.return_value = False
+
+    with patch.object(workers, "Session", slow_session_factory()), \
+         patch.object(workers, "job_queue", queue), \
+         patch.object(workers, "llm_service", mock_llm), \
+         patch.dict("os.environ", {"WORKER_CONCURRENCY": "4"}):
+        worker = asyncio.create_task(workers.process_unprocessed_items())
+
+        async def keep_worker_busy():
+            while True:
+                queue.enqueue(ContentItem(original_filename="a.txt", storage_path="a.txt").id)
+                await asyncio.sleep(0.005)
+        feeder = asyncio.create_task(keep_worker_busy())
+
+        latencies = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            deadline = time.perf_counter() + 0.5
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.get("/")
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200
+                await asyncio.sleep(0.002)
+
+        feeder.cancel()
+        worker.cancel()
+
+    assert mock_llm.generate_metadata.await_count > 0
+    p99 = sorted(latencies)[int(len(latencies) * 0.99) - 1]
+    # Worker DB calls block for DB_STALL each; on the event loop they would show up here
+    assert p99 < DB_STALL
@@ -0,0 +1,188 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+import pytest
+from sqlalchemy import update
+from sqlmodel import Session
+from app.database import create_sqlite_engine
+from app.models import ContentItem, ContentStatus, create_db_and_tables
+from app.services.leases import LeaseManager
+
+def add_items(session: Session, count: int):
+    items = [ContentItem(original_filename=f"note-{i}.txt", storage_path=f"note-{i}.txt") for i in range(count)]
+    session.add_all(items)
+    session.commit()
+    return items
+
+def test_only_one_owner_can_claim(session: Session):
+    first, second = LeaseManager("a"), LeaseManager("b")
+    item, = add_items(session, 1)
+
+    assert first.claim(session, item.id)
+    assert not second.claim(session, item.id)
+    # Claiming again is a no-op for the holder
+    assert first.claim(session, item.id)
+    session.refresh(item)
+    assert (item.status, item.lease_owner) == (ContentStatus.PROCESSING, "a")
+
+def test_expired_lease_is_reclaimed(session: Session):
+    crashed, survivor = LeaseManager("crashed", lease_seconds=60), LeaseManager("survivor")
+    item, = add_items(session, 1)
+    assert crashed.claim(session, item.id)
+    assert survivor.claim_batch(session, 10) == []
+
+    item.lease_expires_at = datetime.utcnow() - timedelta(seconds=1)
+    session.add(item)
+    session.commit()
+    assert survivor.claim_batch(session, 10) == [item.id]
+    assert not crashed.holds(session, item.id)
+
+def test_renew_and_release(session: Session):
+    leases = LeaseManager("a", lease_seconds=60)
+    items = add_items(session, 2)
+    for item in items:
+        assert leases.claim(session, item.id)
+    assert leases.renew(session) == 2
+
+    leases.release(session, [items[0].id], retry_after=30)
+    session.refresh(items[0])
+    assert items[0].status == ContentStatus.UNPROCESSED and items[0].lease_owner is None
+    # Released items wait for their retry time, even for the process that released them
+    assert not leases.claim(session, items[0].id)
+    assert not LeaseManager("b").claim(session, items[0].id)
+
+def test_read_only_checks_match_what_would_be_written(session: Session):
+    leases, other = LeaseManager("a"), LeaseManager("b")
+    assert not leases.has_waiting(session) and not leases.holds_any(session)
+
+    item, = add_items(session, 1)
+    assert leases.has_waiting(session) and other.has_waiting(session)
+    assert leases.claim_batch(session, 10) == [item.id]
+    # Held items are renewed, not claimed again
+    assert not leases.has_waiting(session) and leases.holds_any(session)
+    assert not other.has_waiting(session) and not other.holds_any(session)
+
+def test_concurrent_workers_never_share_items(tmp_path):
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'leases.db'}")
+    create_db_and_tables(engine)
+    with Session(engine) as session:
+        add_items(session, 200)
+
+    def drain(owner: str):
+        leases = LeaseManager(owner)
+        claimed = []
+        with Session(engine) as session:
+            while batch := leases.claim_batch(session, 7):
+                claimed.extend(batch)
+        return claimed
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(drain, ["w1", "w2", "w3", "w4"]))
+    claimed = [item_id for result in results for item_id in result]
+    assert len(claimed) == 200
+    assert len(set(claimed)) == 200
+    engine.dispose()
+
+@pytest.mark.asyncio
+async def test_worker_does_not_save_after_losing_its_lease(session: Session):
+    from app import workers
+    item, = add_items(session, 1)
+    mine, other = LeaseManager("mine"), LeaseManager("other")
+    assert mine.claim(session, item.id)
+    session.refresh(item)
+
+    async def slow_generate(*args, **kwargs):
+        # Meanwhile the lease expires and another worker takes the item over
+        session.execute(
+            update(ContentItem).where(ContentItem.id == item.id)
+            .values(lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        assert other.claim(session, item.id)
+        return {"summary": "late"}
+
+    llm = AsyncMock(model="test-model")
+    llm.generate_metadata = slow_generate
+    with patch.object(workers, "leases", mine), patch.object(workers, "llm_service", llm):
+        await workers.process_item(item, session, llm)
+
+    session.expire_all()
+    stored = session.get(ContentItem, item.id)
+    assert stored.status == ContentStatus.PROCESSING and stored.lease_owner == "other"
+    assert "late" not in stored.metadata_json
+
+@pytest.mark.asyncio
+async def test_events_from_other_processes_are_relayed(tmp_path):
+    from app.services import event_broadcaster as events
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    create_db_and_tables(engine)
+    api_side, worker_side = events.EventBroadcaster(), events.EventBroadcaster()
+
+    with patch.object(events, "engine", engine):
+        subscriber = await api_side.subscribe()
+        relay = asyncio.create_task(api_side.relay(interval=0.01))
+        await asyncio.sleep(0.05)
+        await worker_side.broadcast(json.dumps({"type": "update", "item_id": "1"}))
+        try:
+            frame = await api_side.next_frame(subscriber, timeout=1)
+            assert json.loads(frame.split("data: ", 1)[1])["item_id"] == "1"
+        finally:
+            relay.cancel()
+    engine.dispose()
+
+@pytest.mark.asyncio
+async def test_relay_survives_a_failed_poll(tmp_path):
+    from sqlalchemy.exc import OperationalError
+    from app.services import event_broadcaster as events
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    create_db_and_tables(engine)
+    api_side, worker_side = events.EventBroadcaster(), events.EventBroadcaster()
+    polls = []
+    events_after = events.events_after
+
+    def flaky_events_after(event_id, *args):
+        polls.append(event_id)
+        if len(polls) == 1:
+            raise OperationalError("SELECT", {}, Exception("database is locked"))
+        return events_after(event_id, *args)
+
+    with patch.object(events, "engine", engine), patch.object(events, "events_after", flaky_events_after):
+        subscriber = await api_side.subscribe()
+        relay = asyncio.create_task(api_side.relay(interval=0.01))
+        await asyncio.sleep(0.05)
+        await worker_side.broadcast(json.dumps({"type": "update", "item_id": "1"}))
+        try:
+            frame = await api_side.next_frame(subscriber, timeout=1)
+            assert json.loads(frame.split("data: ", 1)[1])["item_id"] == "1"
+            assert not relay.done()
+        finally:
+            relay.cancel()
+    engine.dispose()
+
+@pytest.mark.asyncio
+async def test_processes_relay_each_others_events_once(tmp_path):
+    # Two `uvicorn --workers` processes, both running the worker
+    from app.services import event_broadcaster as events
+    engine = create_sqlite_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    create_db_and_tables(engine)
+    first, second = events.EventBroadcaster(coalesce_interval=0), events.EventBroadcaster(coalesce_interval=0)
+
+    with patch.object(events, "engine", engine):
+        subscribers = [await first.subscribe(), await second.subscribe()]
+        relays = [asyncio.create_task(broadcaster.relay(interval=0.01)) for broadcaster in (first, second)]
+        await asyncio.sleep(0.05)
+        await first.broadcast(json.dumps({"type": "update", "item_id": "1"}))
+        await second.broadcast(json.dumps({"type": "update", "item_id": "2"}))
+        try:
+            for broadcaster, subscriber in zip((first, second), subscribers):
+                received = [json.loads((await broadcaster.next_frame(subscriber, timeout=1)).split("data: ", 1)[1])["item_id"] for _ in range(2)]
+                assert sorted(received) == ["1", "2"]
+                # Nothing arrives twice
+                assert await broadcaster.next_frame(subscriber, timeout=0.1) == ": ping\n\n"
+        finally:
+            for relay in relays:
+                relay.cancel()
+    engine.dispose()
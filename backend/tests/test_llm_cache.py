@@ -0,0 +1,131 @@
+import shutil
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from app.models import ContentItem, ContentStatus, LLMCacheEntry
+from app.services.llm import BatchResult, LLMService
+from app.services.prompts import PromptRegistry
+from app.services.llm_cache import LLMCache
+from app.workers import process_item
+
+@pytest.fixture
+def cache():
+    cache = LLMCache()
+    cache.evict_interval = 0 # Check the limits on every put
+    return cache
+
+def test_cache_round_trip(session: Session, cache):
+    assert cache.get(session, "abc", "p1", "model") is None
+    cache.put(session, "abc", "p1", "model", {"summary": "cached"})
+    session.commit()
+
+    assert cache.get(session, "abc", "p1", "model") == {"summary": "cached"}
+    # A different prompt version or model is a different entry
+    assert cache.get(session, "abc", "p2", "model") is None
+    assert cache.get(session, "abc", "p1", "other-model") is None
+    assert cache.hits == 1
+    assert cache.misses == 3
+
+def test_cache_evicts_least_recently_used(session: Session, cache):
+    cache.max_entries = 2
+    cache.put(session, "a", "p", "m", {"n": 1})
+    cache.put(session, "b", "p", "m", {"n": 2})
+    session.commit()
+    assert cache.get(session, "a", "p", "m") is not None
+    assert not session.dirty # Lookups run on reader sessions and must not write
+    cache.touch(session, "a", "p", "m") # "b" is now the least recently used
+    cache.put(session, "c", "p", "m", {"n": 3})
+    session.commit()
+
+    assert session.get(LLMCacheEntry, ("b", "p", "m")) is None
+    assert session.get(LLMCacheEntry, ("a", "p", "m")) is not None
+    assert session.get(LLMCacheEntry, ("c", "p", "m")) is not None
+
+def test_cache_evicts_by_size(session: Session, cache):
+    cache.max_bytes = 30
+    cache.put(session, "a", "p", "m", {"summary": "x" * 10})
+    cache.put(session, "b", "p", "m", {"summary": "y" * 10})
+    session.commit()
+
+    assert cache.stats(session)["entries"] == 1
+    assert session.get(LLMCacheEntry, ("b", "p", "m")) is not None
+
+def test_cache_checks_limits_at_most_once_per_interval(session: Session, cache):
+    cache.max_entries = 1
+    cache.evict_interval = 3600
+    for key in "abc":
+        cache.put(session, key, "p", "m", {"n": key})
+    session.commit()
+    # Only the first put evicted, while the table still fit
+    assert cache.stats(session)["entries"] == 3
+
+    cache.evict(session)
+    session.commit()
+    assert cache.stats(session)["entries"] == 1
+
+def test_prompt_version_tracks_prompt_files(tmp_path):
+    llm_service = LLMService(model="test-model")
+    shutil.copytree(llm_service.prompts_dir, tmp_path / "prompts")
+    llm_service.prompts = PromptRegistry(tmp_path / "prompts", reload_interval=0)
+
+    text_version = llm_service.get_prompt_version("notes.txt")
+    assert text_version == llm_service.get_prompt_version("other.md")
+    assert text_version != llm_service.get_prompt_version("photo.png")
+
+    (tmp_path / "prompts" / "common_schema.json").write_text('{"summary": "changed"}')
+    assert llm_service.get_prompt_version("notes.txt") != text_version
+
+@pytest.mark.asyncio
+async def test_process_item_reuses_cached_metadata(session: Session, monkeypatch):
+    from app import workers
+    monkeypatch.setattr(workers, "llm_cache", LLMCache())
+    llm_service = MagicMock()
+    llm_service.model = "test-model"
+    llm_service.get_prompt_version.return_value = "p1"
+    llm_service.generate_metadata = AsyncMock(return_value={"summary": "from llm"})
+
+    first = ContentItem(original_filename="a.txt", storage_path="a.txt", checksum="same")
+    second = ContentItem(original_filename="b.txt", storage_path="b.txt", checksum="same")
+    session.add_all([first, second])
+    session.commit()
+
+    await process_item(first, session, llm_service)
+    await process_item(second, session, llm_service)
+
+    assert llm_service.generate_metadata.await_count == 1
+    assert second.status == ContentStatus.TAGGED
+    assert workers.llm_cache.hits == 1
+
+@pytest.mark.asyncio
+async def test_batched_results_are_cached_under_the_batch_prompt(session: Session, monkeypatch):
+    from app import workers
+    monkeypatch.setattr(workers, "llm_cache", LLMCache())
+    llm_service = MagicMock()
+    llm_service.model = "test-model"
+    llm_service.get_prompt_version.side_effect = lambda path, content_type=None, batch=False: "batch-v" if batch else "single-v"
+    llm_service.generate_metadata = AsyncMock(return_value={"summary": "from llm"})
+
+    first = ContentItem(original_filename="a.txt", storage_path="a.txt", checksum="same")
+    second = ContentItem(original_filename="b.txt", storage_path="b.txt", checksum="same")
+    session.add_all([first, second])
+    session.commit()
+
+    await process_item(first, session, llm_service, generated=BatchResult({"summary": "from batch"}, "batch-v"))
+    assert session.get(LLMCacheEntry, ("same", "single-v", "test-model")) is None
+    assert session.get(LLMCacheEntry, ("same", "batch-v", "test-model")) is not None
+
+    # Reused for content that is batchable too, so the batch prompt's answer still fits
+    llm_service.is_batchable.return_value = True
+    await process_item(second, session, llm_service)
+    assert second.metadata_json == first.metadata_json
+    llm_service.generate_metadata.assert_not_awaited()
+
+    # Other file types only take results of their own prompt
+    llm_service.is_batchable.return_value = False
+    assert workers.prompt_versions(llm_service, second) == ["single-v"]
+
+def test_cache_stats_endpoint(client: TestClient):
+    response = client.get("/api/cache/stats")
+    assert response.status_code == 200
+    assert set(response.json()) >= {"hits", "misses", "hit_rate", "entries"}
@@ -1,8 +1,11 @@
 import pytest
 import os
+import zipfile
 from unittest.mock import AsyncMock, patch
 from pathlib import Path
 from app.services.llm import LLMService
+from app.services.truncation import CHARS_PER_TOKEN_BOUND, count_tokens
+from app.services.extractors import read_text_excerpt
 
 @pytest.fixture
 def llm_service():
@@ -84,22 +87,145 @@ def test_truncate_content(llm_service):
 
 def test_truncate_content_large(llm_service):
     prompt = "Test prompt"
-    long_content = "Word " * 2000
     
     with patch("app.services.llm.get_max_tokens", return_value=4096):
-        # available_tokens = 4096 - 1500 = 2596
-        # Threshold = 2596 * 4 = 10384 characters
-        # long_content is "Word " * 2000 = 10000 characters
-        # So it still won't trigger if we use "Word " * 2000.
-        # Let's use more words.
-        very_long_content = "Word " * 4000 # 20000 characters
-        
-        with patch("app.services.llm.token_counter", return_value=2000):
-            # Should not truncate if it fits within token limit
-            truncated = llm_service._truncate_content(prompt, very_long_content, "test-model")
-            assert truncated == very_long_content
-
-        with patch("app.services.llm.token_counter", return_value=5000):
-            # Should truncate if it doesn't fit within token limit
-            truncated = llm_service._truncate_content(prompt, very_long_content, "test-model")
-            assert len(truncated) < len(very_long_content)
+        # available_tokens = 4096 - 1500 = 2596, minus the prompt's own tokens
+        budget = 2596 - count_tokens(prompt, "test-model")
+
+        fitting_content = "Word " * 2000
+        assert llm_service._truncate_content(prompt, fitting_content, "test-model") == fitting_content
+
+        very_long_content = "Word " * 4000
+        truncated = llm_service._truncate_content(prompt, very_long_content, "test-model")
+        # Cut at exactly the token budget, not at a character guess
+        assert count_tokens(truncated, "test-model") == budget
+        assert very_long_content.startswith(truncated)
+
+def _completion_response(content: str):
+    response = AsyncMock()
+    response.choices = [AsyncMock(message=AsyncMock(content=content))]
+    return response
+
+def _small_files(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"note{i}.md"
+        path.write_text(f"Content of note {i}")
+        paths.append(str(path))
+    return paths
+
+@patch("app.services.llm.acompletion")
+@pytest.mark.asyncio
+async def test_generate_metadata_batch_single_request(mock_acompletion, llm_service, tmp_path):
+    paths = _small_files(tmp_path, 3)
+    mock_acompletion.return_value = _completion_response(
+        '```json\n[{"file": 2, "summary": "two"}, {"file": "1", "summary": "one"}, {"file": "FILE 3", "summary": "three"}]\n```'
+    )
+
+    results = await llm_service.generate_metadata_batch(paths)
+
+    assert [result.metadata["summary"] for result in results] == ["one", "two", "three"]
+    assert "file" not in results[0].metadata
+    assert {result.prompt_version for result in results} == {llm_service.get_prompt_version(paths[0], batch=True)}
+    mock_acompletion.assert_called_once()
+    content = mock_acompletion.call_args.kwargs["messages"][0]["content"]
+    # Instructions are sent once for the whole batch
+    assert content.count("Analyze the following file") == 1
+    assert "=== FILE 3: note2.md ===\nContent of note 2" in content
+
+@patch("app.services.llm.acompletion")
+@pytest.mark.asyncio
+async def test_generate_metadata_batch_falls_back_to_single_calls(mock_acompletion, llm_service, tmp_path):
+    paths = _small_files(tmp_path, 3)
+    mock_acompletion.side_effect = [
+        # Batch answer is missing file 3
+        _completion_response('[{"file": 1, "summary": "one"}, {"file": 2, "summary": "two"}]'),
+        _completion_response('{"summary": "three alone"}'),
+        # Second batch is not JSON at all
+        _completion_response("Sorry, I can't do that"),
+        _completion_response('{"summary": "a"}'),
+        _completion_response('{"summary": "b"}'),
+    ]
+
+    results = await llm_service.generate_metadata_batch(paths)
+    assert [result.metadata["summary"] for result in results] == ["one", "two", "three alone"]
+    # Files retried alone are answered by the single-file prompt
+    single, batched = llm_service.get_prompt_version(paths[0]), llm_service.get_prompt_version(paths[0], batch=True)
+    assert single != batched
+    assert [result.prompt_version for result in results] == [batched, batched, single]
+
+    results = await llm_service.generate_metadata_batch(paths[:2])
+    assert [result.metadata["summary"] for result in results] == ["a", "b"]
+    assert mock_acompletion.call_count == 5
+
+@patch("app.services.llm.acompletion")
+@pytest.mark.asyncio
+async def test_batch_fallbacks_keep_the_content_type(mock_acompletion, llm_service, tmp_path):
+    paths = []
+    for i in range(2):
+        path = tmp_path / f"note{i}.zzz" # Unknown extension: only the MIME type says it's text
+        path.write_text(f"Content of note {i}")
+        paths.append(str(path))
+    mock_acompletion.side_effect = [
+        _completion_response('[{"file": 1, "summary": "one"}]'),
+        _completion_response('{"summary": "two alone"}'),
+    ]
+
+    results = await llm_service.generate_metadata_batch(paths, ["text/plain", "text/plain"])
+
+    assert results[1].metadata["summary"] == "two alone"
+    assert results[1].prompt_version == llm_service.get_prompt_version(paths[1], "text/plain")
+    assert results[1].prompt_version != llm_service.get_prompt_version(paths[1])
+    assert "Content of note 1" in mock_acompletion.call_args.kwargs["messages"][0]["content"]
+
+def test_pack_batches_respects_context_window(llm_service):
+    llm_service.batch_response_tokens = 100
+    sections = ["x" * 400] * 5 # 100 tokens each, 200 with the response reserve
+    with patch.object(llm_service, "_available_tokens", return_value=500):
+        assert llm_service._pack_batches("", sections) == [[0, 1], [2, 3], [4]]
+
+def test_is_batchable(llm_service, tmp_path):
+    small = tmp_path / "small.txt"
+    small.write_text("hi")
+    large = tmp_path / "large.txt"
+    large.write_text("x" * (llm_service.batch_max_bytes + 1))
+    image = tmp_path / "tiny.png"
+    image.write_bytes(b"png")
+    assert llm_service.is_batchable(str(small))
+    assert not llm_service.is_batchable(str(large))
+    assert not llm_service.is_batchable(str(image))
+
+@patch("app.services.llm.acompletion")
+@pytest.mark.asyncio
+async def test_generate_metadata_reads_bounded_prefix(mock_acompletion, llm_service, tmp_path):
+    path = tmp_path / "huge.log"
+    path.write_text("x " * 5_000_000) # 10 MB
+    mock_acompletion.return_value = _completion_response('{"summary": "log"}')
+
+    with patch("app.services.llm.get_max_tokens", return_value=4096), \
+         patch("app.services.llm.read_text_excerpt", wraps=read_text_excerpt) as excerpt:
+        await llm_service.generate_metadata(str(path))
+
+    assert excerpt.call_args.args[1] == 2596 * CHARS_PER_TOKEN_BOUND
+    content = mock_acompletion.call_args.kwargs["messages"][0]["content"]
+    assert len(content) < 2596 * CHARS_PER_TOKEN_BOUND
+
+@patch("app.services.llm.acompletion")
+@pytest.mark.asyncio
+async def test_generate_metadata_uses_extractor(mock_acompletion, llm_service, tmp_path):
+    # Content-addressed blobs may carry a misleading extension; the MIME type decides
+    path = tmp_path / "3f2a.bin"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", "<document><body><p><t>Minutes of the board meeting</t></p></body></document>")
+
+    mock_response = AsyncMock()
+    mock_response.choices = [AsyncMock(message=AsyncMock(content='{"summary": "minutes"}'))]
+    mock_acompletion.return_value = mock_response
+
+    docx_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+    result = await llm_service.generate_metadata(str(path), content_type=docx_type)
+    assert result["summary"] == "minutes"
+    content = mock_acompletion.call_args.kwargs["messages"][0]["content"]
+    assert "This is a document" in content
+    assert "Minutes of the board meeting" in content
+    assert llm_service.get_prompt_version(str(path), docx_type) != llm_service.get_prompt_version(str(path))
@@ -0,0 +1,77 @@
+import json
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, inspect, text
+from sqlmodel import Session, select
+from app.models import ContentItem, ContentStatus, create_db_and_tables
+from app.services.bulk_jobs import select_item_ids
+from app.services.search import index_item
+
+def _tagged(session: Session, filename: str, metadata: dict) -> ContentItem:
+    item = ContentItem(original_filename=filename, storage_path=filename, status=ContentStatus.TAGGED,
+                       metadata_json=json.dumps(metadata))
+    session.add(item)
+    index_item(session, item, metadata)
+    session.commit()
+    return item
+
+def _names(client: TestClient, **params) -> list:
+    response = client.get("/api/items", params=params)
+    assert response.status_code == 200
+    return sorted(item["original_filename"] for item in response.json())
+
+def test_items_filter_on_metadata(client: TestClient, session: Session):
+    _tagged(session, "happy.md", {"summary": "A", "tags": ["Travel", "photos"], "sentiment": "Positive", "language": "en"})
+    _tagged(session, "sad.md", {"summary": "B", "tags": ["travel"], "sentiment": "negative", "language": "de"})
+    session.add(ContentItem(original_filename="broken.md", storage_path="broken.md", metadata_json="not json"))
+    session.commit()
+
+    assert _names(client, sentiment="positive") == ["happy.md"]
+    assert _names(client, tags="travel") == ["happy.md", "sad.md"]
+    assert _names(client, tags="travel, Photos") == ["happy.md"]
+    assert _names(client, metadata="language:DE") == ["sad.md"]
+    assert _names(client, metadata=["language:en", "sentiment:negative"]) == []
+    assert _names(client, metadata="missing:x") == []
+    assert client.get("/api/items", params={"metadata": "language"}).status_code == 400
+    assert client.get("/api/items", params={"metadata": "a.b') OR 1=1 --:x"}).status_code == 400
+
+    sad = session.exec(select(ContentItem).where(ContentItem.original_filename == "sad.md")).one()
+    assert select_item_ids(session, tags=["travel"], sentiment="NEGATIVE") == [sad.id]
+    assert client.post("/api/jobs", json={"action": "retag", "metadata": {"bad key": "x"}}).status_code == 400
+
+    # The generated column is read-only and follows metadata_json
+    assert sad.sentiment == "negative"
+    sad.metadata_json = json.dumps({"sentiment": "Neutral"})
+    session.add(sad)
+    session.commit()
+    session.refresh(sad)
+    assert sad.sentiment == "neutral"
+
+def test_sentiment_listing_uses_index(session: Session):
+    statement = (
+        select(ContentItem)
+        .where(ContentItem.sentiment == "positive", ContentItem.is_latest == True)
+        .order_by(ContentItem.created_at.desc())
+        .limit(10)
+    )
+    compiled = statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True})
+    plan = " ".join(row[-1] for row in session.exec(text(f"EXPLAIN QUERY PLAN {compiled}")))
+    assert "ix_contentitem_sentiment_listing" in plan
+    assert "TEMP B-TREE" not in plan
+
+def test_generated_column_added_to_existing_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE contentitem (id CHAR(32) PRIMARY KEY, original_filename VARCHAR NOT NULL, "
+            "storage_path VARCHAR NOT NULL, metadata_json VARCHAR)"
+        ))
+        conn.execute(text(
+            "INSERT INTO contentitem (id, original_filename, storage_path, metadata_json) "
+            "VALUES ('00000000000000000000000000000001', 'old.md', 'old.md', '{\"sentiment\": \"Mixed\"}')"
+        ))
+
+    create_db_and_tables(engine)
+
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT sentiment FROM contentitem")).scalar() == "mixed"
+    assert "ix_contentitem_sentiment_listing" in {index["name"] for index in inspect(engine).get_indexes("contentitem")}
@@ -0,0 +1,70 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from sqlmodel import Session
+from app.models import ContentItem, ContentStatus
+from app.services.event_broadcaster import broadcaster
+from app.services.job_queue import JobQueue
+from app.services.llm import LLMService, TaggingError
+from app.services.storage import FileSystemStorage
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+def test_metrics_endpoint_reports_uploads_and_items(client: TestClient, session: Session, tmp_path):
+    uploads = sample("zibaldone_upload_size_bytes_count", route="upload")
+    uploaded_bytes = sample("zibaldone_upload_size_bytes_sum", route="upload")
+    saves = sample("zibaldone_storage_operation_duration_seconds_count", backend="filesystem", operation="save_stream")
+
+    with patch("app.api.storage", FileSystemStorage(str(tmp_path))), patch("app.api.job_queue", JobQueue()):
+        assert client.post("/api/upload", files={"file": ("doc.txt", b"0123456789")}).status_code == 200
+    session.add(ContentItem(original_filename="old.txt", storage_path="old.txt",
+                            created_at=datetime.utcnow() - timedelta(hours=1)))
+    session.add(ContentItem(original_filename="done.txt", storage_path="done.txt", status=ContentStatus.TAGGED))
+    session.commit()
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'zibaldone_items{status="unprocessed"} 2.0' in response.text
+    assert 'zibaldone_items{status="tagged"} 1.0' in response.text
+    assert 'zibaldone_items{status="failed"} 0.0' in response.text
+    assert 3600 <= sample("zibaldone_oldest_unprocessed_age_seconds") < 3700
+    assert sample("zibaldone_upload_size_bytes_count", route="upload") == uploads + 1
+    assert sample("zibaldone_upload_size_bytes_sum", route="upload") == uploaded_bytes + 10
+    assert sample("zibaldone_storage_operation_duration_seconds_count",
+                  backend="filesystem", operation="save_stream") == saves + 1
+
+@patch("app.services.llm.acompletion")
+@pytest.mark.asyncio
+async def test_llm_latency_and_tokens_by_model_and_type(mock_acompletion, tmp_path):
+    path = tmp_path / "note.txt"
+    path.write_text("Some content")
+    response = AsyncMock()
+    response.choices = [AsyncMock(message=AsyncMock(content='{"summary": "ok"}'))]
+    response.usage = AsyncMock(prompt_tokens=120, completion_tokens=30)
+    mock_acompletion.return_value = response
+    llm = LLMService(model="metrics-model")
+    labels = {"model": "metrics-model", "type": "text"}
+
+    await llm.generate_metadata(str(path))
+    assert sample("zibaldone_generate_metadata_duration_seconds_count", outcome="ok", **labels) == 1
+    assert sample("zibaldone_llm_request_duration_seconds_count", outcome="ok", **labels) == 1
+    assert sample("zibaldone_llm_tokens_sum", kind="prompt", **labels) == 120
+    assert sample("zibaldone_llm_tokens_sum", kind="completion", **labels) == 30
+
+    mock_acompletion.side_effect = TimeoutError("slow")
+    with pytest.raises(TaggingError):
+        await llm.generate_metadata(str(path))
+    assert sample("zibaldone_generate_metadata_duration_seconds_count", outcome="error", **labels) == 1
+    assert sample("zibaldone_llm_request_duration_seconds_count", outcome="error", **labels) == 1
+
+@pytest.mark.asyncio
+async def test_sse_subscriber_gauge():
+    before = sample("zibaldone_sse_subscribers")
+    subscriber = await broadcaster.subscribe()
+    assert sample("zibaldone_sse_subscribers") == before + 1
+    broadcaster.unsubscribe(subscriber)
+    assert sample("zibaldone_sse_subscribers") == before
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import boto3
+import pytest
+import requests
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from moto import mock_aws
+from app.services.s3_storage import S3Storage
+from app.services.job_queue import JobQueue
+
+PART_SIZE = 5 * 1024 * 1024
+
+@pytest.fixture
+def s3_storage():
+    with mock_aws(), patch.dict(os.environ, {
+        "S3_ACCESS_KEY": "test",
+        "S3_SECRET_KEY": "test",
+        "S3_BUCKET_NAME": "test-bucket",
+        "S3_PART_SIZE": str(PART_SIZE),
+    }):
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket="test-bucket")
+        storage = S3Storage()
+        with patch("app.api.storage", storage), patch("app.api.job_queue", JobQueue()):
+            yield storage
+
+def upload_parts(client: TestClient, data: bytes, skip=()):
+    initiate = client.post("/api/upload/multipart/initiate", data={"filename": "big.bin"}).json()
+    part_numbers = list(range(1, -(-len(data) // initiate["part_size"]) + 1))
+    urls = client.post("/api/upload/multipart/sign", json={
+        "storage_path": initiate["storage_path"],
+        "upload_id": initiate["upload_id"],
+        "part_numbers": part_numbers,
+    }).json()["urls"]
+
+    parts = []
+    for number in part_numbers:
+        if number in skip:
+            continue
+        chunk = data[(number - 1) * initiate["part_size"]:number * initiate["part_size"]]
+        response = requests.put(urls[str(number)], data=chunk)
+        parts.append({"PartNumber": number, "ETag": response.headers["ETag"]})
+    return initiate, parts
+
+def test_multipart_upload_and_finalize(client: TestClient, s3_storage):
+    data = os.urandom(PART_SIZE) + b"tail"
+    initiate, parts = upload_parts(client, data)
+
+    listed = client.get("/api/upload/multipart/parts", params={
+        "storage_path": initiate["storage_path"], "upload_id": initiate["upload_id"]
+    }).json()["parts"]
+    assert [p["PartNumber"] for p in listed] == [1, 2]
+
+    complete = client.post("/api/upload/multipart/complete", json={
+        "storage_path": initiate["storage_path"], "upload_id": initiate["upload_id"], "parts": parts
+    })
+    assert complete.status_code == 200
+
+    item = client.post("/api/upload/finalize", data={
+        "original_filename": "big.bin",
+        "storage_path": initiate["storage_path"],
+        "checksum": hashlib.sha256(data).hexdigest(),
+    }).json()
+    assert item["checksum"] == hashlib.sha256(data).hexdigest()
+
+def test_complete_rejects_tampered_etag(client: TestClient, s3_storage):
+    initiate, parts = upload_parts(client, b"x" * 100)
+    parts[0]["ETag"] = '"not-the-real-etag"'
+
+    response = client.post("/api/upload/multipart/complete", json={
+        "storage_path": initiate["storage_path"], "upload_id": initiate["upload_id"], "parts": parts
+    })
+    assert response.status_code == 400
+
+def test_finalize_rejects_wrong_client_checksum(client: TestClient, s3_storage):
+    initiate, parts = upload_parts(client, b"real content")
+    client.post("/api/upload/multipart/complete", json={
+        "storage_path": initiate["storage_path"], "upload_id": initiate["upload_id"], "parts": parts
+    })
+
+    response = client.post("/api/upload/finalize", data={
+        "original_filename": "big.bin",
+        "storage_path": initiate["storage_path"],
+        "checksum": hashlib.sha256(b"something else").hexdigest(),
+    })
+    assert response.status_code == 400
+
+def test_abort_multipart_upload(client: TestClient, s3_storage):
+    initiate, _ = upload_parts(client, b"abandoned")
+    response = client.post("/api/upload/multipart/abort", json={
+        "storage_path": initiate["storage_path"], "upload_id": initiate["upload_id"]
+    })
+    assert response.status_code == 200
+
+def test_multipart_requires_s3(client: TestClient):
+    response = client.post("/api/upload/multipart/initiate", data={"filename": "a.txt"})
+    assert response.status_code == 400
@@ -0,0 +1,50 @@
+import os
+import shutil
+from pathlib import Path
+from unittest.mock import patch
+import pytest
+from app.services.prompts import PROMPTS_DIR, PromptRegistry
+
+@pytest.fixture
+def prompts_dir(tmp_path) -> Path:
+    shutil.copytree(PROMPTS_DIR, tmp_path / "prompts")
+    return tmp_path / "prompts"
+
+def test_prompt_is_compiled_once(prompts_dir):
+    registry = PromptRegistry(prompts_dir)
+    first = registry.get("text")
+    assert "This is a text-based file" in first.text
+    assert '"summary":' in first.text
+
+    with patch.object(Path, "read_bytes", side_effect=AssertionError("prompt files re-read")):
+        assert registry.get("text") is first
+
+def test_prompt_reloads_when_a_source_changes(prompts_dir):
+    registry = PromptRegistry(prompts_dir, reload_interval=0)
+    first = registry.get("text")
+
+    type_file = prompts_dir / "types" / "text.md"
+    type_file.write_text("Only list the tags.")
+    stat = type_file.stat()
+    os.utime(type_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    second = registry.get("text")
+    assert "Only list the tags." in second.text
+    assert second.fingerprint != first.fingerprint
+    # Other types don't depend on the changed file
+    assert registry.get("image").fingerprint == PromptRegistry(prompts_dir).get("image").fingerprint
+
+def test_reload_checks_are_throttled(prompts_dir):
+    registry = PromptRegistry(prompts_dir, reload_interval=60)
+    first = registry.get("text")
+    (prompts_dir / "types" / "text.md").write_text("Changed")
+    assert registry.get("text") is first
+
+def test_unknown_type_and_batch_prompts(prompts_dir):
+    registry = PromptRegistry(prompts_dir)
+    assert registry.get("spreadsheet").fingerprint == registry.get("default").fingerprint
+
+    batch = registry.get("text", batch=True)
+    assert batch.text.startswith(registry.get("text").text)
+    assert "JSON array" in batch.text
+    assert batch.fingerprint != registry.get("text").fingerprint
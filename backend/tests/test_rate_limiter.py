@@ -0,0 +1,57 @@
+import time
+import pytest
+from unittest.mock import MagicMock, patch
+from litellm.exceptions import RateLimitError
+from app.services.rate_limiter import TokenBucket, ModelRateLimiter, RateLimiterRegistry
+from app.services.llm import LLMService
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(rate_per_minute=600, capacity=1) # 10 per second
+    start = time.monotonic()
+    await bucket.acquire()
+    await bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+@pytest.mark.asyncio
+async def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(rate_per_minute=0)
+    for _ in range(1000):
+        await bucket.acquire(10_000)
+
+@pytest.mark.asyncio
+async def test_backoff_pauses_callers():
+    limiter = ModelRateLimiter()
+    limiter.backoff(0.1)
+    start = time.monotonic()
+    await limiter.acquire(100)
+    assert time.monotonic() - start >= 0.09
+
+def test_registry_per_model_overrides():
+    with patch.dict("os.environ", {
+        "LLM_REQUESTS_PER_MINUTE": "60",
+        "LLM_RATE_LIMITS": '{"fast-model": {"rpm": 600}}',
+    }):
+        registry = RateLimiterRegistry()
+        assert registry.get("slow-model").requests.capacity == 60
+        assert registry.get("fast-model").requests.capacity == 600
+        assert registry.get("fast-model") is registry.get("fast-model")
+
+@patch("app.services.llm.acompletion")
+@pytest.mark.asyncio
+async def test_generate_metadata_retries_on_429(mock_acompletion, tmp_path):
+    llm_service = LLMService(model="rate-limited-model")
+    llm_service.rate_limiter = ModelRateLimiter()
+    txt_path = tmp_path / "test.txt"
+    txt_path.write_text("content")
+
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock(message=MagicMock(content='{"summary": "ok"}'))]
+    rate_limited = RateLimitError("slow down", llm_provider="openai", model="rate-limited-model")
+    mock_acompletion.side_effect = [rate_limited, mock_response]
+
+    with patch.object(llm_service, "_retry_after", return_value=0.01):
+        result = await llm_service.generate_metadata(str(txt_path))
+
+    assert result["summary"] == "ok"
+    assert mock_acompletion.await_count == 2
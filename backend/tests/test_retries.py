@@ -0,0 +1,137 @@
+import uuid
+import httpx
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from litellm.exceptions import APIConnectionError, BadRequestError
+from sqlmodel import Session
+from app.models import ContentItem, ContentStatus
+from app.services import leases as lease_module
+from app.services.leases import LeaseManager, retry_delay
+from app.services.llm import LLMService, TaggingError
+
+def add_item(session: Session, **fields) -> ContentItem:
+    item = ContentItem(original_filename="poison.txt", storage_path="poison.txt", **fields)
+    session.add(item)
+    session.commit()
+    return item
+
+def test_retry_delay_grows_exponentially_with_jitter():
+    with patch.object(lease_module, "RETRY_BASE_SECONDS", 10), patch.object(lease_module, "RETRY_MAX_SECONDS", 100):
+        for attempts, full in ((1, 10), (2, 20), (3, 40), (4, 80), (8, 100)):
+            delays = {retry_delay(attempts) for _ in range(20)}
+            assert all(full / 2 <= delay <= full for delay in delays)
+            assert len(delays) > 1
+
+def test_transient_failure_backs_off(session: Session):
+    leases = LeaseManager("a")
+    item = add_item(session)
+    assert leases.claim(session, item.id)
+
+    assert leases.fail(session, item.id, "Timeout: upstream", transient=True) == ContentStatus.UNPROCESSED
+    session.refresh(item)
+    assert (item.attempts, item.last_error, item.lease_owner) == (1, "Timeout: upstream", None)
+    assert item.lease_expires_at > datetime.utcnow()
+    # Nobody picks it up again before its retry time
+    assert not leases.claim(session, item.id)
+    assert LeaseManager("b").claim_batch(session, 10) == []
+
+def test_permanent_failure_and_attempt_limit_dead_letter(session: Session):
+    leases = LeaseManager("a")
+    rejected, flaky = add_item(session), add_item(session, attempts=lease_module.MAX_ATTEMPTS - 1)
+    assert leases.claim(session, rejected.id) and leases.claim(session, flaky.id)
+    assert leases.fail(session, rejected.id, "BadRequestError: too long", transient=False) == ContentStatus.FAILED
+    assert leases.fail(session, flaky.id, "Timeout", transient=True) == ContentStatus.FAILED
+
+    for item in (rejected, flaky):
+        session.refresh(item)
+        assert item.status == ContentStatus.FAILED and item.lease_expires_at is None
+        assert not LeaseManager("b").claim(session, item.id)
+
+def test_failure_is_not_recorded_after_losing_the_lease(session: Session):
+    item = add_item(session)
+    assert LeaseManager("other").claim(session, item.id)
+    assert LeaseManager("a").fail(session, item.id, "Timeout") is None
+    session.refresh(item)
+    assert item.attempts == 0 and item.status == ContentStatus.PROCESSING
+
+def test_failure_leaves_items_that_moved_on_alone(session: Session):
+    from app.models import BulkAction
+    from app.services.bulk_jobs import submit_job
+    leases = LeaseManager("a")
+    doomed, tagged = add_item(session), add_item(session)
+    assert leases.claim(session, doomed.id) and leases.claim(session, tagged.id)
+
+    # A bulk delete marks the item while it is being tagged; it must stay marked
+    submit_job(session, BulkAction.DELETE, [doomed.id])
+    # Tagged by someone else after the lease was lost and cleared
+    tagged.status, tagged.lease_owner = ContentStatus.TAGGED, None
+    session.add(tagged)
+    session.commit()
+
+    assert leases.fail(session, doomed.id, "Timeout") is None
+    assert leases.fail(session, tagged.id, "Timeout") is None
+    session.refresh(doomed)
+    session.refresh(tagged)
+    assert (doomed.status, doomed.attempts) == (ContentStatus.DELETING, 0)
+    assert (tagged.status, tagged.attempts) == (ContentStatus.TAGGED, 0)
+
+@pytest.mark.asyncio
+async def test_generate_metadata_raises_tagging_errors(tmp_path):
+    path = tmp_path / "note.txt"
+    path.write_text("hello")
+    llm = LLMService(model="test-model")
+    request = httpx.Request("POST", "http://llm")
+    failures = [
+        (APIConnectionError(message="refused", llm_provider="openai", model="test-model", request=request), True),
+        (BadRequestError(message="context too long", model="test-model", llm_provider="openai"), False),
+    ]
+    for error, transient in failures:
+        with patch("app.services.llm.acompletion", AsyncMock(side_effect=error)):
+            with pytest.raises(TaggingError) as raised:
+                await llm.generate_metadata(str(path))
+        assert raised.value.transient is transient
+
+    unparsable = MagicMock(choices=[MagicMock(message=MagicMock(content="I can't help with that"))])
+    with patch("app.services.llm.acompletion", AsyncMock(return_value=unparsable)):
+        with pytest.raises(TaggingError) as raised:
+            await llm.generate_metadata(str(path))
+    assert raised.value.transient
+
+@pytest.mark.asyncio
+async def test_worker_records_failed_attempt(session: Session):
+    from app import workers
+    item = add_item(session)
+    leases = LeaseManager("mine")
+    assert leases.claim(session, item.id)
+    session.refresh(item)
+
+    llm = AsyncMock(model="test-model")
+    llm.generate_metadata = AsyncMock(side_effect=TaggingError("BadRequestError: refused", transient=False))
+    with patch.object(workers, "leases", leases):
+        await workers.process_item(item, session, llm)
+
+    session.expire_all()
+    stored = session.get(ContentItem, item.id)
+    assert stored.status == ContentStatus.FAILED
+    assert (stored.attempts, stored.last_error) == (1, "BadRequestError: refused")
+
+def test_dead_letter_listing_and_requeue(client: TestClient, session: Session):
+    failed = add_item(session, status=ContentStatus.FAILED, attempts=5, last_error="Timeout")
+    add_item(session, status=ContentStatus.TAGGED)
+
+    response = client.get("/api/items", params={"status": "failed", "show_all_versions": True})
+    assert [row["id"] for row in response.json()] == [str(failed.id)]
+    assert response.json()[0]["last_error"] == "Timeout"
+
+    with patch("app.api.job_queue") as queue:
+        response = client.post(f"/api/items/{failed.id}/requeue")
+    assert response.status_code == 200
+    assert response.json()["status"] == "unprocessed" and response.json()["attempts"] == 0
+    queue.enqueue.assert_called_once_with(failed.id)
+
+    # Items a worker is tagging right now are left alone
+    assert LeaseManager("a").claim(session, failed.id)
+    assert client.post(f"/api/items/{failed.id}/requeue").status_code == 409
+    assert client.post(f"/api/items/{uuid.uuid4()}/requeue").status_code == 404
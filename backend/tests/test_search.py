@@ -0,0 +1,50 @@
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+from app.models import ContentItem, ContentStatus, ItemTag
+from app.services.search import index_item, build_match_query
+
+def _tagged(session: Session, filename: str, metadata: dict, **kwargs) -> ContentItem:
+    item = ContentItem(original_filename=filename, storage_path=filename, status=ContentStatus.TAGGED, **kwargs)
+    session.add(item)
+    index_item(session, item, metadata)
+    session.commit()
+    return item
+
+def test_build_match_query_quotes_terms():
+    assert build_match_query('quarterly rep') == '"quarterly" "rep"*'
+    assert build_match_query('NEAR(" OR') == '"NEAR" "OR"*'
+    assert build_match_query("  ") is None
+
+def test_search_ranks_and_matches_prefix(client: TestClient, session: Session):
+    _tagged(session, "notes.md", {"summary": "Grocery list", "tags": ["shopping"]})
+    _tagged(session, "report.md", {"summary": "Quarterly finance report", "tags": ["Finance", "reports"]})
+    _tagged(session, "memo.md", {"summary": "Memo mentioning finance once", "tags": ["memo"]})
+
+    response = client.get("/api/search", params={"q": "financ"})
+    assert response.status_code == 200
+    names = [item["original_filename"] for item in response.json()["items"]]
+    # Matching in summary and tags outranks a summary-only match
+    assert names == ["report.md", "memo.md"]
+
+def test_search_filters_and_facets_by_tag(client: TestClient, session: Session):
+    _tagged(session, "a.jpg", {"summary": "Beach", "tags": ["Holiday", "sea"]})
+    _tagged(session, "b.jpg", {"summary": "Mountain", "tags": ["holiday", "snow"]})
+    _tagged(session, "c.jpg", {"summary": "Office", "tags": ["work"]})
+
+    body = client.get("/api/search", params={"tags": "holiday"}).json()
+    assert sorted(item["original_filename"] for item in body["items"]) == ["a.jpg", "b.jpg"]
+    assert body["facets"][0] == {"tag": "holiday", "count": 2}
+    assert {"tag": "work", "count": 1} not in body["facets"]
+
+def test_reindexing_replaces_tags(session: Session):
+    item = _tagged(session, "a.txt", {"tags": ["old"]})
+    index_item(session, item, {"tags": ["new"]})
+    session.commit()
+    assert session.exec(select(ItemTag.tag)).all() == ["new"]
+
+def test_delete_removes_item_from_search(client: TestClient, session: Session):
+    item = _tagged(session, "gone.txt", {"summary": "ephemeral"})
+    assert len(client.get("/api/search", params={"q": "ephemeral"}).json()["items"]) == 1
+
+    client.delete(f"/api/items/{item.id}")
+    assert client.get("/api/search", params={"q": "ephemeral"}).json()["items"] == []
@@ -1,5 +1,6 @@
 import pytest
 import os
+import hashlib
 import shutil
 from unittest.mock import MagicMock, patch
 from app.services.storage import FileSystemStorage, get_storage
@@ -19,16 +20,76 @@ async def test_filesystem_storage(temp_storage):
     filename = "test.txt"
     
     path = await storage.save(content, filename)
-    assert os.path.exists(path)
-    assert open(path, 'rb').read() == content
-    
-    assert storage.get_path(path) == path
+    full_path = storage.get_path(path)
+    assert full_path == os.path.join(temp_storage, path)
+    assert os.path.exists(full_path)
+    assert open(full_path, 'rb').read() == content
     
     params = await storage.get_upload_params(filename)
     assert params["mode"] == "local"
     
     storage.delete(path)
-    assert not os.path.exists(path)
+    assert not os.path.exists(full_path)
+
+@pytest.mark.asyncio
+async def test_identical_content_never_shares_a_path(temp_storage):
+    # A delete unlinks its path after commit; a re-upload must not be writing to that same path
+    storage = FileSystemStorage(temp_storage)
+    first = await storage.save(b"test content", "notes.txt")
+    second = await storage.save_stream(_chunks(b"test content"), "notes.txt")
+    assert first != second.storage_path
+    assert first.endswith(".txt")
+
+    storage.delete(first)
+    assert open(storage.get_path(second.storage_path), 'rb').read() == b"test content"
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+@pytest.mark.asyncio
+async def test_filesystem_save_stream(temp_storage):
+    storage = FileSystemStorage(temp_storage)
+    stored = await storage.save_stream(_chunks(b"hello ", b"world"), "greeting.txt")
+
+    assert stored.checksum == hashlib.sha256(b"hello world").hexdigest()
+    assert stored.size == 11
+    assert stored.storage_path.endswith(".txt")
+    assert open(storage.get_path(stored.storage_path), 'rb').read() == b"hello world"
+    assert os.listdir(os.path.join(temp_storage, ".incoming")) == []
+
+@patch('boto3.client')
+@pytest.mark.asyncio
+async def test_s3_save_stream_multipart(mock_boto):
+    mock_s3 = MagicMock()
+    mock_boto.return_value = mock_s3
+    mock_s3.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+    mock_s3.upload_part.side_effect = lambda **kwargs: {"ETag": f"etag-{kwargs['PartNumber']}"}
+
+    with patch.dict(os.environ, {"S3_BUCKET_NAME": "test-bucket"}):
+        storage = S3Storage()
+        part = b"x" * storage.part_size
+        stored = await storage.save_stream(_chunks(part, part, b"tail"), "big.bin")
+
+    assert stored.size == 2 * len(part) + 4
+    assert mock_s3.upload_part.call_count == 3
+    mock_s3.put_object.assert_not_called()
+    parts = mock_s3.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+    assert [p["PartNumber"] for p in parts] == [1, 2, 3]
+
+@patch('boto3.client')
+@pytest.mark.asyncio
+async def test_s3_save_stream_small_file(mock_boto):
+    mock_s3 = MagicMock()
+    mock_boto.return_value = mock_s3
+
+    with patch.dict(os.environ, {"S3_BUCKET_NAME": "test-bucket"}):
+        storage = S3Storage()
+        stored = await storage.save_stream(_chunks(b"small"), "small.txt")
+
+    mock_s3.put_object.assert_called_once()
+    mock_s3.create_multipart_upload.assert_not_called()
+    assert stored.checksum == hashlib.sha256(b"small").hexdigest()
 
 @patch('boto3.client')
 @pytest.mark.asyncio
@@ -92,6 +153,51 @@ async def test_s3_storage_legacy_path(mock_boto, temp_storage):
         # Verify S3 delete was NOT called
         mock_s3.delete_object.assert_not_called()
 
+@pytest.fixture
+def moto_s3():
+    from moto import mock_aws
+    with mock_aws(), patch.dict(os.environ, {"S3_ACCESS_KEY": "test", "S3_SECRET_KEY": "test", "S3_BUCKET_NAME": "test-bucket"}):
+        storage = S3Storage()
+        storage.s3_client.create_bucket(Bucket="test-bucket")
+        yield storage
+
+def test_s3_client_is_pooled_with_adaptive_retries(moto_s3):
+    config = moto_s3.s3_client.meta.config
+    assert config.max_pool_connections == moto_s3.io._max_workers
+    assert config.retries["mode"] == "adaptive"
+
+@pytest.mark.asyncio
+async def test_s3_delete_many_batches_requests(moto_s3, temp_storage):
+    keys = [f"2024/01/01/{i}.txt" for i in range(1001)]
+    for key in keys:
+        moto_s3.s3_client.put_object(Bucket="test-bucket", Key=key, Body=b"x")
+    legacy_path = os.path.join(temp_storage, "legacy.txt")
+    with open(legacy_path, "wb") as f:
+        f.write(b"legacy")
+
+    requests = []
+    moto_s3.s3_client.meta.events.register("before-call.s3.DeleteObjects", lambda **kwargs: requests.append(kwargs))
+    assert await moto_s3.adelete_many(keys + [legacy_path]) == []
+
+    assert len(requests) == 2
+    assert moto_s3.s3_client.list_objects_v2(Bucket="test-bucket")["KeyCount"] == 0
+    assert not os.path.exists(legacy_path)
+
+@pytest.mark.asyncio
+async def test_s3_delete_many_reports_failed_keys(moto_s3):
+    moto_s3.s3_client.put_object(Bucket="test-bucket", Key="a.txt", Body=b"x")
+    errors = {"Errors": [{"Key": "b.txt", "Code": "AccessDenied", "Message": "denied"}]}
+    with patch.object(moto_s3.s3_client, "delete_objects", return_value=errors) as delete_objects:
+        assert moto_s3.delete_many(["a.txt", "b.txt"]) == ["b.txt"]
+    assert delete_objects.call_args.kwargs["Delete"]["Objects"] == [{"Key": "a.txt"}, {"Key": "b.txt"}]
+
+def test_s3_list_blobs(moto_s3):
+    for key in ("2024/01/01/a.txt", "2024/01/02/b.txt"):
+        moto_s3.s3_client.put_object(Bucket="test-bucket", Key=key, Body=b"x")
+    listed = dict(moto_s3.list_blobs())
+    assert sorted(listed) == ["2024/01/01/a.txt", "2024/01/02/b.txt"]
+    assert all(modified.tzinfo is None for modified in listed.values())
+
 def test_get_storage_factory():
     with patch.dict(os.environ, {"STORAGE_TYPE": "filesystem", "STORAGE_DIR": "/tmp/test"}):
         storage = get_storage()
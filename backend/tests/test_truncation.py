@@ -0,0 +1,71 @@
+from unittest.mock import patch
+import pytest
+from app.services import truncation
+from app.services.truncation import count_tokens, truncate, truncate_head, truncate_tail
+
+MODEL = "gpt-3.5-turbo"
+
+@pytest.mark.parametrize("budget", [1, 7, 100, 999])
+def test_head_cut_is_exact(budget):
+    text = "The quick brown fox jumps over the lazy dog. " * 500
+    head = truncate_head(text, budget, MODEL)
+    assert text.startswith(head)
+    assert count_tokens(head, MODEL) == budget
+
+def test_short_text_is_untouched():
+    assert truncate_head("short", 100, MODEL) == "short"
+    assert truncate("a b c", 3, MODEL, "sections") == "a b c"
+    assert truncate_head("anything", 0, MODEL) == ""
+
+def test_only_a_slice_of_huge_input_is_tokenized():
+    text = "word " * 2_000_000 # 10 MB
+    tokenizer = truncation.get_tokenizer(MODEL)
+    encoded_lengths = []
+    def encode(chunk):
+        encoded_lengths.append(len(chunk))
+        return tokenizer.encode(chunk)
+
+    with patch.object(truncation, "get_tokenizer", return_value=truncation.Tokenizer(encode, tokenizer.decode)):
+        head = truncate_head(text, 500, MODEL)
+    assert count_tokens(head, MODEL) == 500
+    assert max(encoded_lengths) <= 500 * truncation.CHARS_PER_TOKEN_BOUND
+
+def test_long_tokens_widen_the_window():
+    text = " " * 100_000 + "end"
+    head = truncate_head(text, 5, MODEL)
+    assert text.startswith(head)
+    assert count_tokens(head, MODEL) <= 5
+
+def test_multibyte_cut_stays_a_prefix():
+    text = "日本語のテキスト。" * 1000
+    head = truncate_head(text, 11, MODEL)
+    assert text.startswith(head)
+    assert "�" not in head
+    tail = truncate_tail(text, 11, MODEL)
+    assert text.endswith(tail)
+
+def test_head_tail_keeps_both_ends():
+    text = "START " + "middle " * 5000 + "FINISH"
+    result = truncate(text, 200, MODEL, "head_tail")
+    assert result.startswith("START")
+    assert result.endswith("FINISH")
+    assert "characters omitted" in result
+    assert count_tokens(result, MODEL) <= 200
+
+def test_sections_sample_the_whole_document():
+    text = "\n\n".join(f"# Chapter {i}\n" + "text " * 300 for i in range(10))
+    result = truncate(text, 300, MODEL, "sections")
+    assert "Chapter 0" in result and "Chapter 9" in result
+    assert count_tokens(result, MODEL) <= 300
+
+def test_unavailable_tokenizer_falls_back_to_cl100k():
+    truncation.get_tokenizer.cache_clear()
+    real_encode = truncation.litellm.encode
+    def encode(model, text):
+        if model == "hf/missing-model":
+            raise OSError("offline")
+        return real_encode(model=model, text=text)
+
+    with patch.object(truncation.litellm, "encode", side_effect=encode):
+        assert count_tokens("hello world", "hf/missing-model") == 2
+    truncation.get_tokenizer.cache_clear()
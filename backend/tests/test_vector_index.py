@@ -0,0 +1,165 @@
+import json
+import multiprocessing
+import uuid
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from app.models import ContentItem, ContentStatus
+from app.services.embeddings import embedding_service
+from app.services.search import index_item
+from app.services.vector_index import VectorIndex
+
+def test_search_returns_nearest_first(tmp_path):
+    index = VectorIndex(tmp_path)
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    index.add([a, b, c], [[1, 0, 0], [0.9, 0.1, 0], [0, 0, 1]], model="test")
+
+    hits = index.search([1, 0, 0], k=2)
+    assert [item_id for item_id, _ in hits] == [a, b]
+    assert hits[0][1] == pytest.approx(1.0)
+    assert [item_id for item_id, _ in index.search([1, 0, 0], k=2, exclude=a)] == [b, c]
+
+def test_index_survives_reload_updates_and_removals(tmp_path):
+    index = VectorIndex(tmp_path)
+    a, b = uuid.uuid4(), uuid.uuid4()
+    index.add([a, b], [[1, 0], [0, 1]])
+    index.add([a], [[0, 1]]) # Re-indexing overwrites the row in place
+    index.remove(b)
+
+    reloaded = VectorIndex(tmp_path)
+    assert len(reloaded) == 1
+    assert reloaded.search([0, 1], k=5) == [(a, pytest.approx(1.0))]
+
+    reloaded.compact()
+    assert (tmp_path / "vectors.f32").stat().st_size == 2 * 4
+    assert VectorIndex(tmp_path).search([0, 1], k=5)[0][0] == a
+
+def test_index_trims_partial_append(tmp_path):
+    index = VectorIndex(tmp_path)
+    a = uuid.uuid4()
+    index.add([a], [[1, 0]])
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(np.array([0, 1], dtype=np.float32).tobytes()) # Vector written, id never was
+
+    reloaded = VectorIndex(tmp_path)
+    b = uuid.uuid4()
+    reloaded.add([b], [[0, 1]])
+    assert VectorIndex(tmp_path).search([0, 1], k=1)[0][0] == b
+
+def test_trained_index_matches_brute_force(tmp_path):
+    rng = np.random.default_rng(1)
+    topics = rng.standard_normal((20, 16))
+    vectors = topics[rng.integers(20, size=2000)] + 0.1 * rng.standard_normal((2000, 16))
+    index = VectorIndex(tmp_path)
+    ids = [uuid.uuid4() for _ in range(len(vectors))]
+    index.add(ids, vectors)
+    queries = topics + 0.1 * rng.standard_normal(topics.shape)
+    expected = [index.search(query, k=5) for query in queries]
+
+    index.train()
+    assert [index.search(query, k=5, nprobe=4) for query in queries] == expected
+
+    # Rows added after training land in their nearest cluster, also after a reload
+    late = uuid.uuid4()
+    index.add([late], [queries[0]])
+    assert VectorIndex(tmp_path).search(queries[0], k=1, nprobe=1)[0][0] == late
+
+def test_dimension_mismatch_is_rejected(tmp_path):
+    index = VectorIndex(tmp_path)
+    index.add([uuid.uuid4()], [[1, 0]])
+    with pytest.raises(ValueError):
+        index.add([uuid.uuid4()], [[1, 0, 0]])
+
+def test_processes_sharing_the_files_see_each_others_writes(tmp_path):
+    # Two instances stand in for the API and a standalone worker
+    api, worker = VectorIndex(tmp_path), VectorIndex(tmp_path)
+    a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    api.add([a], [[1, 0]])
+    assert api.search([1, 0], k=5) == [(a, pytest.approx(1.0))]
+    worker.add([b, a], [[0, 1], [1, 1]]) # Appends after the api's row, replaces a's in place
+    api.add([c], [[-1, 0]])
+
+    assert (tmp_path / "ids.bin").stat().st_size == 3 * VectorIndex.ID_BYTES
+    for index in (api, worker, VectorIndex(tmp_path)):
+        assert len(index) == 3
+        assert index.get(b) == pytest.approx([0, 1])
+        assert index.get(c) == pytest.approx([-1, 0])
+        assert index.get(a) == pytest.approx([2 ** -0.5, 2 ** -0.5])
+
+    api.remove(b)
+    assert worker.get(b) is None
+    assert [item_id for item_id, _ in worker.search([0, 1], k=5)] == [a, c]
+
+    worker.compact()
+    assert api.search([-1, 0], k=1)[0][0] == c
+    api.reset()
+    assert len(worker) == 0
+
+def _add_many(directory, item_ids):
+    index = VectorIndex(directory)
+    for item_id in item_ids:
+        index.add([item_id], [[item_id.int % 1000, 1]])
+
+def test_concurrent_appends_from_processes_keep_rows_and_ids_aligned(tmp_path):
+    context = multiprocessing.get_context("fork")
+    batches = [[uuid.uuid4() for _ in range(100)] for _ in range(3)]
+    processes = [context.Process(target=_add_many, args=(tmp_path, batch)) for batch in batches]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    index = VectorIndex(tmp_path)
+    assert len(index) == 300
+    for item_id in sum(batches, []):
+        assert index.get(item_id) == pytest.approx(VectorIndex._normalize([[item_id.int % 1000, 1]])[0])
+
+def _tagged(session: Session, filename: str, metadata: dict) -> ContentItem:
+    item = ContentItem(original_filename=filename, storage_path=filename, status=ContentStatus.TAGGED, metadata_json=json.dumps(metadata))
+    session.add(item)
+    index_item(session, item, metadata)
+    session.commit()
+    return item
+
+@pytest.mark.asyncio
+async def test_index_items_embeds_batch_and_marks_indexed(session: Session, vector_index):
+    items = [_tagged(session, f"note{i}.txt", {"summary": f"note {i}", "tags": ["notes"]}) for i in range(3)]
+
+    from app import workers
+    embed = AsyncMock(return_value=[[1, 0], [0, 1], [1, 1]])
+    with patch.object(workers, "engine", session.get_bind()), patch.object(embedding_service, "embed", embed):
+        await workers.index_items([item.id for item in items])
+
+    # One call for the whole batch
+    assert embed.await_count == 1
+    assert any("note 1" in text for text in embed.await_args.args[0])
+    for item in items:
+        session.refresh(item)
+        assert item.status == ContentStatus.INDEXED
+    assert len(vector_index) == 3
+
+def test_similar_and_semantic_search(client: TestClient, session: Session, vector_index, monkeypatch):
+    beach = _tagged(session, "beach.jpg", {"summary": "Beach", "tags": ["holiday"]})
+    coast = _tagged(session, "coast.jpg", {"summary": "Coast", "tags": ["holiday"]})
+    office = _tagged(session, "office.jpg", {"summary": "Office", "tags": ["work"]})
+    vector_index.add([beach.id, coast.id, office.id], [[1, 0.1], [1, 0.3], [0, 1]])
+
+    names = [item["original_filename"] for item in client.get(f"/api/similar/{beach.id}").json()["items"]]
+    assert names == ["coast.jpg", "office.jpg"]
+    assert client.get(f"/api/similar/{uuid.uuid4()}").status_code == 404
+
+    monkeypatch.setattr(embedding_service, "enabled", True)
+    with patch.object(embedding_service, "embed_query", AsyncMock(return_value=[0, 1])):
+        body = client.get("/api/search", params={"semantic": "desk", "limit": 2}).json()
+        assert [item["original_filename"] for item in body["items"]] == ["office.jpg", "coast.jpg"]
+        assert body["items"][0]["score"] == pytest.approx(1.0)
+
+        filtered = client.get("/api/search", params={"semantic": "desk", "tags": "holiday"}).json()
+        assert [item["original_filename"] for item in filtered["items"]] == ["coast.jpg", "beach.jpg"]
+
+def test_similar_requires_indexed_item(client: TestClient, session: Session):
+    item = _tagged(session, "new.txt", {"summary": "New"})
+    assert client.get(f"/api/similar/{item.id}").status_code == 409
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+from app.models import ContentItem, ContentStatus
+from app.services.job_queue import JobQueue
+from app.services.storage import FileSystemStorage
+
+@pytest.fixture
+def queue():
+    return JobQueue()
+
+def test_job_queue_deduplicates_pending_items(queue):
+    item = ContentItem(original_filename="a.txt", storage_path="a.txt")
+    assert queue.enqueue(item.id) is True
+    assert queue.enqueue(item.id) is False
+    assert queue.qsize() == 1
+
+def test_upload_enqueues_item(client: TestClient, queue, tmp_path):
+    with patch("app.api.job_queue", queue), patch("app.api.storage", FileSystemStorage(str(tmp_path))):
+        response = client.post("/api/upload", files={"file": ("note.txt", b"hello")})
+
+    assert response.status_code == 200
+    assert queue.qsize() == 1
+
+@pytest.mark.asyncio
+async def test_worker_processes_queued_item(session: Session, queue):
+    item = ContentItem(original_filename="note.txt", storage_path="note.txt")
+    session.add(item)
+    session.commit()
+
+    from app import workers
+    mock_llm = AsyncMock()
+    mock_llm.generate_metadata = AsyncMock(return_value={"summary": "queued"})
+    mock_llm.is_batchable = MagicMock(return_value=False)
+
+    with patch.object(workers, "engine", session.get_bind()), \
+         patch.object(workers, "job_queue", queue), \
+         patch.object(workers, "llm_service", mock_llm):
+        task = asyncio.create_task(workers.process_unprocessed_items())
+        # Recovery scan picks up the row without any upload having happened
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            session.refresh(item)
+            if item.status == ContentStatus.TAGGED:
+                break
+        task.cancel()
+
+    assert item.status == ContentStatus.TAGGED
+    assert json.loads(item.metadata_json)["summary"] == "queued"
+
+@pytest.mark.asyncio
+async def test_worker_pool_tags_items_concurrently(session: Session, queue):
+    items = [ContentItem(original_filename=f"note{i}.txt", storage_path=f"note{i}.txt") for i in range(4)]
+    session.add_all(items)
+    session.commit()
+
+    from app import workers
+    in_flight = 0
+    peak = 0
+
+    async def slow_generate(path, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.05)
+        in_flight -= 1
+        return {"summary": path}
+
+    mock_llm = AsyncMock()
+    mock_llm.generate_metadata = slow_generate
+    mock_llm.is_batchable = MagicMock(return_value=False)
+
+    with patch.dict("os.environ", {"WORKER_CONCURRENCY": "4"}), \
+         patch.object(workers, "engine", session.get_bind()), \
+         patch.object(workers, "job_queue", queue), \
+         patch.object(workers, "llm_service", mock_llm):
+        task = asyncio.create_task(workers.process_unprocessed_items())
+        await asyncio.sleep(0.2)
+        task.cancel()
+
+    assert peak == 4
+
+@pytest.mark.asyncio
+async def test_worker_batches_small_text_files(session: Session, queue, tmp_path):
+    from app import workers
+    from app.services.llm import LLMService
+
+    items = []
+    for i in range(3):
+        path = tmp_path / f"snippet{i}.py"
+        path.write_text(f"print({i})")
+        items.append(ContentItem(original_filename=path.name, storage_path=str(path)))
+    image = tmp_path / "photo.jpg"
+    image.write_bytes(b"jpeg")
+    items.append(ContentItem(original_filename="photo.jpg", storage_path=str(image)))
+    session.add_all(items)
+    session.commit()
+    for item in items:
+        queue.enqueue(item.id)
+
+    llm = LLMService(model="test-model")
+    batch_answer = MagicMock(choices=[MagicMock(message=MagicMock(
+        content=json.dumps([{"file": i + 1, "summary": f"snippet {i}"} for i in range(3)])
+    ))])
+    single_answer = MagicMock(choices=[MagicMock(message=MagicMock(content='{"summary": "photo"}'))])
+
+    with patch.dict("os.environ", {"WORKER_CONCURRENCY": "1"}), \
+         patch("app.services.llm.acompletion", AsyncMock(side_effect=[batch_answer, single_answer])) as mock_acompletion, \
+         patch.object(workers, "engine", session.get_bind()), \
+         patch.object(workers, "job_queue", queue), \
+         patch.object(workers, "llm_service", llm):
+        task = asyncio.create_task(workers.worker_loop())
+        await asyncio.wait_for(queue._queue.join(), 2)
+        task.cancel()
+
+    # Three snippets in one request, the image on its own
+    assert mock_acompletion.await_count == 2
+    for i, item in enumerate(items):
+        session.refresh(item)
+        assert item.status == ContentStatus.TAGGED
+        assert json.loads(item.metadata_json)["summary"] == (f"snippet {i}" if i < 3 else "photo")
@@ -1,24 +1,61 @@
-import { useEffect, useState } from 'react';
+import { useCallback, useEffect, useRef, useState } from 'react';
 import { DropZone } from './components/DropZone';
 import { FileCard } from './components/FileCard';
 import { ThemeSwitcher } from './components/ThemeSwitcher';
 import { WelcomeModal } from './components/WelcomeModal';
-import { getItems, deleteItem, type ContentItem } from './api';
+import { getItems, deleteItem, type ContentItem, type ItemPage } from './api';
 import './index.css';
 
+// Puts a freshly loaded first page in place of the loaded one; items past it keep what was loaded
+const mergeFirstPage = (loaded: ContentItem[], page: ItemPage): ContentItem[] => {
+  if (!page.nextCursor) return page.items;
+  const ids = new Set(page.items.map(item => item.id));
+  const oldest = new Date(page.items[page.items.length - 1].created_at).getTime();
+  return [...page.items, ...loaded.filter(item => !ids.has(item.id) && new Date(item.created_at).getTime() <= oldest)];
+};
+
 function App() {
   const [items, setItems] = useState<ContentItem[]>([]);
+  // Cursor of the next page to load as the user scrolls; undefined once everything is loaded
+  const [nextCursor, setNextCursor] = useState<string | undefined>();
+  const pagesLoaded = useRef(0);
+  const loadingMore = useRef(false);
+  const sentinel = useRef<HTMLDivElement>(null);
 
-  const fetchItems = async () => {
+  // Only the first page is refetched (on load, after uploads and on update events), so an
+  // update costs one page however much of the library has been scrolled through
+  const fetchItems = useCallback(async (reset = false) => {
     try {
-      const data = await getItems();
-      // Sort by created_at desc
-      data.sort((a, b) => new Date(b.created_at).getTime() - new Date(a.created_at).getTime());
-      setItems(data);
+      const page = await getItems();
+      if (reset || pagesLoaded.current <= 1 || !page.nextCursor) {
+        pagesLoaded.current = 1;
+        setNextCursor(page.nextCursor);
+      }
+      setItems(prev => reset ? page.items : mergeFirstPage(prev, page));
     } catch (error) {
       console.error("Failed to fetch items:", error);
     }
-  };
+  }, []);
+
+  const loadMore = useCallback(async () => {
+    if (!nextCursor || loadingMore.current) return;
+    loadingMore.current = true;
+    try {
+      const page = await getItems({}, nextCursor);
+      setItems(prev => {
+        // Items pushed down by new uploads can come back on the next page; keep the fresher copy
+        const fresh = new Map(page.items.map(item => [item.id, item]));
+        const ids = new Set(prev.map(item => item.id));
+        return [...prev.map(item => fresh.get(item.id) ?? item), ...page.items.filter(item => !ids.has(item.id))];
+      });
+      setNextCursor(page.nextCursor);
+      pagesLoaded.current += 1;
+    } catch (error) {
+      console.error("Failed to fetch more items:", error);
+    } finally {
+      loadingMore.current = false;
+    }
+  }, [nextCursor]);
 
   const handleDelete = async (id: string, e: React.MouseEvent) => {
     e.stopPropagation();
@@ -44,7 +81,8 @@ function App() {
         const data = JSON.parse(event.data);
         if (data.type === 'update') {
           console.log("Received update event:", data);
-          fetchItems();
+          // A resync means events were missed: start over from the first page
+          fetchItems(Boolean(data.resync));
         }
       } catch (e) {
         console.error("Error parsing SSE data", e);
@@ -61,7 +99,18 @@ function App() {
     return () => {
       eventSource.close();
     };
-  }, []);
+  }, [fetchItems]);
+
+  // Load the next page when the end of the list scrolls into view
+  useEffect(() => {
+    const target = sentinel.current;
+    if (!target || !nextCursor) return;
+    const observer = new IntersectionObserver(entries => {
+      if (entries.some(entry => entry.isIntersecting)) loadMore();
+    }, { rootMargin: '400px' });
+    observer.observe(target);
+    return () => observer.disconnect();
+  }, [loadMore, nextCursor]);
 
   return (
     <div className="container">
@@ -69,7 +118,7 @@ function App() {
       <ThemeSwitcher />
       <h1>Zibaldone</h1>
 
-      <DropZone onUploadComplete={fetchItems} />
+      <DropZone onUploadComplete={() => fetchItems()} />
 
       <div className="item-list">
         {items.map((item) => (
@@ -80,6 +129,7 @@ function App() {
           />
         ))}
       </div>
+      <div ref={sentinel} />
     </div>
   );
 }
@@ -32,8 +32,99 @@ export interface ContentItem {
     storage_path: string;
     created_at: string;
     metadata_json: string;
+    sentiment?: string | null;
 }
 
+// Multipart upload tuning for large direct-to-S3 uploads
+const PART_CONCURRENCY = 4;
+const PART_RETRIES = 3;
+const SIGN_BATCH_SIZE = 50;
+
+interface UploadedPart {
+    PartNumber: number;
+    ETag: string;
+}
+
+interface MultipartState {
+    upload_id: string;
+    storage_path: string;
+    part_size: number;
+}
+
+// In-progress uploads are remembered so a retry of the same file resumes instead of restarting
+const multipartStateKey = (file: File) => `zibaldone-multipart:${file.name}:${file.size}:${file.lastModified}`;
+
+const uploadPartWithRetry = async (url: string, blob: Blob): Promise<string> => {
+    let lastError: unknown;
+    for (let attempt = 0; attempt < PART_RETRIES; attempt++) {
+        try {
+            const response = await axios.put(url, blob);
+            return response.headers['etag'];
+        } catch (error) {
+            lastError = error;
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt));
+        }
+    }
+    throw lastError;
+};
+
+const uploadMultipart = async (file: File): Promise<string> => {
+    const stateKey = multipartStateKey(file);
+    let state: MultipartState | null = JSON.parse(localStorage.getItem(stateKey) || 'null');
+    let done: UploadedPart[] = [];
+
+    if (state) {
+        try {
+            const partsResponse = await apiClient.get('/upload/multipart/parts', {
+                params: { storage_path: state.storage_path, upload_id: state.upload_id }
+            });
+            done = partsResponse.data.parts;
+        } catch {
+            // The upload expired or was aborted; start over
+            state = null;
+        }
+    }
+
+    if (!state) {
+        const initiateData = new FormData();
+        initiateData.append('filename', file.name);
+        if (file.type) initiateData.append('content_type', file.type);
+        const initiateResponse = await apiClient.post('/upload/multipart/initiate', initiateData);
+        state = initiateResponse.data as MultipartState;
+        localStorage.setItem(stateKey, JSON.stringify(state));
+    }
+
+    const { upload_id, storage_path, part_size } = state;
+    const partCount = Math.ceil(file.size / part_size);
+    const parts: UploadedPart[] = done.map(({ PartNumber, ETag }) => ({ PartNumber, ETag }));
+    const doneNumbers = new Set(parts.map(part => part.PartNumber));
+    const pending = Array.from({ length: partCount }, (_, i) => i + 1).filter(n => !doneNumbers.has(n));
+
+    // Sign in batches, then upload each batch with a fixed number of parts in flight
+    for (let offset = 0; offset < pending.length; offset += SIGN_BATCH_SIZE) {
+        const batch = pending.slice(offset, offset + SIGN_BATCH_SIZE);
+        const signResponse = await apiClient.post('/upload/multipart/sign', {
+            storage_path, upload_id, part_numbers: batch
+        });
+        const urls: Record<string, string> = signResponse.data.urls;
+
+        const queue = [...batch];
+        const workers = Array.from({ length: PART_CONCURRENCY }, async () => {
+            let partNumber: number | undefined;
+            while ((partNumber = queue.shift()) !== undefined) {
+                const start = (partNumber - 1) * part_size;
+                const etag = await uploadPartWithRetry(urls[partNumber], file.slice(start, start + part_size));
+                parts.push({ PartNumber: partNumber, ETag: etag });
+            }
+        });
+        await Promise.all(workers);
+    }
+
+    await apiClient.post('/upload/multipart/complete', { storage_path, upload_id, parts });
+    localStorage.removeItem(stateKey);
+    return storage_path;
+};
+
 export const uploadFile = async (file: File, metadata: Record<string, any> = {}): Promise<ContentItem> => {
     // 1. Get upload parameters from backend
     const paramsResponse = await apiClient.get('/upload/params', {
@@ -43,7 +134,10 @@ export const uploadFile = async (file: File, metadata: Record<string, any> = {})
 
     let storagePath = '';
 
-    if (params.mode === 's3') {
+    if (params.mode === 's3' && file.size > params.part_size) {
+        // 2. Large files go straight to S3/MinIO as resumable, parallel multipart uploads
+        storagePath = await uploadMultipart(file);
+    } else if (params.mode === 's3') {
         // 2. Upload directly to S3/MinIO
         await axios.put(params.upload_url, file, {
             headers: {
@@ -75,11 +169,87 @@ export const uploadFile = async (file: File, metadata: Record<string, any> = {})
     return finalizeResponse.data;
 };
 
+export interface ArchiveIngestResult {
+    created: number;
+    skipped: string[];
+}
+
+// Imports a whole folder (zip or tar) in one request instead of one upload per file
+export const ingestArchive = async (archive: File, metadata: Record<string, any> = {}): Promise<ArchiveIngestResult> => {
+    const formData = new FormData();
+    formData.append('file', archive);
+    formData.append('metadata', JSON.stringify(metadata));
+
+    const response = await apiClient.post('/ingest/archive', formData, {
+        headers: {
+            'Content-Type': 'multipart/form-data',
+        },
+    });
+    return response.data;
+};
+
+export interface BulkJob {
+    id: string;
+    action: 'delete' | 'requeue' | 'retag' | 'sweep';
+    status: 'pending' | 'running' | 'done' | 'failed';
+    total: number;
+    processed: number;
+    skipped: number;
+    result: Record<string, number> | null;
+    error: string | null;
+    created_at: string;
+    finished_at: string | null;
+}
+
+export interface BulkSelection {
+    ids?: string[];
+    filename?: string;
+    content_type?: string;
+    status?: string;
+    before?: string;
+    after?: string;
+}
+
+// Deletes, requeues or retags many items in one background job; poll it with getBulkJob
+export const createBulkJob = async (action: BulkJob['action'], selection: BulkSelection = {}): Promise<BulkJob> => {
+    const response = await apiClient.post('/jobs', { action, ...selection });
+    return response.data;
+};
+
+export const getBulkJob = async (jobId: string): Promise<BulkJob> => {
+    const response = await apiClient.get(`/jobs/${jobId}`);
+    return response.data;
+};
+
 export const deleteItem = async (itemId: string): Promise<void> => {
     await apiClient.delete(`/items/${itemId}`);
 };
 
-export const getItems = async (): Promise<ContentItem[]> => {
-    const response = await apiClient.get('/items');
-    return response.data;
+export interface ItemFilters {
+    sentiment?: string;
+    tags?: string[];
+    // Any other metadata key, matched case-insensitively
+    metadata?: Record<string, string>;
+}
+
+export interface ItemPage {
+    items: ContentItem[];
+    // Pass back to getItems for the next page; undefined on the last one
+    nextCursor?: string;
+}
+
+export const ITEMS_PAGE_SIZE = 100;
+
+// Loads one page, newest first; the backend hands out the cursor for the next one
+export const getItems = async (filters: ItemFilters = {}, cursor?: string): Promise<ItemPage> => {
+    const params = new URLSearchParams();
+    if (filters.sentiment) params.append('sentiment', filters.sentiment);
+    if (filters.tags?.length) params.append('tags', filters.tags.join(','));
+    for (const [key, value] of Object.entries(filters.metadata ?? {})) {
+        params.append('metadata', `${key}:${value}`);
+    }
+    params.set('limit', String(ITEMS_PAGE_SIZE));
+    if (cursor) params.set('cursor', cursor);
+    const response = await apiClient.get('/items', { params });
+    return { items: response.data, nextCursor: response.headers['x-next-cursor'] };
 };